@@ -7,15 +7,24 @@ import signal
 import sys
 import pandas as pd
 import hashlib
-import zipfile
-import io
-import re
+import json
+import uuid
+import shutil
 from datetime import datetime, timedelta
 import pytz
 from dotenv import load_dotenv
 from hyperliquid.info import Info
 from hyperliquid.utils import constants
 import database as db
+from info_cache import CachedInfo
+from log_control import LOG_LEVELS
+from structured_log import query_logs, format_entry
+from log_tail import LogTail
+from log_export import LogCsvExporter
+from history_export import write_history_zip
+from history_archive import parquet_available
+from fills_cache import FillsCache
+from target_poller import TargetPoller
 
 from streamlit_autorefresh import st_autorefresh
 import extra_streamlit_components as stx
@@ -26,8 +35,72 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 ENV_PATH = os.path.join(BASE_DIR, '.env')
 SCRIPT_PATH = os.path.join(BASE_DIR, 'hyperliquid_copy_trader.py')
 
-# 初始化数据库
-db.init_db()
+# 初始化数据库 (迁移按 user_version 执行，每个进程只需一次)
+@st.cache_resource
+def init_databases():
+    db.init_db()
+    return True
+
+init_databases()
+
+# --- 配置读取缓存 ---
+# 用户配置和全局设置只由看板写入: 读取结果在进程内缓存 (所有会话共用)，保存时清空，
+# 重跑页面不再打开 SQLite
+@st.cache_data(show_spinner=False)
+def load_user_config(email):
+    return db.get_user_config(email)
+
+@st.cache_data(show_spinner=False)
+def load_app_setting(key, default=None):
+    return db.get_app_setting(key, default)
+
+def save_user_config(email, *args, **kwargs):
+    db.save_user_config(email, *args, **kwargs)
+    load_user_config.clear()
+
+def save_app_setting(key, value):
+    db.set_app_setting(key, value)
+    load_app_setting.clear()
+
+# --- 导出文件 ---
+# 导出结果写到 static/exports 下，由 Streamlit 静态文件服务直接从磁盘发送 (.streamlit/config.toml
+# 中开启 server.enableStaticServing)，不经过 download_button 读入内存。静态服务单个文件上限 200MB
+EXPORT_DIR = os.path.join(BASE_DIR, 'static', 'exports')
+EXPORT_TTL = 3600
+STATIC_MAX_BYTES = 200 * 1024 * 1024
+INLINE_MAX_BYTES = 20 * 1024 * 1024  # 未开启静态服务时由 download_button 读入内存发送的上限
+
+def new_export_path(file_name):
+    """为一次导出分配文件路径 (随机子目录，链接不可猜)，同时清理过期的导出"""
+    cutoff = time.time() - EXPORT_TTL
+    if os.path.isdir(EXPORT_DIR):
+        for token in os.listdir(EXPORT_DIR):
+            folder = os.path.join(EXPORT_DIR, token)
+            try:
+                if os.path.getmtime(folder) < cutoff:
+                    shutil.rmtree(folder, ignore_errors=True)
+            except OSError:
+                pass
+    folder = os.path.join(EXPORT_DIR, uuid.uuid4().hex)
+    os.makedirs(folder)
+    return os.path.join(folder, file_name)
+
+def offer_export(path, label, mime):
+    """提供导出文件的下载: 优先静态文件链接，其次小文件用 download_button，超过上限时提示缩小范围"""
+    size = os.path.getsize(path)
+    file_name = os.path.basename(path)
+    static = st.get_option('server.enableStaticServing')
+    if static and size <= STATIC_MAX_BYTES:
+        url = 'app/static/' + os.path.relpath(path, os.path.join(BASE_DIR, 'static')).replace(os.sep, '/')
+        st.markdown(f'<a href="{url}" download="{file_name}">{label}</a>', unsafe_allow_html=True)
+        st.caption(f"文件 {size / 1024 / 1024:.1f} MB，由服务器直接从磁盘发送，{EXPORT_TTL // 60} 分钟后删除")
+    elif size <= INLINE_MAX_BYTES:
+        with open(path, 'rb') as f:
+            st.download_button(label=label, data=f, file_name=file_name, mime=mime)
+    else:
+        limit = STATIC_MAX_BYTES if static else INLINE_MAX_BYTES
+        st.warning(f"导出文件 {size / 1024 / 1024:.1f} MB 超过网页下载上限 {limit / 1024 / 1024:.0f} MB，"
+                   f"请缩小时间范围或筛选条件。文件已保存在服务器: {path}")
 
 # @st.cache_resource
 def get_cookie_manager():
@@ -42,7 +115,9 @@ def get_user_files(email):
     email_hash = hashlib.md5(email.encode()).hexdigest()
     return {
         'pid': os.path.join(BASE_DIR, f'bot_{email_hash}.pid'),
-        'log': os.path.join(BASE_DIR, f'bot_{email_hash}.log')
+        'log': os.path.join(BASE_DIR, f'bot_{email_hash}.log'),
+        # 结构化日志 (JSON 行，轮转压缩并带索引)
+        'json_log': os.path.join(BASE_DIR, f'bot_{email_hash}.jsonl')
     }
 
 def get_bot_pid(pid_file):
@@ -89,7 +164,7 @@ def sidebar_logic():
         st.sidebar.header('⚙️ 参数配置')
         
         # 加载用户配置
-        user_config = db.get_user_config(email) or {}
+        user_config = load_user_config(email) or {}
         
         with st.sidebar.form('config_form'):
             market_type_options = {'perps': '合约 (Perpetuals)', 'spot': '现货 (Spot)'}
@@ -144,9 +219,18 @@ def sidebar_logic():
             if submitted:
                 # 将列表转换为逗号分隔的字符串
                 market_type_str = ",".join(market_types)
-                db.save_user_config(email, private_key, target_address, copy_ratio, slippage, sync_mode, auto_refresh_interval, market_type=market_type_str, my_address=my_address, sync_perp_orders=sync_perp_orders, sync_spot_orders=sync_spot_orders)
+                save_user_config(email, private_key, target_address, copy_ratio, slippage, sync_mode, auto_refresh_interval, market_type=market_type_str, my_address=my_address, sync_perp_orders=sync_perp_orders, sync_spot_orders=sync_spot_orders)
                 st.sidebar.success('✅配置已保存')
 
+                # 运行中的机器人: 通知其立即重新读取配置 (无需重启)
+                running_pid = get_bot_pid(get_user_files(email)['pid'])
+                if running_pid and hasattr(signal, 'SIGHUP'):
+                    try:
+                        os.kill(running_pid, signal.SIGHUP)
+                        st.sidebar.info('运行中的机器人将在下一轮应用新配置 (目标地址/私钥需重启生效)')
+                    except Exception as e:
+                        st.sidebar.warning(f'通知机器人失败，将在下次自动检查时生效: {e}')
+
         st.sidebar.divider()
         st.sidebar.subheader('状态控制')
         
@@ -170,7 +254,7 @@ def sidebar_logic():
         else:
             st.sidebar.warning('⚪ 已停止')
             if st.sidebar.button('🟢 启动机器人'):
-                cfg = db.get_user_config(email)
+                cfg = load_user_config(email)
                 if not cfg:
                     st.sidebar.error("请先保存配置")
                 else:
@@ -186,6 +270,9 @@ def sidebar_logic():
                     env['MY_ADDRESS'] = str(cfg.get('my_address', ''))
                     env['SYNC_PERP_ORDERS'] = '1' if cfg.get('sync_perp_orders', True) else '0'
                     env['SYNC_SPOT_ORDERS'] = '1' if cfg.get('sync_spot_orders', False) else '0'
+                    # 用于运行中热加载配置
+                    env['USER_EMAIL'] = email
+                    env['LOG_JSON_FILE'] = user_files['json_log']
                     
                     with open(LOG_FILE, 'a') as log_f:
                         proc = subprocess.Popen(
@@ -265,14 +352,14 @@ def main_content():
     default_refresh = 10
     
     # 尝试获取系统默认配置 (DEFAULT_USER_EMAIL)
-    system_config = db.get_user_config(DEFAULT_USER_EMAIL)
+    system_config = load_user_config(DEFAULT_USER_EMAIL)
     if system_config:
         default_target = system_config.get('target_address', default_target)
         default_refresh = system_config.get('auto_refresh_interval', 10)
         
     # 如果已登录，优先显示登录用户的配置
     if 'user_email' in st.session_state:
-        user_config = db.get_user_config(st.session_state['user_email'])
+        user_config = load_user_config(st.session_state['user_email'])
         if user_config:
             default_target = user_config.get('target_address', default_target)
             default_refresh = user_config.get('auto_refresh_interval', default_refresh)
@@ -283,6 +370,7 @@ def main_content():
         current_target = st.text_input("监控目标地址", value=default_target, help="此处修改仅用于临时查看数据，不会修改后台跟单配置")
     with col_t2:
         if st.button("🔄 立即刷新"):
+            get_target_poller().request_refresh(current_target)
             st.rerun()
             
     # 自动刷新
@@ -290,35 +378,34 @@ def main_content():
     
     if current_target:
         try:
-            info = get_hl_info()
-            # 获取用户状态 (包含持仓)
-            user_state = info.user_state(current_target)
-            
-            # 显式获取挂单
-            try:
-                raw_open_orders = info.open_orders(current_target)
-            except Exception as e_orders:
-                raw_open_orders = []
-                # st.warning(f"获取挂单失败: {e_orders}") # 保持界面整洁，忽略非关键错误
+            # 所有会话共用后台轮询的最新快照 (每个地址每个间隔只请求一次，已解析为 AccountState)
+            snapshot = get_target_poller().get(current_target, interval=default_refresh)
+            if snapshot.account is None:
+                raise snapshot.error or TimeoutError("首次获取超时")
+            if snapshot.error:
+                st.warning(f"最近一次刷新失败，显示的是 {datetime.fromtimestamp(snapshot.fetched_at):%H:%M:%S} 之前的数据: {snapshot.error}")
+            user_state, raw_open_orders, account = snapshot.user_state, snapshot.open_orders, snapshot.account
 
             # 调试: 显示原始数据结构以便排查
             with st.expander("🔍 查看原始 API 响应 (调试用)"):
                 st.write("User State:", user_state)
                 st.write("Open Orders:", raw_open_orders)
-            
-            tab_orders, tab_trades, tab_positions = st.tabs(["实时挂单", "近期成交", "持仓状态"])
+
+            tab_orders, tab_trades, tab_positions, tab_copy, tab_pnl, tab_rollup = st.tabs(
+                ["实时挂单", "近期成交", "持仓状态", "跟单表现", "跟单盈亏", "历史汇总"])
             
             with tab_orders:
-                if raw_open_orders:
-                    df_orders = pd.DataFrame(raw_open_orders)
-                    # 提取关键字段
+                if account.orders:
+                    df_orders = pd.DataFrame([{
+                        'time': o.timestamp,
+                        'coin': o.coin,
+                        'side': o.side,
+                        'limitPx': o.limit_px,
+                        'sz': o.sz,
+                    } for o in account.orders])
                     if not df_orders.empty:
-                        df_orders = df_orders[['coin', 'side', 'limitPx', 'sz', 'timestamp']]
-                        df_orders['limitPx'] = df_orders['limitPx'].astype(float)
-                        df_orders['sz'] = df_orders['sz'].astype(float)
-                        df_orders['time'] = pd.to_datetime(df_orders['timestamp'], unit='ms')
-                        
-                        display_orders = df_orders[['time', 'coin', 'side', 'limitPx', 'sz']].sort_values('time', ascending=False).reset_index(drop=True)
+                        df_orders['time'] = pd.to_datetime(df_orders['time'], unit='ms')
+                        display_orders = df_orders.sort_values('time', ascending=False).reset_index(drop=True)
                         display_orders.index = display_orders.index + 1
                         display_orders['time'] = format_time_with_label(display_orders['time'])
                         st.dataframe(
@@ -330,19 +417,16 @@ def main_content():
                     st.info("当前无挂单")
                     
             with tab_positions:
-                positions = user_state.get('assetPositions', [])
                 pos_data = []
-                for p in positions:
-                    core = p.get('position', {})
-                    szi = float(core.get('szi', 0))
-                    if szi != 0:
+                for p in account.positions.values():
+                    if p.szi != 0:
                         pos_data.append({
-                            "币种": core.get('coin'),
-                            "持仓量": szi,
-                            "入场价": float(core.get('entryPx', 0)),
-                            "未实现盈亏": float(core.get('unrealizedPnl', 0)),
-                            "杠杆": core.get('leverage', {}).get('value', 0),
-                            "类型": "多" if szi > 0 else "空"
+                            "币种": p.coin,
+                            "持仓量": p.szi,
+                            "入场价": p.entry_px,
+                            "未实现盈亏": p.unrealized_pnl,
+                            "杠杆": p.leverage or 0,
+                            "类型": "多" if p.szi > 0 else "空"
                         })
                 
                 if pos_data:
@@ -354,17 +438,23 @@ def main_content():
                     
             with tab_trades:
                 try:
-                    # 注意: user_fills 对于非本人地址可能返回空或报错，视 API 权限而定
-                    fills = info.user_fills(current_target)
-                    if fills:
-                        df_fills = pd.DataFrame(fills)
-                        df_fills['price'] = df_fills['px'].astype(float)
-                        df_fills['size'] = df_fills['sz'].astype(float)
-                        df_fills['time'] = pd.to_datetime(df_fills['time'], unit='ms')
-                        
-                        display_fills = df_fills[['time', 'coin', 'side', 'price', 'size', 'fee', 'closedPnl']].head(50)
-                        display_fills.index = display_fills.index + 1
-                        display_fills['time'] = format_time_with_label(display_fills['time'])
+                    # 本地成交缓存: 每次刷新只拉取新成交，页面数据从 history.db 分页读取
+                    fills_cache = get_fills_cache(current_target)
+                    fills_cache.refresh(max_age=default_refresh)
+
+                    # 切换目标时回到第一页；cursors 保存已翻过各页的起始游标
+                    if st.session_state.get('fills_page_target') != current_target:
+                        st.session_state['fills_page_target'] = current_target
+                        st.session_state['fills_page_cursors'] = [None]
+                    fill_cursors = st.session_state['fills_page_cursors']
+                    rows, next_fill_cursor = db.query_trades(target_address=current_target, after=fill_cursors[-1],
+                                                             limit=50)
+                    if rows:
+                        df_fills = pd.DataFrame(rows)
+                        df_fills['time'] = format_time_with_label(pd.to_datetime(df_fills['timestamp'], unit='ms'))
+                        display_fills = df_fills[['time', 'coin', 'side', 'px', 'sz', 'fee', 'closed_pnl']].rename(
+                            columns={'px': 'price', 'sz': 'size', 'closed_pnl': 'closedPnl'})
+                        display_fills.index = display_fills.index + 1 + (len(fill_cursors) - 1) * 50
                         st.dataframe(
                             display_fills, 
                             width='stretch', 
@@ -372,34 +462,199 @@ def main_content():
                         )
                     else:
                         st.info("暂无可见成交记录")
+
+                    col_f1, col_f2, col_f3 = st.columns([1, 1, 4])
+                    with col_f1:
+                        if st.button("⬅️ 较新", disabled=len(fill_cursors) == 1, key="fills_prev"):
+                            fill_cursors.pop()
+                            st.rerun()
+                    with col_f2:
+                        if next_fill_cursor is not None:
+                            if st.button("较早 ➡️", key="fills_next"):
+                                fill_cursors.append(next_fill_cursor)
+                                st.rerun()
+                        elif not fills_cache.exhausted:
+                            # 本地数据已到底，从 API 回补更早的成交
+                            if st.button("加载更早成交", key="fills_load_older"):
+                                fills_cache.load_older()
+                                st.rerun()
+                    with col_f3:
+                        st.caption(f"第 {len(fill_cursors)} 页")
                 except Exception as e:
                     st.warning(f"无法获取成交历史 (可能仅限私有读取): {e}")
 
+            with tab_copy:
+                # 跟单延迟/误差统计 (由运行中的跟单程序写入 history.db)
+                df_stats = db.get_copy_stats(current_target)
+                if not df_stats.empty:
+                    df_stats = df_stats.rename(columns={
+                        'coin': '币种', 'matched': '已跟上', 'unmatched': '未跟上',
+                        'lag_p50': '延迟P50(ms)', 'lag_p95': '延迟P95(ms)', 'lag_p99': '延迟P99(ms)',
+                        'price_diff_bps': '平均价差(bps)', 'size_error': '平均数量误差', 'update_time': '更新时间'
+                    }).drop(columns=['target_address'])
+                    df_stats['币种'] = df_stats['币种'].replace('*', '全部')
+                    st.dataframe(df_stats, width='stretch')
+
+                    df_matches = db.get_recent_copy_matches(current_target, limit=50)
+                    if not df_matches.empty:
+                        df_matches['time'] = format_time_with_label(pd.to_datetime(df_matches['target_time'], unit='ms'))
+                        display_matches = df_matches[['time', 'coin', 'side', 'target_px', 'target_sz', 'follower_sz',
+                                                      'lag_ms', 'price_diff_bps', 'size_error']]
+                        display_matches.index = display_matches.index + 1
+                        st.dataframe(display_matches, width='stretch', height=600)
+                else:
+                    st.info("暂无跟单统计 (跟单程序运行并产生成交后才会记录)")
+
+            with tab_pnl:
+                # 跟单程序增量维护的盈亏账本与差额归因 (只读取结果表)
+                df_books = db.get_pnl_books(current_target)
+                df_attr = db.get_pnl_attribution(current_target)
+                if not df_books.empty:
+                    totals = df_books.groupby('account')['total_pnl'].sum()
+                    col_m1, col_m2, col_m3, col_m4 = st.columns(4)
+                    col_m1.metric("目标盈亏", f"{totals.get('target', 0.0):,.2f}")
+                    col_m2.metric("理想跟单盈亏", f"{totals.get('ideal', 0.0):,.2f}", help="目标成交按跟单比例缩放后的盈亏")
+                    col_m3.metric("我的盈亏", f"{totals.get('follower', 0.0):,.2f}")
+                    col_m4.metric("跟单差额", f"{totals.get('follower', 0.0) - totals.get('ideal', 0.0):,.2f}")
+
+                    if not df_attr.empty:
+                        attr_names = {'gap': '差额', 'lag': '延迟', 'slippage': '滑点', 'rounding': '数量取整',
+                                      'skipped': '未跟上', 'fees': '手续费', 'funding': '资金费', 'other': '其他'}
+                        st.markdown("**差额归因 (我的实际 - 理想跟单)**")
+                        st.bar_chart(df_attr[['lag', 'slippage', 'rounding', 'skipped', 'fees', 'funding', 'other']]
+                                     .sum().rename(attr_names))
+                        display_attr = df_attr.rename(columns=dict(attr_names, coin='币种', update_time='更新时间'))
+                        st.dataframe(display_attr, width='stretch', hide_index=True)
+
+                    st.markdown("**账本明细**")
+                    display_books = df_books.rename(columns={
+                        'account': '账户', 'coin': '币种', 'position': '持仓', 'entry_px': '成本价',
+                        'realized_pnl': '已实现', 'unrealized_pnl': '浮动', 'fees': '手续费', 'funding': '资金费',
+                        'mark_px': '标记价', 'total_pnl': '净盈亏', 'update_time': '更新时间'
+                    })[['账户', '币种', '持仓', '成本价', '标记价', '已实现', '浮动', '手续费', '资金费', '净盈亏', '更新时间']]
+                    display_books['账户'] = display_books['账户'].replace(
+                        {'target': '目标', 'ideal': '理想跟单', 'follower': '我的'})
+                    st.dataframe(display_books, width='stretch', hide_index=True)
+                else:
+                    st.info("暂无盈亏数据 (跟单程序运行后才会记录)")
+
+            with tab_rollup:
+                # 读取跟单程序增量维护的时间桶汇总，不扫描原始成交/持仓记录
+                col_r1, col_r2 = st.columns([1, 2])
+                with col_r1:
+                    r_resolution = st.selectbox("粒度", ["1m", "1h", "1d"], index=1, key="rollup_resolution")
+                with col_r2:
+                    r_coin = st.text_input("币种 (可选)", placeholder="ETH", key="rollup_coin").strip().upper()
+                # 各粒度默认展示的时间跨度
+                r_span = {"1m": timedelta(hours=6), "1h": timedelta(days=7), "1d": timedelta(days=180)}[r_resolution]
+                df_rollup = db.get_history_rollups(current_target, r_resolution, coin=r_coin or None,
+                                                   start_ms=int((datetime.now() - r_span).timestamp() * 1000))
+                if not df_rollup.empty:
+                    df_rollup['time'] = pd.to_datetime(df_rollup['bucket'], unit='ms')
+                    trade_cols = ['notional', 'realized_pnl', 'fees', 'fills']
+                    df_trade = df_rollup.pivot_table(index='time', columns='coin', values=trade_cols, aggfunc='sum')
+                    st.markdown("**成交额**")
+                    st.bar_chart(df_trade['notional'])
+                    st.markdown("**已实现盈亏**")
+                    st.bar_chart(df_trade['realized_pnl'])
+                    df_position = df_rollup.pivot_table(index='time', columns='coin', values='position_sz', aggfunc='last')
+                    if not df_position.empty:
+                        st.markdown("**持仓量 (每个时间桶最后一次快照)**")
+                        st.line_chart(df_position.ffill())
+
+                    display_rollup = df_rollup.sort_values('bucket', ascending=False)[[
+                        'time', 'coin', 'fills', 'buy_sz', 'sell_sz', 'net_sz', 'notional', 'vwap', 'fees',
+                        'realized_pnl', 'position_sz', 'entry_px']].reset_index(drop=True)
+                    display_rollup['time'] = format_time_with_label(display_rollup['time'])
+                    st.dataframe(display_rollup, width='stretch', height=400)
+                else:
+                    st.info("暂无汇总数据 (跟单程序运行并记录成交/持仓后才会生成)")
+
         except Exception as e:
             st.error(f"获取链上数据失败: {e}")
 
+    # --- 历史数据浏览 (keyset 分页，每页只读取一页数据) ---
+    st.divider()
+    with st.expander("🗂️ 历史数据浏览 (点击展开)"):
+        col_b1, col_b2, col_b3, col_b4 = st.columns([1, 2, 1, 1])
+        with col_b1:
+            b_table = st.selectbox("数据", ["成交", "挂单", "持仓快照"], key="history_browse_table")
+        with col_b2:
+            b_target = st.selectbox("目标地址", ["全部"] + db.get_history_targets(), key="history_browse_target")
+        with col_b3:
+            b_coin = st.text_input("币种 (可选)", placeholder="ETH", key="history_browse_coin").strip().upper()
+        with col_b4:
+            b_limit = st.selectbox("每页条数", [50, 100, 500], key="history_browse_limit")
+
+        query_fn = {"成交": db.query_trades, "挂单": db.query_orders, "持仓快照": db.query_positions}[b_table]
+        # 过滤条件变化时回到第一页；cursors 保存已翻过各页的起始游标，用于上一页
+        browse_key = (b_table, b_target, b_coin, b_limit)
+        if st.session_state.get('history_browse_key') != browse_key:
+            st.session_state['history_browse_key'] = browse_key
+            st.session_state['history_browse_cursors'] = [None]
+        cursors = st.session_state['history_browse_cursors']
+
+        rows, next_cursor = query_fn(target_address=None if b_target == "全部" else b_target,
+                                     coin=b_coin or None, after=cursors[-1], limit=b_limit)
+        if rows:
+            df_history = pd.DataFrame(rows)
+            df_history['time'] = format_time_with_label(pd.to_datetime(df_history['timestamp'], unit='ms'))
+            st.dataframe(df_history.drop(columns=['timestamp']), width='stretch', hide_index=True)
+        else:
+            st.info("暂无符合条件的历史数据")
+
+        col_p1, col_p2, col_p3 = st.columns([1, 1, 4])
+        with col_p1:
+            if st.button("⬅️ 上一页", disabled=len(cursors) == 1, key="history_browse_prev"):
+                cursors.pop()
+                st.rerun()
+        with col_p2:
+            if st.button("下一页 ➡️", disabled=next_cursor is None, key="history_browse_next"):
+                cursors.append(next_cursor)
+                st.rerun()
+        with col_p3:
+            st.caption(f"第 {len(cursors)} 页")
+
     # --- 历史数据下载 (公开) ---
     st.divider()
     with st.expander("📥 历史数据下载 (点击展开)"):
         st.info("说明: 只有在跟单程序运行时才会持续记录历史数据。")
         
-        if st.button("生成历史数据 CSV"):
-            csvs = db.get_history_csv()
-            if csvs:
-                # 创建 ZIP 文件
-                buffer = io.BytesIO()
-                with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zf:
-                    for name, data in csvs.items():
-                        zf.writestr(f"history_{name}.csv", data)
-                
-                st.download_button(
-                    label="📦 下载全部历史数据 (ZIP)",
-                    data=buffer.getvalue(),
-                    file_name="all_history.zip",
-                    mime="application/zip"
-                )
+        with st.form("history_export_form"):
+            col_h1, col_h2, col_h3, col_h4 = st.columns([2, 2, 1, 1])
+            with col_h1:
+                h_range = st.date_input("日期范围 (可选)", value=())
+            with col_h2:
+                h_target = st.selectbox("目标地址", ["全部"] + db.get_history_targets())
+            with col_h3:
+                h_coin = st.text_input("币种 (可选)", placeholder="ETH").strip().upper()
+            with col_h4:
+                h_format = st.selectbox("格式", ["csv", "parquet"] if parquet_available() else ["csv"])
+            history_clicked = st.form_submit_button("生成历史数据")
+
+        if history_clicked:
+            start_ms = end_ms = None
+            if isinstance(h_range, (list, tuple)) and h_range:
+                start_day, end_day = h_range[0], h_range[-1]
+                start_ms = int(datetime.combine(start_day, datetime.min.time()).timestamp() * 1000)
+                end_ms = int(datetime.combine(end_day, datetime.max.time()).timestamp() * 1000)
+            # 按块读表、直接压缩写入导出目录 (不在内存中构造整张表)，再从磁盘提供下载
+            zip_path = new_export_path(f"history_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip")
+            try:
+                with open(zip_path, 'wb') as f:
+                    counts = write_history_zip(f, fmt=h_format, start_ms=start_ms, end_ms=end_ms,
+                                               target_address=None if h_target == "全部" else h_target,
+                                               coin=h_coin or None)
+            except Exception as e:
+                counts = None
+                st.warning(f"导出历史数据失败: {e}")
+            if counts is not None and any(counts.values()):
+                offer_export(zip_path, "📦 下载历史数据 (ZIP: " + ", ".join(f"{k} {v} 行" for k, v in counts.items()) + ")",
+                             "application/zip")
             else:
-                st.warning("暂无历史数据或读取失败")
+                shutil.rmtree(os.path.dirname(zip_path), ignore_errors=True)
+                if counts is not None:
+                    st.warning("没有符合条件的历史数据")
 
     # --- 实时日志 (仅显示默认用户的日志) ---
     # 虽然未登录，但既然是单用户系统，展示运行日志也是一种数据监控
@@ -413,13 +668,43 @@ def main_content():
             col_l1, col_l2, col_l3 = st.columns([2, 2, 2])
             with col_l1:
                 log_lines_count = st.selectbox("显示行数", [20, 50, 100, 200, 500, 1000, 5000], index=0)
+                # 启用结构化日志后，运行日志写入 .jsonl，标准输出只剩警告和崩溃信息
+                log_source = LOG_FILE
+                if os.path.exists(log_files['json_log']):
+                    source_label = st.radio("日志来源", ["运行日志", "控制台输出"], horizontal=True)
+                    if source_label == "运行日志":
+                        log_source = log_files['json_log']
+
+            # 日志详细程度: 运行中的机器人收到 SIGHUP 后立即生效
+            col_v1, col_v2, col_v3 = st.columns([2, 2, 2])
+            saved = (load_app_setting('log_level', 'INFO'), int(load_app_setting('log_sample_every', 10)),
+                     int(load_app_setting('log_rate_limit', 20)))
+            with col_v1:
+                new_level = st.selectbox("日志级别", LOG_LEVELS, index=LOG_LEVELS.index(saved[0]) if saved[0] in LOG_LEVELS else 1,
+                                         help="DEBUG 会输出逐个挂单的检查明细 (按采样/限流输出)")
+            with col_v2:
+                new_sample = st.number_input("明细采样 (每 N 条输出 1 条)", min_value=1, value=saved[1])
+            with col_v3:
+                new_rate = st.number_input("明细限流 (每分钟最多条数，0 不限)", min_value=0, value=saved[2])
+            if (new_level, new_sample, new_rate) != saved:
+                save_app_setting('log_level', new_level)
+                save_app_setting('log_sample_every', new_sample)
+                save_app_setting('log_rate_limit', new_rate)
+                running_pid = get_bot_pid(log_files['pid'])
+                if running_pid and hasattr(signal, 'SIGHUP'):
+                    try:
+                        os.kill(running_pid, signal.SIGHUP)
+                    except Exception:
+                        pass
+                st.success("日志设置已保存，运行中的机器人将在下一轮生效")
             
-            with open(LOG_FILE, 'r') as f:
-                lines = f.readlines()
-                total_lines = len(lines)
-                display_lines = lines[-log_lines_count:]
-                st.code(''.join(display_lines), language='text')
-                st.caption(f"共 {total_lines} 行日志，当前显示最后 {len(display_lines)} 行")
+            # 从文件末尾读取，行数增量统计 (只与显示行数有关，不随日志大小变慢)
+            log_tail = get_log_tail(log_source)
+            display_lines = log_tail.tail(log_lines_count)
+            if log_source.endswith('.jsonl'):
+                display_lines = [format_json_log_line(line) for line in display_lines]
+            st.code('\n'.join(display_lines), language='text')
+            st.caption(f"共 {log_tail.line_count()} 行日志，当前显示最后 {len(display_lines)} 行")
 
             with col_l2:
                 c1, c2 = st.columns([1, 1])
@@ -439,54 +724,99 @@ def main_content():
             
             # --- 下载功能 ---
             with col_l3:
-                # 1. 下载原始日志
-                with open(LOG_FILE, 'rb') as f:
-                    st.download_button(
-                        label="📥 下载原始日志 (.log)",
-                        data=f,
-                        file_name=f"bot_log_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log",
-                        mime="text/plain"
-                    )
+                # 1. 下载原始日志 (点击后才读取文件，避免每次刷新都读入整个日志)
+                if st.button(f"📥 准备下载原始日志 ({log_tail.size() / 1024 / 1024:.1f} MB)"):
+                    st.session_state['log_download_ready'] = log_source
+                if st.session_state.get('log_download_ready') == log_source:
+                    ext = os.path.splitext(log_source)[1]
+                    with open(log_source, 'rb') as f:
+                        st.download_button(
+                            label=f"💾 下载原始日志 ({ext})",
+                            data=f,
+                            file_name=f"bot_log_{datetime.now().strftime('%Y%m%d_%H%M%S')}{ext}",
+                            mime="text/plain",
+                            on_click=lambda: st.session_state.pop('log_download_ready', None)
+                        )
             
-            # 2. 导出 CSV
-            def parse_log_to_csv(log_path):
-                data = []
-                pattern = re.compile(r'^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2},\d{3}) - (\w+) - (.*)$')
-                try:
-                    with open(log_path, 'r', encoding='utf-8', errors='ignore') as f:
-                        for line in f:
-                            match = pattern.match(line.strip())
-                            if match:
-                                data.append({
-                                    'Time': match.group(1),
-                                    'Level': match.group(2),
-                                    'Message': match.group(3)
-                                })
-                            elif data: # Append non-matching lines (like tracebacks) to previous message
-                                data[-1]['Message'] += " | " + line.strip()
-                except Exception as e:
-                    return None
-                
-                if not data:
-                    return None
-                
-                df = pd.DataFrame(data)
-                return df.to_csv(index=False).encode('utf-8-sig')
-
-            csv_data = parse_log_to_csv(LOG_FILE)
-            if csv_data:
-                st.download_button(
-                    label="📊 导出日志 CSV",
-                    data=csv_data,
-                    file_name=f"bot_log_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
-                    mime="text/csv"
-                )
+            # 2. 导出 CSV (点击后才解析；只增量解析新追加的日志)
+            with st.form("log_csv_form"):
+                col_e1, col_e2, col_e3 = st.columns([2, 2, 1])
+                with col_e1:
+                    csv_start = st.text_input("开始时间 (可选)", placeholder="2025-01-01 00:00:00")
+                with col_e2:
+                    csv_end = st.text_input("结束时间 (可选)", placeholder="2025-01-31 23:59:59")
+                with col_e3:
+                    export_clicked = st.form_submit_button("📊 生成 CSV")
+            if export_clicked:
+                exporter = get_log_exporter(log_source)
+                # 按块写入导出目录 (只在内存中保留一块)，再从磁盘提供下载
+                csv_path = new_export_path(f"bot_log_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv")
+                with open(csv_path, 'wb') as f:
+                    for chunk in exporter.iter_csv(csv_start.strip() or None, csv_end.strip() or None):
+                        f.write(chunk)
+                offer_export(csv_path, f"💾 下载日志 CSV (共 {len(exporter)} 条)", "text/csv")
         else:
             st.info('暂无日志')
 
+        # --- 结构化日志检索 (只读取索引命中的日志块) ---
+        JSON_LOG_FILE = log_files['json_log']
+        if os.path.exists(JSON_LOG_FILE + '.idx'):
+            st.markdown("**🔎 按时间 / 级别 / 币种检索**")
+            col_q1, col_q2, col_q3, col_q4 = st.columns([2, 2, 2, 1])
+            with col_q1:
+                q_range = st.date_input("日期范围", value=(datetime.now().date() - timedelta(days=1), datetime.now().date()),
+                                        key="log_query_range")
+            with col_q2:
+                q_levels = st.multiselect("级别", LOG_LEVELS, default=['WARNING', 'ERROR'], key="log_query_levels")
+            with col_q3:
+                q_coin = st.text_input("币种 (如 ETH, PURR/USDC)", key="log_query_coin").strip().upper()
+            with col_q4:
+                q_limit = st.number_input("最多条数", min_value=10, max_value=20000, value=500, key="log_query_limit")
+
+            if st.button("检索日志", key="log_query_btn"):
+                start_day, end_day = (q_range if isinstance(q_range, (list, tuple)) and len(q_range) == 2
+                                      else (q_range, q_range))
+                start_ms = int(datetime.combine(start_day, datetime.min.time()).timestamp() * 1000)
+                end_ms = int(datetime.combine(end_day, datetime.max.time()).timestamp() * 1000)
+                entries = list(query_logs(JSON_LOG_FILE, start_ms, end_ms, levels=q_levels or None,
+                                          coin=q_coin or None, limit=int(q_limit)))
+                if entries:
+                    st.code('\n'.join(format_entry(e) for e in entries), language='text')
+                    st.caption(f"共找到 {len(entries)} 条 (最多显示 {int(q_limit)} 条)")
+                else:
+                    st.info("没有符合条件的日志")
+
+@st.cache_resource
+def get_log_tail(path):
+    """每个日志文件一个共享的尾部读取器 (行数按偏移增量统计)"""
+    return LogTail(path)
+
+@st.cache_resource
+def get_log_exporter(path):
+    """每个日志文件一个共享的 CSV 导出器 (稀疏偏移索引跨会话缓存)"""
+    return LogCsvExporter(path)
+
+def format_json_log_line(line):
+    try:
+        return format_entry(json.loads(line))
+    except ValueError:
+        return line
+
+@st.cache_resource
+def get_target_poller():
+    # 后台轮询线程: 所有会话查看的地址统一按间隔刷新，5 分钟无人查看的地址停止轮询
+    return TargetPoller(get_hl_info(), idle_timeout=300)
+
+@st.cache_resource(max_entries=32)
+def get_fills_cache(address):
+    # 每个地址一个成交缓存，在所有会话之间共享；不回补已被跟单程序归档的时间段 (每次回补时重新读取归档目录)
+    archive_dir = os.path.join(BASE_DIR, os.getenv("HISTORY_ARCHIVE_DIR", "history_archive"))
+    return FillsCache(get_hl_info(), address, archive_dir=archive_dir)
+
 @st.cache_resource
 def get_hl_info():
-    return Info(constants.MAINNET_API_URL, skip_ws=True)
+    # 所有会话共享的缓存代理: 同一秒内的相同请求只发一次，并复用机器人刚取到的数据
+    return CachedInfo(Info(constants.MAINNET_API_URL, skip_ws=True), shared=True)
 
 def format_time_with_label(dt_series):
     """将时间转换为北京时间字符串，保留ISO格式以支持排序，并附加友好标签"""
@@ -0,0 +1,214 @@
+import json
+import asyncio
+import inspect
+import logging
+
+import aiohttp
+
+from hyperliquid.utils import constants
+from hyperliquid.utils.error import ClientError, ServerError
+from hyperliquid.utils.signing import (
+    get_timestamp_ms,
+    order_request_to_order_wire,
+    order_wires_to_order_action,
+    sign_l1_action,
+)
+
+from resilience import CircuitBreaker, CircuitOpenError
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncHTTPEngine:
+    """基于 asyncio 的 HTTP 引擎
+
+    单个 aiohttp 会话复用 keep-alive 连接池，按主机限制并发连接数，每个请求带超时。
+    错误沿用 SDK 的 ClientError (4xx) / ServerError (5xx)，调用方的异常处理无需区分同步/异步。
+    """
+
+    def __init__(self, base_url=constants.MAINNET_API_URL, max_per_host=8, timeout=10.0, keepalive_timeout=30.0):
+        self.base_url = base_url.rstrip('/')
+        self.max_per_host = max_per_host
+        self.timeout = timeout
+        self.keepalive_timeout = keepalive_timeout
+        self._session = None
+
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit_per_host=self.max_per_host,
+                keepalive_timeout=self.keepalive_timeout,
+                ttl_dns_cache=300,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                json_serialize=json.dumps,
+            )
+        return self._session
+
+    async def post(self, path, payload, timeout=None):
+        session = self._get_session()
+        kwargs = {'json': payload}
+        if timeout is not None:
+            kwargs['timeout'] = aiohttp.ClientTimeout(total=timeout)
+        async with session.post(self.base_url + path, **kwargs) as resp:
+            text = await resp.text()
+            if 400 <= resp.status < 500:
+                try:
+                    err = json.loads(text)
+                except ValueError:
+                    raise ClientError(resp.status, None, text, dict(resp.headers), None)
+                if err is None:
+                    raise ClientError(resp.status, None, text, dict(resp.headers), None)
+                raise ClientError(resp.status, err.get('code'), err.get('msg'), dict(resp.headers), err.get('data'))
+            if resp.status >= 500:
+                raise ServerError(resp.status, text)
+            try:
+                return json.loads(text)
+            except ValueError:
+                return {'error': f"Could not parse JSON: {text}"}
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+
+class AsyncInfo:
+    """跟单程序用到的 Info 接口的异步版本
+
+    与同步 Info 共用同一个熔断器: 任一路径连续失败都会让两边一起快速失败。
+    状态每轮都需要最新数据，不经过 CachedInfo 的 TTL 缓存。
+    """
+
+    def __init__(self, engine, breaker=None):
+        self.engine = engine
+        self.breaker = breaker or CircuitBreaker()
+        self.coin_to_asset = {}
+        self.name_to_coin = {}
+
+    async def _info(self, payload):
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"{payload['type']}: API 熔断中，快速失败")
+        try:
+            result = await self.engine.post('/info', payload)
+        except Exception:
+            self.breaker.record_failure()
+            raise
+        self.breaker.record_success()
+        return result
+
+    async def load_meta(self):
+        """加载合约/现货元数据 (下单时需要 coin -> asset 映射)"""
+        meta, spot_meta = await asyncio.gather(self._info({'type': 'meta'}), self._info({'type': 'spotMeta'}))
+        for asset, asset_info in enumerate(meta['universe']):
+            self.coin_to_asset[asset_info['name']] = asset
+            self.name_to_coin[asset_info['name']] = asset_info['name']
+        for spot_info in spot_meta['universe']:
+            asset = spot_info['index'] + 10000
+            self.coin_to_asset[spot_info['name']] = asset
+            self.name_to_coin[spot_info['name']] = spot_info['name']
+            base, quote = spot_info['tokens']
+            base_name = spot_meta['tokens'][base]['name']
+            quote_name = spot_meta['tokens'][quote]['name']
+            name = f"{base_name}/{quote_name}"
+            if name not in self.name_to_coin:
+                self.name_to_coin[name] = spot_info['name']
+
+    def name_to_asset(self, name):
+        return self.coin_to_asset[self.name_to_coin.get(name, name)]
+
+    async def user_state(self, address):
+        return await self._info({'type': 'clearinghouseState', 'user': address})
+
+    async def spot_user_state(self, address):
+        return await self._info({'type': 'spotClearinghouseState', 'user': address})
+
+    async def open_orders(self, address):
+        return await self._info({'type': 'openOrders', 'user': address})
+
+    async def user_fills(self, address):
+        return await self._info({'type': 'userFills', 'user': address})
+
+    async def all_mids(self):
+        return await self._info({'type': 'allMids'})
+
+
+class AsyncExchange:
+    """跟单程序用到的 Exchange 接口 (order / bulk_cancel) 的异步版本，签名复用 SDK"""
+
+    def __init__(self, engine, wallet, info, account_address=None, vault_address=None):
+        self.engine = engine
+        self.wallet = wallet
+        self.info = info
+        self.account_address = account_address
+        self.vault_address = vault_address
+        self.is_mainnet = engine.base_url == constants.MAINNET_API_URL.rstrip('/')
+        # 不同版本 SDK 的 sign_l1_action 参数不同 (新版多了 expires_after)
+        self._sign_with_expiry = 'expires_after' in inspect.signature(sign_l1_action).parameters
+
+    def _sign(self, action, nonce):
+        if self._sign_with_expiry:
+            return sign_l1_action(self.wallet, action, self.vault_address, nonce, None, self.is_mainnet)
+        return sign_l1_action(self.wallet, action, self.vault_address, nonce, self.is_mainnet)
+
+    async def _post_action(self, action, nonce):
+        payload = {
+            'action': action,
+            'nonce': nonce,
+            'signature': self._sign(action, nonce),
+            'vaultAddress': self.vault_address,
+        }
+        return await self.engine.post('/exchange', payload)
+
+    async def bulk_orders(self, order_requests):
+        wires = [order_request_to_order_wire(o, self.info.name_to_asset(o['coin'])) for o in order_requests]
+        action = order_wires_to_order_action(wires)
+        return await self._post_action(action, get_timestamp_ms())
+
+    async def order(self, coin, is_buy, sz, limit_px, order_type, reduce_only=False, cloid=None):
+        order = {
+            'coin': coin,
+            'is_buy': is_buy,
+            'sz': sz,
+            'limit_px': limit_px,
+            'order_type': order_type,
+            'reduce_only': reduce_only,
+        }
+        if cloid is not None:
+            order['cloid'] = cloid
+        return await self.bulk_orders([order])
+
+    async def bulk_cancel(self, cancels):
+        action = {
+            'type': 'cancel',
+            'cancels': [{'a': self.info.name_to_asset(c['coin']), 'o': c['oid']} for c in cancels],
+        }
+        return await self._post_action(action, get_timestamp_ms())
+
+
+class LoopExchange:
+    """供工作线程调用的同步 Exchange 外观
+
+    order / bulk_orders / bulk_cancel 提交到事件循环上由 AsyncExchange 执行 (与状态请求共用连接池)，
+    其余接口 (market_open、改单、杠杆等) 转发给同步 Exchange。不能在事件循环线程内调用，否则会死锁。
+    """
+
+    ASYNC_METHODS = ('order', 'bulk_orders', 'bulk_cancel')
+
+    def __init__(self, async_exchange, exchange, loop, timeout=30.0):
+        self.async_exchange = async_exchange
+        self.exchange = exchange
+        self.loop = loop
+        self.timeout = timeout
+
+    def __getattr__(self, name):
+        if name not in self.ASYNC_METHODS:
+            return getattr(self.exchange, name)
+        method = getattr(self.async_exchange, name)
+
+        def call(*args, **kwargs):
+            future = asyncio.run_coroutine_threadsafe(method(*args, **kwargs), self.loop)
+            return future.result(self.timeout)
+        return call
@@ -0,0 +1,177 @@
+"""并发同步基准测试
+
+模拟一个持有 30 个币种的目标账户，交易接口每次请求固定延迟，比较
+RECONCILE_WORKERS=1 (串行) 与多线程并发时一轮仓位同步 + 挂单同步的耗时。
+不连接网络，也不会真实下单:
+
+    python bench_reconcile.py --coins 30 --latency 0.15 --workers 8 --inflight 6
+"""
+import time
+import logging
+import argparse
+import threading
+
+import hyperliquid_copy_trader as copier
+from execution import ExecutionEngine, L2BookCache, ThrottledExchange
+from state_model import AccountState, Order, Position
+
+
+class SlowExchange:
+    """每次下单/撤单/改单固定延迟的模拟交易接口 (立即全部成交)"""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.calls = 0
+        self.peak_inflight = 0
+        self._inflight = 0
+        self._lock = threading.Lock()
+        self._oid = 0
+
+    def _request(self):
+        with self._lock:
+            self.calls += 1
+            self._inflight += 1
+            self.peak_inflight = max(self.peak_inflight, self._inflight)
+            self._oid += 1
+            oid = self._oid
+        time.sleep(self.latency)
+        with self._lock:
+            self._inflight -= 1
+        return oid
+
+    def market_open(self, coin, is_buy, sz, px=None, slippage=0.01):
+        oid = self._request()
+        return {'status': 'ok', 'response': {'data': {'statuses': [
+            {'filled': {'totalSz': str(sz), 'avgPx': str(px), 'oid': oid}}]}}}
+
+    def order(self, coin, is_buy, sz, limit_px, order_type, reduce_only=False, cloid=None):
+        oid = self._request()
+        return {'status': 'ok', 'response': {'data': {'statuses': [{'resting': {'oid': oid}}]}}}
+
+    def bulk_cancel(self, cancel_requests):
+        self._request()
+        return {'status': 'ok', 'response': {'data': {'statuses': ['success'] * len(cancel_requests)}}}
+
+    def bulk_modify_orders_new(self, modify_requests):
+        self._request()
+        return {'status': 'ok', 'response': {'data': {'statuses': [{'resting': {'oid': 0}}] * len(modify_requests)}}}
+
+
+class StaticInfo:
+    def __init__(self, mids):
+        self.mids = mids
+
+    def all_mids(self, **kwargs):
+        return self.mids
+
+    def l2_snapshot(self, coin):
+        return None  # 无盘口: 直接一次市价单
+
+
+class MemoryLinks:
+    """内存版挂单映射 (不写数据库)"""
+
+    def __init__(self):
+        self.links = {}
+        self.consumed = set()
+
+    def make_cloid(self, key):
+        return '0x' + format(abs(hash(key)), '032x')[:32]
+
+    def link(self, key, cloid, my_oid, coin, side, limit_px, sz, filled=0.0):
+        self.links[key] = {'cloid': cloid, 'my_oid': my_oid, 'coin': coin, 'side': side, 'limit_px': limit_px, 'sz': sz,
+                           'filled': filled}
+
+    def get(self, key):
+        return self.links.get(key)
+
+    def unlink(self, key):
+        self.links.pop(key, None)
+
+    def consume(self, key):
+        self.links.pop(key, None)
+        self.consumed.add(key)
+
+    def is_consumed(self, key):
+        return key in self.consumed
+
+    def release_consumed(self, live_keys):
+        self.consumed &= set(live_keys)
+
+    def items(self):
+        return list(self.links.items())
+
+    def __len__(self):
+        return len(self.links)
+
+
+class NullPnlEngine:
+    """不统计盈亏 (基准测试只关心同步耗时)"""
+
+    def note_reference(self, coin, px, time_ms):
+        pass
+
+
+def build_copier(n_coins, latency, inflight):
+    coins = [f"C{i}" for i in range(n_coins)]
+    exchange = SlowExchange(latency)
+
+    bot = copier.HyperliquidCopier.__new__(copier.HyperliquidCopier)
+    bot.is_dry_run = False
+    bot.info = StaticInfo({c: '10.0' for c in coins})
+    bot.exchange = ThrottledExchange(exchange, inflight)
+    bot.spot_universe = set()
+    bot.spot_token_to_pair = {}
+    bot.get_sz_decimals = lambda coin: 2
+    bot.is_spot_asset = lambda coin: False
+    bot.executor = ExecutionEngine(bot.exchange, L2BookCache(bot.info), 0.01, round_sz=bot.round_sz)
+    bot.initialized_baseline = True
+    bot.target_baseline, bot.my_baseline = {}, {}
+    bot.local_positions = {}
+    bot.journal_event = lambda event_type, data: None
+    bot.pnl_engine = NullPnlEngine()
+    bot.order_links = MemoryLinks()
+    bot.last_target_keys = None
+    bot.order_coalescer = copier.OrderChangeCoalescer(0, 0)
+    bot.reconcile_pool = copier.ThreadPoolExecutor(max_workers=max(1, copier.RECONCILE_WORKERS))
+
+    # 目标每个币种持有仓位并挂 2 个单，我方持有一半仓位 (一半币种需减仓，一半需加仓)
+    target_state, my_state = AccountState(), AccountState()
+    for i, coin in enumerate(coins):
+        target_state.positions[coin] = Position(coin, 100.0)
+        my_state.positions[coin] = Position(coin, 50.0 if i % 2 else 150.0)
+        for j, side in enumerate(('B', 'A')):
+            target_state.orders.append(Order(coin, side, 9.5 if side == 'B' else 10.5, 10.0, i * 10 + j))
+    return bot, exchange, target_state, my_state
+
+
+def run(n_coins, latency, workers, inflight):
+    copier.RECONCILE_WORKERS = workers
+    copier.COPY_RATIO = 1.0
+    copier.SYNC_MODE = 'full'
+    copier.SYNC_PERP_ORDERS = True
+    copier.POSITION_DIFF_THRESHOLD_USD = 1
+    logging.disable(logging.WARNING)
+    bot, exchange, target_state, my_state = build_copier(n_coins, latency, inflight)
+
+    start = time.perf_counter()
+    bot.sync_positions(target_state, my_state)
+    bot.sync_open_orders(target_state, my_state)
+    elapsed = time.perf_counter() - start
+    bot.reconcile_pool.shutdown()
+    return elapsed, exchange.calls, exchange.peak_inflight
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="并发同步基准测试")
+    parser.add_argument('--coins', type=int, default=30)
+    parser.add_argument('--latency', type=float, default=0.15, help="每次交易请求的模拟延迟 (秒)")
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--inflight', type=int, default=6)
+    args = parser.parse_args()
+
+    serial, calls, _ = run(args.coins, args.latency, 1, args.inflight)
+    parallel, _, peak = run(args.coins, args.latency, args.workers, args.inflight)
+    print(f"{args.coins} 个币种, {calls} 次交易请求, 单次延迟 {args.latency * 1000:.0f}ms")
+    print(f"串行 (workers=1):  {serial:.2f}s")
+    print(f"并发 (workers={args.workers}, 在途上限 {args.inflight}): {parallel:.2f}s | 峰值在途 {peak} | 提速 {serial / parallel:.1f}x")
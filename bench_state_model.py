@@ -0,0 +1,141 @@
+"""状态模型基准测试
+
+比较原来的嵌套字典路径 (每个消费者各自 float() 解析字符串) 与 state_model.AccountState
+(每个响应只解析一次) 在一轮轮询中的 CPU 耗时和常驻内存。不连接网络:
+
+    python bench_state_model.py --positions 100 --orders 500 --rounds 200
+"""
+import gc
+import json
+import time
+import argparse
+import tracemalloc
+
+from state_model import AccountState
+
+TOKEN_TO_PAIR = {'PURR': 'PURR/USDC'}
+
+
+def make_raw(n_positions, n_orders, churn=0.0, seed=0):
+    """构造与 API 响应结构一致的原始 JSON 文本 (churn 比例的挂单改价)"""
+    coins = [f"COIN{i}" for i in range(n_positions)]
+    perps = {
+        'marginSummary': {'accountValue': '100000.0', 'totalMarginUsed': '20000.0'},
+        'withdrawable': '80000.0',
+        'assetPositions': [{'type': 'oneWay', 'position': {
+            'coin': c, 'szi': f"{(i % 7 - 3) * 1.5}", 'entryPx': f"{100 + i}.25",
+            'leverage': {'type': 'cross', 'value': 5}, 'unrealizedPnl': '12.5'}} for i, c in enumerate(coins)],
+    }
+    spot = {'balances': [{'coin': 'USDC', 'total': '5000.0', 'hold': '100.0'},
+                         {'coin': 'PURR', 'total': '1000.0', 'hold': '0.0'}]}
+    orders = [{'coin': coins[i % n_positions], 'side': 'B' if i % 2 else 'A',
+               'limitPx': f"{100 + i % 50}.{seed + 10 if (i * 7919) % 1000 < churn * 1000 else 5}", 'sz': f"{1 + i % 9}.0", 'oid': 1000 + i,
+               'timestamp': 1700000000000 + i} for i in range(n_orders)]
+    return json.dumps({'perps': perps, 'spot': spot, 'orders': orders})
+
+
+# --- 原来的字典路径 ---
+
+def dict_build_state(raw):
+    state = {'assetPositions': [], 'openOrders': []}
+    state['spotBalances'] = raw['spot'].get('balances', [])
+    for b in raw['spot'].get('balances', []):
+        if b['coin'] == 'USDC':
+            continue
+        coin = TOKEN_TO_PAIR.get(b['coin'], b['coin'])
+        state['assetPositions'].append({'position': {'coin': coin, 'szi': b['total'], 'entryPx': 0.0}})
+    state['assetPositions'].extend(raw['perps']['assetPositions'])
+    state['marginSummary'] = raw['perps']['marginSummary']
+    state['withdrawable'] = raw['perps'].get('withdrawable')
+    for o in raw['orders']:
+        if o['coin'] in TOKEN_TO_PAIR:
+            o = dict(o, coin=TOKEN_TO_PAIR[o['coin']])
+        state['openOrders'].append(o)
+    return state
+
+
+def dict_consume(state):
+    """sync_positions / sync_open_orders / MarginModel / update_history 中对字符串字段的重复解析"""
+    positions = {}
+    for p in state['assetPositions']:
+        core = p.get('position', p)
+        positions[core['coin']] = float(core.get('szi', 0))
+    keys = {(o['coin'], o['side'], float(o['limitPx']), float(o['sz'])) for o in state['openOrders']}
+    desired = [(float(o['limitPx']), float(o['sz']) * 0.5) for o in state['openOrders']]
+    ranked = sorted(state['openOrders'], key=lambda o: float(o['limitPx']), reverse=True)
+    available = float(state['withdrawable'])
+    for p in state['assetPositions']:
+        core = p.get('position', p)
+        lev = core.get('leverage')
+        if isinstance(lev, dict):
+            float(lev['value'])
+    changed = [core for core in (p.get('position', p) for p in state['assetPositions'])
+               if float(core.get('szi', 0)) != 0 and float(core.get('entryPx', 0)) >= 0]
+    return len(positions) + len(keys) + len(desired) + len(ranked) + len(changed) + available
+
+
+# --- AccountState 路径 ---
+
+def model_build_state(raw, previous=None):
+    return AccountState.from_api(raw['perps'], raw['spot'], raw['orders'], token_to_pair=TOKEN_TO_PAIR,
+                                 previous=previous)
+
+
+def model_consume(state):
+    positions = state.position_sizes()
+    keys = {(o.coin, o.side, o.limit_px, o.sz) for o in state.orders}
+    desired = [(o.limit_px, o.sz * 0.5) for o in state.orders]
+    ranked = sorted(state.orders, key=lambda o: o.limit_px, reverse=True)
+    available = state.withdrawable
+    for p in state.positions.values():
+        p.leverage
+    changed = [p for p in state.positions.values() if p.szi != 0 and p.entry_px >= 0]
+    return len(positions) + len(keys) + len(desired) + len(ranked) + len(changed) + available
+
+
+def measure(build, consume, raws, rounds):
+    """返回 (每轮构建+消费耗时 us, 保留两个账户状态的常驻内存 KB)
+
+    耗时不含 json 解析 (两条路径相同)，AccountState 路径复用上一轮状态中未变化的挂单；内存只统计构建完成后仍被状态引用的对象，
+    字典路径会连带保留整份原始响应。
+    """
+    parsed = [json.loads(raw) for raw in raws]
+    best = float('inf')
+    for _ in range(5):  # 取 5 次中最快的一次，减少机器抖动的影响
+        start = time.perf_counter()
+        state = None
+        for i in range(rounds):
+            raw = parsed[i % len(parsed)]
+            state = build(raw) if build is dict_build_state else build(raw, state)
+            consume(state)
+        best = min(best, time.perf_counter() - start)
+    per_tick = best / rounds * 1e6
+
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = [build(json.loads(raw)) for raw in raws[:2]]
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del kept
+    return per_tick, used / 1024
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="状态模型基准测试")
+    parser.add_argument('--positions', type=int, default=100)
+    parser.add_argument('--orders', type=int, default=500)
+    parser.add_argument('--rounds', type=int, default=200)
+    parser.add_argument('--churn', type=float, default=0.05, help="每轮改价的挂单比例")
+    args = parser.parse_args()
+
+    # 每轮都是新的响应 (与实际轮询一致)，预先生成避免计入构造时间
+    raws = [make_raw(args.positions, args.orders, args.churn, seed) for seed in range(8)]
+    dict_us, dict_kb = measure(dict_build_state, dict_consume, raws, args.rounds)
+    model_us, model_kb = measure(model_build_state, model_consume, raws, args.rounds)
+
+    print(f"{args.positions} 个持仓, {args.orders} 个挂单, {args.rounds} 轮, 每轮改价 {args.churn:.0%}")
+    print(f"字典路径:      {dict_us:8.0f} us/轮 | 常驻内存 {dict_kb:7.1f} KB")
+    print(f"AccountState:  {model_us:8.0f} us/轮 | 常驻内存 {model_kb:7.1f} KB")
+    print(f"CPU {dict_us / model_us:.2f}x")
@@ -0,0 +1,171 @@
+import bisect
+from collections import deque
+
+import database as db
+from fill_cursor import fill_id
+
+
+class RollingQuantiles:
+    """最近 window 个样本的分位数 (有序列表 + 先进先出淘汰，增量维护)"""
+
+    def __init__(self, window=1000):
+        self.window = window
+        self._fifo = deque()
+        self._sorted = []
+
+    def __len__(self):
+        return len(self._sorted)
+
+    def add(self, value):
+        self._fifo.append(value)
+        bisect.insort(self._sorted, value)
+        if len(self._fifo) > self.window:
+            old = self._fifo.popleft()
+            del self._sorted[bisect.bisect_left(self._sorted, old)]
+
+    def quantile(self, q):
+        if not self._sorted:
+            return None
+        return self._sorted[min(int(len(self._sorted) * q), len(self._sorted) - 1)]
+
+    def mean(self):
+        return sum(self._sorted) / len(self._sorted) if self._sorted else None
+
+
+class _CoinStats:
+    def __init__(self, window):
+        self.lag = RollingQuantiles(window)
+        self.price_diff = RollingQuantiles(window)
+        self.size_error = RollingQuantiles(window)
+        self.matched = 0
+        self.unmatched = 0
+
+    def to_row(self):
+        return {
+            'matched': self.matched,
+            'unmatched': self.unmatched,
+            'lag_p50': self.lag.quantile(0.5),
+            'lag_p95': self.lag.quantile(0.95),
+            'lag_p99': self.lag.quantile(0.99),
+            'price_diff_bps': self.price_diff.mean(),
+            'size_error': self.size_error.mean(),
+        }
+
+
+class CopyTracker:
+    """跟单延迟与跟踪误差统计
+
+    将目标的每笔成交与它引发的我的成交配对 (同币种、同方向、目标成交之后 match_window_ms 内，
+    按时间顺序贪心分配，直到数量达到 目标数量 x 跟单比例)，计算:
+      - 延迟 (ms): 我的第一笔配对成交时间 - 目标成交时间
+      - 价差 (bps): 我的成交均价相对目标成交价的不利偏离
+      - 数量误差: 我的成交量 / (目标成交量 x 跟单比例) - 1
+    超过配对窗口仍无对应成交的目标成交记为未跟上 (size_error = -1)。
+    结果写入 history.db (copy_matches / copy_stats)，分位数和各币种误差滚动增量维护。
+    """
+
+    def __init__(self, target_address, copy_ratio, start_ms, match_window_ms=60000, window=1000):
+        self.target_address = target_address
+        self.copy_ratio = copy_ratio
+        self.start_ms = start_ms
+        self.match_window_ms = match_window_ms
+        self.window = window
+        self.pending_target = []    # 待配对的目标成交 (按时间)
+        self.pending_follower = []  # 尚未被分配的我的成交 (按时间)
+        self.stats = {}             # coin -> _CoinStats
+        self.overall = _CoinStats(window)
+
+    def add_target_fill(self, fill):
+        if int(fill['time']) >= self.start_ms:
+            self.pending_target.append(fill)
+
+    def add_follower_fill(self, fill):
+        if int(fill['time']) >= self.start_ms:
+            self.pending_follower.append(fill)
+
+    def process(self, now_ms):
+        """配对已到期 (或已配满) 的目标成交，写入结果并刷新统计"""
+        if not self.pending_target:
+            # 没有待配对的目标成交时，过期的我的成交 (手动交易/全量同步修正) 不再保留
+            cutoff = now_ms - self.match_window_ms
+            self.pending_follower = [f for f in self.pending_follower if int(f['time']) >= cutoff]
+            return []
+
+        self.pending_target.sort(key=lambda f: int(f['time']))
+        self.pending_follower.sort(key=lambda f: int(f['time']))
+
+        results = []
+        still_pending = []
+        touched = set()
+        for t_fill in self.pending_target:
+            t_time = int(t_fill['time'])
+            want = float(t_fill['sz']) * self.copy_ratio
+            matched, got = [], 0.0
+            for f in self.pending_follower:
+                f_time = int(f['time'])
+                if f_time < t_time or f['coin'] != t_fill['coin'] or f['side'] != t_fill['side']:
+                    continue
+                if f_time > t_time + self.match_window_ms or got >= want * 0.999:
+                    break
+                matched.append(f)
+                got += float(f['sz'])
+
+            expired = now_ms > t_time + self.match_window_ms
+            if got < want * 0.999 and not expired:
+                still_pending.append(t_fill)  # 还可能有后续成交，继续等待
+                continue
+
+            # 按对象移除，只去掉本次分配的成交 (同一笔交易的其它部分成交可能属于下一笔目标成交)
+            matched_ids = {id(f) for f in matched}
+            self.pending_follower = [f for f in self.pending_follower if id(f) not in matched_ids]
+            results.append(self._record(t_fill, matched, want))
+            touched.add(t_fill['coin'])
+
+        self.pending_target = still_pending
+        for coin in touched:
+            db.save_copy_stats(self.target_address, coin, self.stats[coin].to_row())
+        if touched:
+            db.save_copy_stats(self.target_address, '*', self.overall.to_row())
+        return results
+
+    def _record(self, t_fill, matched, want):
+        coin = t_fill['coin']
+        t_px = float(t_fill['px'])
+        stats = self.stats.setdefault(coin, _CoinStats(self.window))
+
+        row = {
+            'target_hash': fill_id(t_fill),
+            'target_address': self.target_address,
+            'coin': coin,
+            'side': t_fill['side'],
+            'target_time': int(t_fill['time']),
+            'target_px': t_px,
+            'target_sz': float(t_fill['sz']),
+            'follower_hashes': ','.join(fill_id(f) for f in matched),
+            'follower_sz': 0.0,
+            'follower_px': None,
+            'lag_ms': None,
+            'price_diff_bps': None,
+            'size_error': -1.0,
+        }
+        if matched:
+            f_sz = sum(float(f['sz']) for f in matched)
+            f_px = sum(float(f['sz']) * float(f['px']) for f in matched) / f_sz
+            diff = (f_px - t_px) / t_px if t_fill['side'] == 'B' else (t_px - f_px) / t_px
+            row['follower_sz'] = f_sz
+            row['follower_px'] = f_px
+            row['lag_ms'] = int(matched[0]['time']) - int(t_fill['time'])
+            row['price_diff_bps'] = diff * 1e4
+            row['size_error'] = f_sz / want - 1 if want else 0.0
+            for s in (stats, self.overall):
+                s.matched += 1
+                s.lag.add(row['lag_ms'])
+                s.price_diff.add(row['price_diff_bps'])
+                s.size_error.add(abs(row['size_error']))
+        else:
+            for s in (stats, self.overall):
+                s.unmatched += 1
+                s.size_error.add(1.0)
+
+        db.log_copy_match(row)
+        return row
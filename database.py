@@ -1,71 +1,73 @@
 import sqlite3
-import os
+import json
+import time
 import pandas as pd
 from datetime import datetime
 
+from fill_cursor import fill_id
+
 DB_FILE = 'users.db'
 HISTORY_DB_FILE = 'history.db'
+STATE_DB_FILE = 'copier_state.db'
+API_CACHE_DB_FILE = 'api_cache.db'
 
-def init_db():
-    # --- 用户配置数据库 ---
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute('''
+# users.db 的版本化迁移 (规则同 HISTORY_MIGRATIONS)
+USER_MIGRATIONS = [
+    # 1: 用户配置表、全局设置表
+    [
+        '''
         CREATE TABLE IF NOT EXISTS users (
             email TEXT PRIMARY KEY,
             private_key TEXT,
             target_address TEXT,
             copy_ratio REAL,
             slippage REAL,
-            sync_mode TEXT DEFAULT 'full'
+            sync_mode TEXT DEFAULT 'full',
+            auto_refresh_interval INTEGER DEFAULT 10,
+            market_type TEXT DEFAULT 'perps',
+            my_address TEXT DEFAULT '',
+            sync_perp_orders INTEGER DEFAULT 1,
+            sync_spot_orders INTEGER DEFAULT 0
         )
-    ''')
-    # 尝试添加 sync_mode 列（如果不存在）
-    try:
-        c.execute('ALTER TABLE users ADD COLUMN sync_mode TEXT DEFAULT "full"')
-    except sqlite3.OperationalError:
-        pass # 列已存在
-
-    # 尝试添加 auto_refresh_interval 列（如果不存在）
-    try:
-        c.execute('ALTER TABLE users ADD COLUMN auto_refresh_interval INTEGER DEFAULT 10')
-    except sqlite3.OperationalError:
-        pass # 列已存在
-
-    # 尝试添加 market_type 列（如果不存在）
-    try:
-        c.execute('ALTER TABLE users ADD COLUMN market_type TEXT DEFAULT "perps"')
-    except sqlite3.OperationalError:
-        pass # 列已存在
-        
-    # 尝试添加 my_address 列（如果不存在）
-    try:
-        c.execute('ALTER TABLE users ADD COLUMN my_address TEXT DEFAULT ""')
-    except sqlite3.OperationalError:
-        pass # 列已存在
-
-    # 尝试添加 sync_perp_orders 列（如果不存在）
-    try:
-        c.execute('ALTER TABLE users ADD COLUMN sync_perp_orders INTEGER DEFAULT 1')
-    except sqlite3.OperationalError:
-        pass # 列已存在
-
-    # 尝试添加 sync_spot_orders 列（如果不存在）
-    try:
-        c.execute('ALTER TABLE users ADD COLUMN sync_spot_orders INTEGER DEFAULT 0')
-    except sqlite3.OperationalError:
-        pass # 列已存在
-        
-    # --- 全局设置表 ---
-    c.execute('''
+        ''',
+        '''
         CREATE TABLE IF NOT EXISTS app_settings (
             key TEXT PRIMARY KEY,
             value TEXT
         )
-    ''')
+        ''',
+    ],
+]
 
+# 引入版本号之前逐步追加到 users 表的列 (旧库升级到版本 1 时补齐)
+_LEGACY_USER_COLUMNS = [
+    ('sync_mode', "TEXT DEFAULT 'full'"),
+    ('auto_refresh_interval', 'INTEGER DEFAULT 10'),
+    ('market_type', "TEXT DEFAULT 'perps'"),
+    ('my_address', "TEXT DEFAULT ''"),
+    ('sync_perp_orders', 'INTEGER DEFAULT 1'),
+    ('sync_spot_orders', 'INTEGER DEFAULT 0'),
+]
+
+def _upgrade_legacy_users_table(conn):
+    """没有版本号的旧 users.db: 按 PRAGMA table_info 补齐缺少的列，不再逐个尝试 ALTER"""
+    existing = {row[1] for row in conn.execute('PRAGMA table_info(users)')}
+    if not existing:
+        return  # 新库，由迁移 1 建表
+    for name, decl in _LEGACY_USER_COLUMNS:
+        if name not in existing:
+            conn.execute(f'ALTER TABLE users ADD COLUMN {name} {decl}')
     conn.commit()
-    conn.close()
+
+def init_db():
+    # --- 用户配置数据库 (已是最新版本时只读取一次 user_version) ---
+    conn = sqlite3.connect(DB_FILE)
+    try:
+        if conn.execute('PRAGMA user_version').fetchone()[0] == 0:
+            _upgrade_legacy_users_table(conn)
+        apply_migrations(conn, USER_MIGRATIONS)
+    finally:
+        conn.close()
 
     # --- 历史记录数据库 ---
     init_history_db()
@@ -73,6 +75,8 @@ def init_db():
 def init_history_db():
     conn = sqlite3.connect(HISTORY_DB_FILE)
     c = conn.cursor()
+    # 新建的库使用增量回收模式 (归档删除旧数据后可以分段回收空间；已有表的库上此设置不生效)
+    c.execute('PRAGMA auto_vacuum = INCREMENTAL')
     
     # 挂单历史
     c.execute('''
@@ -119,6 +123,306 @@ def init_history_db():
         )
     ''')
     
+    # 我的成交 (跟单产生)
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS follower_trades (
+            hash TEXT PRIMARY KEY,
+            timestamp INTEGER,
+            my_address TEXT,
+            target_address TEXT,
+            coin TEXT,
+            side TEXT,
+            px REAL,
+            sz REAL,
+            fee REAL,
+            tid TEXT,
+            record_time TEXT
+        )
+    ''')
+
+    # 目标成交 -> 我的成交 配对结果 (跟单延迟/误差)
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS copy_matches (
+            target_hash TEXT PRIMARY KEY,
+            target_address TEXT,
+            coin TEXT,
+            side TEXT,
+            target_time INTEGER,
+            target_px REAL,
+            target_sz REAL,
+            follower_hashes TEXT,
+            follower_sz REAL,
+            lag_ms INTEGER,
+            price_diff_bps REAL,
+            size_error REAL,
+            record_time TEXT
+        )
+    ''')
+
+    # 滚动统计 (每个目标、每个币种一行，coin='*' 为汇总)
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS copy_stats (
+            target_address TEXT,
+            coin TEXT,
+            matched INTEGER,
+            unmatched INTEGER,
+            lag_p50 REAL,
+            lag_p95 REAL,
+            lag_p99 REAL,
+            price_diff_bps REAL,
+            size_error REAL,
+            update_time TEXT,
+            PRIMARY KEY (target_address, coin)
+        )
+    ''')
+    
+    conn.commit()
+    apply_migrations(conn, HISTORY_MIGRATIONS)
+    conn.close()
+
+# history.db 的版本化迁移: 第 i 项把 PRAGMA user_version 从 i 升到 i+1，只追加、不修改已发布的项
+HISTORY_MIGRATIONS = [
+    # 1: 按目标 / 目标+币种 / 时间查询历史的索引 (分页浏览、过滤导出)
+    [
+        'CREATE INDEX IF NOT EXISTS idx_orders_target_time ON history_orders (target_address, timestamp)',
+        'CREATE INDEX IF NOT EXISTS idx_orders_target_coin_time ON history_orders (target_address, coin, timestamp)',
+        'CREATE INDEX IF NOT EXISTS idx_orders_time ON history_orders (timestamp)',
+        'CREATE INDEX IF NOT EXISTS idx_trades_target_time ON history_trades (target_address, timestamp)',
+        'CREATE INDEX IF NOT EXISTS idx_trades_target_coin_time ON history_trades (target_address, coin, timestamp)',
+        'CREATE INDEX IF NOT EXISTS idx_trades_time ON history_trades (timestamp)',
+        'CREATE INDEX IF NOT EXISTS idx_positions_target_time ON history_positions (target_address, timestamp)',
+        'CREATE INDEX IF NOT EXISTS idx_positions_target_coin_time ON history_positions (target_address, coin, timestamp)',
+        'CREATE INDEX IF NOT EXISTS idx_positions_time ON history_positions (timestamp)',
+        'CREATE INDEX IF NOT EXISTS idx_copy_matches_target_time ON copy_matches (target_address, target_time)',
+    ],
+    # 2: 成交记录已实现盈亏；按 1m / 1h / 1d 时间桶汇总的成交与持仓 (见 update_history_rollups)
+    [
+        'ALTER TABLE history_trades ADD COLUMN closed_pnl REAL DEFAULT 0',
+        '''
+        CREATE TABLE IF NOT EXISTS history_rollups (
+            target_address TEXT,
+            coin TEXT,
+            resolution TEXT,
+            bucket INTEGER,
+            fills INTEGER DEFAULT 0,
+            buy_sz REAL DEFAULT 0,
+            sell_sz REAL DEFAULT 0,
+            net_sz REAL DEFAULT 0,
+            volume REAL DEFAULT 0,
+            notional REAL DEFAULT 0,
+            vwap REAL,
+            fees REAL DEFAULT 0,
+            realized_pnl REAL DEFAULT 0,
+            position_sz REAL,
+            entry_px REAL,
+            position_ts INTEGER,
+            PRIMARY KEY (target_address, coin, resolution, bucket)
+        )
+        ''',
+        'CREATE TABLE IF NOT EXISTS rollup_state (source TEXT PRIMARY KEY, last_rowid INTEGER)',
+    ],
+    # 3: 跟单盈亏账本与归因 (见 pnl_engine.py)
+    [
+        '''
+        CREATE TABLE IF NOT EXISTS pnl_books (
+            target_address TEXT,
+            account TEXT,
+            coin TEXT,
+            position REAL,
+            entry_px REAL,
+            realized_pnl REAL,
+            fees REAL,
+            funding REAL,
+            mark_px REAL,
+            unrealized_pnl REAL,
+            baseline_pnl REAL,
+            last_time INTEGER,
+            total_pnl REAL,
+            update_time TEXT,
+            PRIMARY KEY (target_address, account, coin)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS pnl_attribution (
+            target_address TEXT,
+            coin TEXT,
+            lag_cash REAL,
+            slippage_cash REAL,
+            rounding_qty REAL,
+            rounding_cash REAL,
+            skipped_qty REAL,
+            skipped_cash REAL,
+            lag REAL,
+            slippage REAL,
+            rounding REAL,
+            skipped REAL,
+            fees REAL,
+            funding REAL,
+            other REAL,
+            gap REAL,
+            update_time TEXT,
+            PRIMARY KEY (target_address, coin)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS pnl_cursors (
+            target_address TEXT,
+            account TEXT,
+            funding_ms INTEGER,
+            PRIMARY KEY (target_address, account)
+        )
+        ''',
+    ],
+    # 4: 成交改按 fill_id (tid + 币种，没有 tid 时用 hash) 去重: 同一笔交易的多笔部分成交共用 hash，
+    #    按 hash 做主键会只保留第一笔。重建两张成交表 (保留 rowid，汇总水位和归档分区不受影响)
+    [
+        '''
+        CREATE TABLE history_trades_v4 (
+            fill_id TEXT PRIMARY KEY,
+            hash TEXT,
+            timestamp INTEGER,
+            target_address TEXT,
+            coin TEXT,
+            side TEXT,
+            px REAL,
+            sz REAL,
+            fee REAL,
+            tid TEXT,
+            record_time TEXT,
+            closed_pnl REAL DEFAULT 0
+        )
+        ''',
+        '''
+        INSERT OR IGNORE INTO history_trades_v4
+            (rowid, fill_id, hash, timestamp, target_address, coin, side, px, sz, fee, tid, record_time, closed_pnl)
+        SELECT rowid, CASE WHEN tid IS NOT NULL AND tid NOT IN ('', 'None') THEN tid || '_' || coin ELSE hash END,
+               hash, timestamp, target_address, coin, side, px, sz, fee, tid, record_time, closed_pnl
+        FROM history_trades ORDER BY rowid
+        ''',
+        'DROP TABLE history_trades',
+        'ALTER TABLE history_trades_v4 RENAME TO history_trades',
+        'CREATE INDEX IF NOT EXISTS idx_trades_target_time ON history_trades (target_address, timestamp)',
+        'CREATE INDEX IF NOT EXISTS idx_trades_target_coin_time ON history_trades (target_address, coin, timestamp)',
+        'CREATE INDEX IF NOT EXISTS idx_trades_time ON history_trades (timestamp)',
+        '''
+        CREATE TABLE follower_trades_v4 (
+            fill_id TEXT PRIMARY KEY,
+            hash TEXT,
+            timestamp INTEGER,
+            my_address TEXT,
+            target_address TEXT,
+            coin TEXT,
+            side TEXT,
+            px REAL,
+            sz REAL,
+            fee REAL,
+            tid TEXT,
+            record_time TEXT
+        )
+        ''',
+        '''
+        INSERT OR IGNORE INTO follower_trades_v4
+            (rowid, fill_id, hash, timestamp, my_address, target_address, coin, side, px, sz, fee, tid, record_time)
+        SELECT rowid, CASE WHEN tid IS NOT NULL AND tid NOT IN ('', 'None') THEN tid || '_' || coin ELSE hash END,
+               hash, timestamp, my_address, target_address, coin, side, px, sz, fee, tid, record_time
+        FROM follower_trades ORDER BY rowid
+        ''',
+        'DROP TABLE follower_trades',
+        'ALTER TABLE follower_trades_v4 RENAME TO follower_trades',
+    ],
+    # 5: 按 fill_id 重建成交汇总: 清空仍在 history.db 中的日期 (归档按整天进行) 的成交列并把成交水位归零，
+    #    下次 update_history_rollups 重新累加；持仓列和已归档日期的汇总保持不变
+    [
+        '''
+        DELETE FROM history_rollups
+        WHERE position_ts IS NULL AND bucket >= (SELECT MIN(timestamp) / 86400000 * 86400000 FROM history_trades)
+        ''',
+        '''
+        UPDATE history_rollups
+        SET fills = 0, buy_sz = 0, sell_sz = 0, net_sz = 0, volume = 0, notional = 0, vwap = NULL, fees = 0,
+            realized_pnl = 0
+        WHERE bucket >= (SELECT MIN(timestamp) / 86400000 * 86400000 FROM history_trades)
+        ''',
+        "DELETE FROM rollup_state WHERE source = 'history_trades'",
+    ],
+]
+
+def apply_migrations(conn, migrations):
+    """按 PRAGMA user_version 执行尚未执行的迁移，每个版本在一个事务中完成，返回迁移后的版本"""
+    version = conn.execute('PRAGMA user_version').fetchone()[0]
+    for number, statements in enumerate(migrations, start=1):
+        if number <= version:
+            continue
+        try:
+            conn.execute('BEGIN')
+            for sql in statements:
+                conn.execute(sql)
+            conn.execute(f'PRAGMA user_version = {number}')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        version = number
+    return version
+
+def init_state_db():
+    """跟单程序运行状态数据库 (跨重启保留)"""
+    conn = sqlite3.connect(STATE_DB_FILE)
+    c = conn.cursor()
+
+    # 目标挂单 -> 我的挂单 映射 (基于 cloid)
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS order_links (
+            my_address TEXT,
+            target_address TEXT,
+            target_key TEXT,
+            cloid TEXT,
+            my_oid TEXT,
+            coin TEXT,
+            side TEXT,
+            limit_px REAL,
+            sz REAL,
+            update_time TEXT,
+            PRIMARY KEY (my_address, target_address, target_key)
+        )
+    ''')
+
+    # 我的挂单已成交 (或被撤) 而目标挂单仍在: 记录目标挂单标识，目标挂单消失前不再补挂
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS consumed_order_keys (
+            my_address TEXT,
+            target_address TEXT,
+            target_key TEXT,
+            update_time TEXT,
+            PRIMARY KEY (my_address, target_address, target_key)
+        )
+    ''')
+
+    conn.commit()
+    apply_migrations(conn, STATE_MIGRATIONS)
+    conn.close()
+
+# copier_state.db 的版本化迁移 (规则同 HISTORY_MIGRATIONS)
+STATE_MIGRATIONS = [
+    # 1: 映射记录我的挂单累计已成交数量 (改单时扣除，避免重复持仓)
+    [
+        'ALTER TABLE order_links ADD COLUMN filled REAL DEFAULT 0',
+    ],
+]
+
+def init_api_cache_db():
+    """跨进程共享的 API 响应缓存 (机器人写入，看板读取)"""
+    conn = sqlite3.connect(API_CACHE_DB_FILE)
+    c = conn.cursor()
+    # WAL 模式: 机器人写入时看板仍可并发读取
+    c.execute('PRAGMA journal_mode=WAL')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS api_cache (
+            cache_key TEXT PRIMARY KEY,
+            fetched_at REAL,
+            payload TEXT
+        )
+    ''')
     conn.commit()
     conn.close()
 
@@ -126,7 +430,7 @@ def init_history_db():
 
 def log_order(target_address, order):
     """记录挂单"""
-    conn = sqlite3.connect(HISTORY_DB_FILE)
+    conn = sqlite3.connect(HISTORY_DB_FILE, timeout=30)
     c = conn.cursor()
     try:
         c.execute('''
@@ -150,20 +454,105 @@ def log_order(target_address, order):
     finally:
         conn.close()
 
+def _trade_row(target_address, trade):
+    # trade 结构通常来自 info.user_fills
+    # {'coin': 'ETH', 'px': '1800.5', 'sz': '0.1', 'side': 'B', 'time': 1234567890, 'hash': '...', 'fee': '0.05', 'tid': 123}
+    return (
+        fill_id(trade),
+        trade.get('hash'),
+        int(trade['time']),
+        target_address,
+        trade['coin'],
+        trade['side'],
+        float(trade['px']),
+        float(trade['sz']),
+        float(trade.get('fee', 0)),
+        str(trade.get('tid', '')),
+        datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        float(trade.get('closedPnl', 0))
+    )
+
+_INSERT_TRADE_SQL = '''
+    INSERT OR IGNORE INTO history_trades 
+    (fill_id, hash, timestamp, target_address, coin, side, px, sz, fee, tid, record_time, closed_pnl)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
 def log_trade(target_address, trade):
     """记录成交"""
+    conn = sqlite3.connect(HISTORY_DB_FILE, timeout=30)
+    c = conn.cursor()
+    try:
+        c.execute(_INSERT_TRADE_SQL, _trade_row(target_address, trade))
+        conn.commit()
+    except Exception as e:
+        print(f"Log trade error: {e}")
+    finally:
+        conn.close()
+
+def log_trades(target_address, trades):
+    """批量记录成交 (一个事务)，返回新写入的条数 (已存在的按 fill_id 忽略)"""
+    if not trades:
+        return 0
+    conn = sqlite3.connect(HISTORY_DB_FILE, timeout=30)
+    try:
+        before = conn.total_changes
+        conn.executemany(_INSERT_TRADE_SQL, [_trade_row(target_address, t) for t in trades])
+        conn.commit()
+        return conn.total_changes - before
+    except Exception as e:
+        print(f"Log trades error: {e}")
+        return 0
+    finally:
+        conn.close()
+
+def get_trade_time_range(target_address):
+    """本地已记录的某目标成交的 (最早, 最新) 时间 (ms)，没有记录时为 (None, None)"""
+    conn = sqlite3.connect(HISTORY_DB_FILE)
+    try:
+        return conn.execute('SELECT MIN(timestamp), MAX(timestamp) FROM history_trades WHERE target_address = ?',
+                            (target_address,)).fetchone()
+    finally:
+        conn.close()
+
+def log_position(target_address, position):
+    """记录持仓 (通常只在变化时调用)"""
+    conn = sqlite3.connect(HISTORY_DB_FILE, timeout=30)
+    c = conn.cursor()
+    try:
+        c.execute('''
+            INSERT INTO history_positions 
+            (timestamp, target_address, coin, size, entry_px, leverage, record_time)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (
+            int(datetime.now().timestamp() * 1000), # 使用当前时间作为快照时间
+            target_address,
+            position['coin'],
+            float(position['szi']),
+            float(position.get('entryPx', 0)),
+            float(position.get('leverage', 0) if position.get('leverage') else 0), # leverage dict check
+            datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        ))
+        conn.commit()
+    except Exception as e:
+        print(f"Log position error: {e}")
+    finally:
+        conn.close()
+
+def log_follower_trade(my_address, target_address, trade):
+    """记录我的成交"""
     conn = sqlite3.connect(HISTORY_DB_FILE)
     c = conn.cursor()
     try:
-        # trade 结构通常来自 info.user_fills
-        # {'coin': 'ETH', 'px': '1800.5', 'sz': '0.1', 'side': 'B', 'time': 1234567890, 'hash': '...', 'fee': '0.05', 'tid': 123}
         c.execute('''
-            INSERT OR IGNORE INTO history_trades 
-            (hash, timestamp, target_address, coin, side, px, sz, fee, tid, record_time)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            INSERT OR IGNORE INTO follower_trades 
+            (fill_id, hash, timestamp, my_address, target_address, coin, side, px, sz, fee, tid, record_time)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         ''', (
-            trade.get('hash') or f"{trade.get('tid')}_{trade.get('coin')}", # fallback if hash missing
+            fill_id(trade),
+            trade.get('hash'),
             int(trade['time']),
+            my_address,
             target_address,
             trade['coin'],
             trade['side'],
@@ -175,50 +564,588 @@ def log_trade(target_address, trade):
         ))
         conn.commit()
     except Exception as e:
-        print(f"Log trade error: {e}")
+        print(f"Log follower trade error: {e}")
     finally:
         conn.close()
 
-def log_position(target_address, position):
-    """记录持仓 (通常只在变化时调用)"""
+def log_copy_match(row):
+    """记录一条目标成交的配对结果"""
     conn = sqlite3.connect(HISTORY_DB_FILE)
     c = conn.cursor()
     try:
         c.execute('''
-            INSERT INTO history_positions 
-            (timestamp, target_address, coin, size, entry_px, leverage, record_time)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
+            INSERT OR REPLACE INTO copy_matches 
+            (target_hash, target_address, coin, side, target_time, target_px, target_sz,
+             follower_hashes, follower_sz, lag_ms, price_diff_bps, size_error, record_time)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         ''', (
-            int(datetime.now().timestamp() * 1000), # 使用当前时间作为快照时间
+            row['target_hash'], row['target_address'], row['coin'], row['side'], row['target_time'],
+            row['target_px'], row['target_sz'], row['follower_hashes'], row['follower_sz'],
+            row['lag_ms'], row['price_diff_bps'], row['size_error'],
+            datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        ))
+        conn.commit()
+    except Exception as e:
+        print(f"Log copy match error: {e}")
+    finally:
+        conn.close()
+
+def save_copy_stats(target_address, coin, stats):
+    """更新跟单延迟/误差滚动统计"""
+    conn = sqlite3.connect(HISTORY_DB_FILE)
+    c = conn.cursor()
+    try:
+        c.execute('''
+            INSERT OR REPLACE INTO copy_stats 
+            (target_address, coin, matched, unmatched, lag_p50, lag_p95, lag_p99, price_diff_bps, size_error, update_time)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (
+            target_address, coin, stats['matched'], stats['unmatched'], stats['lag_p50'], stats['lag_p95'],
+            stats['lag_p99'], stats['price_diff_bps'], stats['size_error'],
+            datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        ))
+        conn.commit()
+    except Exception as e:
+        print(f"Save copy stats error: {e}")
+    finally:
+        conn.close()
+
+def get_copy_stats(target_address):
+    """读取某个目标的跟单延迟/误差统计 (DataFrame)"""
+    conn = sqlite3.connect(HISTORY_DB_FILE)
+    try:
+        return pd.read_sql_query('SELECT * FROM copy_stats WHERE target_address = ? ORDER BY coin',
+                                 conn, params=(target_address,))
+    except Exception as e:
+        print(f"Get copy stats error: {e}")
+        return pd.DataFrame()
+    finally:
+        conn.close()
+
+def get_recent_copy_matches(target_address, limit=50):
+    """读取最近的成交配对结果 (DataFrame)"""
+    conn = sqlite3.connect(HISTORY_DB_FILE)
+    try:
+        return pd.read_sql_query('SELECT * FROM copy_matches WHERE target_address = ? ORDER BY target_time DESC LIMIT ?',
+                                 conn, params=(target_address, limit))
+    except Exception as e:
+        print(f"Get copy matches error: {e}")
+        return pd.DataFrame()
+    finally:
+        conn.close()
+
+# --- 挂单映射读写 ---
+
+def load_order_links(my_address, target_address):
+    """读取挂单映射 (返回字典: target_key -> link)"""
+    conn = sqlite3.connect(STATE_DB_FILE)
+    c = conn.cursor()
+    try:
+        c.execute('''
+            SELECT target_key, cloid, my_oid, coin, side, limit_px, sz, filled
+            FROM order_links WHERE my_address = ? AND target_address = ?
+        ''', (my_address, target_address))
+        rows = c.fetchall()
+    except Exception as e:
+        print(f"Load order links error: {e}")
+        rows = []
+    finally:
+        conn.close()
+
+    links = {}
+    for row in rows:
+        links[row[0]] = {
+            'cloid': row[1],
+            'my_oid': int(row[2]) if row[2] else None,
+            'coin': row[3],
+            'side': row[4],
+            'limit_px': row[5],
+            'sz': row[6],
+            'filled': row[7] or 0.0
+        }
+    return links
+
+def save_order_link(my_address, target_address, target_key, link):
+    """写入/更新一条挂单映射"""
+    conn = sqlite3.connect(STATE_DB_FILE)
+    c = conn.cursor()
+    try:
+        c.execute('''
+            INSERT OR REPLACE INTO order_links
+            (my_address, target_address, target_key, cloid, my_oid, coin, side, limit_px, sz, filled, update_time)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (
+            my_address,
             target_address,
-            position['coin'],
-            float(position['szi']),
-            float(position.get('entryPx', 0)),
-            float(position.get('leverage', 0) if position.get('leverage') else 0), # leverage dict check
+            target_key,
+            link['cloid'],
+            str(link['my_oid']) if link.get('my_oid') is not None else '',
+            link['coin'],
+            link['side'],
+            float(link['limit_px']),
+            float(link['sz']),
+            float(link.get('filled', 0.0)),
             datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         ))
         conn.commit()
     except Exception as e:
-        print(f"Log position error: {e}")
+        print(f"Save order link error: {e}")
+    finally:
+        conn.close()
+
+def delete_order_link(my_address, target_address, target_key):
+    """删除一条挂单映射"""
+    conn = sqlite3.connect(STATE_DB_FILE)
+    c = conn.cursor()
+    try:
+        c.execute('DELETE FROM order_links WHERE my_address = ? AND target_address = ? AND target_key = ?',
+                  (my_address, target_address, target_key))
+        conn.commit()
+    except Exception as e:
+        print(f"Delete order link error: {e}")
+    finally:
+        conn.close()
+
+def load_consumed_order_keys(my_address, target_address):
+    """读取已消耗 (我的挂单已成交) 的目标挂单标识集合"""
+    conn = sqlite3.connect(STATE_DB_FILE)
+    c = conn.cursor()
+    try:
+        c.execute('SELECT target_key FROM consumed_order_keys WHERE my_address = ? AND target_address = ?',
+                  (my_address, target_address))
+        return {row[0] for row in c.fetchall()}
+    except Exception as e:
+        print(f"Load consumed order keys error: {e}")
+        return set()
+    finally:
+        conn.close()
+
+def save_consumed_order_key(my_address, target_address, target_key):
+    """记录一个已消耗的目标挂单标识"""
+    conn = sqlite3.connect(STATE_DB_FILE)
+    c = conn.cursor()
+    try:
+        c.execute('''
+            INSERT OR REPLACE INTO consumed_order_keys (my_address, target_address, target_key, update_time)
+            VALUES (?, ?, ?, ?)
+        ''', (my_address, target_address, target_key, datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+        conn.commit()
+    except Exception as e:
+        print(f"Save consumed order key error: {e}")
+    finally:
+        conn.close()
+
+def delete_consumed_order_keys(my_address, target_address, target_keys):
+    """删除已消耗标记 (对应的目标挂单已消失)"""
+    conn = sqlite3.connect(STATE_DB_FILE)
+    c = conn.cursor()
+    try:
+        c.executemany('DELETE FROM consumed_order_keys WHERE my_address = ? AND target_address = ? AND target_key = ?',
+                      [(my_address, target_address, key) for key in target_keys])
+        conn.commit()
+    except Exception as e:
+        print(f"Delete consumed order keys error: {e}")
     finally:
         conn.close()
 
-def get_history_csv():
-    """获取所有历史数据 CSV 内容 (返回字典: filename -> csv_string)"""
+# --- 共享 API 响应缓存 ---
+
+def load_api_cache(cache_key, max_age):
+    """读取不超过 max_age 秒的缓存响应，返回 (fetched_at, payload)，没有则返回 None"""
+    conn = sqlite3.connect(API_CACHE_DB_FILE, timeout=1)
+    c = conn.cursor()
+    try:
+        c.execute('SELECT fetched_at, payload FROM api_cache WHERE cache_key = ? AND fetched_at >= ?',
+                  (cache_key, time.time() - max_age))
+        row = c.fetchone()
+        return (row[0], json.loads(row[1])) if row else None
+    except Exception as e:
+        print(f"Load api cache error: {e}")
+        return None
+    finally:
+        conn.close()
+
+def save_api_cache(cache_key, payload, fetched_at=None):
+    """写入一条 API 响应缓存"""
+    conn = sqlite3.connect(API_CACHE_DB_FILE, timeout=1)
+    c = conn.cursor()
+    try:
+        c.execute('INSERT OR REPLACE INTO api_cache (cache_key, fetched_at, payload) VALUES (?, ?, ?)',
+                  (cache_key, fetched_at or time.time(), json.dumps(payload, separators=(',', ':'))))
+        conn.commit()
+    except Exception as e:
+        print(f"Save api cache error: {e}")
+    finally:
+        conn.close()
+
+# 可导出的历史表: 导出名 -> 表名
+HISTORY_EXPORT_TABLES = {
+    'orders': 'history_orders',
+    'trades': 'history_trades',
+    'positions': 'history_positions',
+}
+
+def get_history_columns(table):
+    """历史表的列定义 [(列名, 声明类型), ...]"""
+    if table not in HISTORY_EXPORT_TABLES.values():
+        raise ValueError(f"unknown history table: {table}")
+    conn = sqlite3.connect(HISTORY_DB_FILE)
+    try:
+        return [(row[1], row[2].upper()) for row in conn.execute(f'PRAGMA table_info({table})')]
+    finally:
+        conn.close()
+
+def get_history_targets():
+    """历史数据中出现过的目标地址"""
+    conn = sqlite3.connect(HISTORY_DB_FILE)
+    try:
+        sql = ' UNION '.join(f'SELECT DISTINCT target_address FROM {t}' for t in HISTORY_EXPORT_TABLES.values())
+        return sorted(row[0] for row in conn.execute(sql) if row[0])
+    except Exception as e:
+        print(f"Get history targets error: {e}")
+        return []
+    finally:
+        conn.close()
+
+def _history_filters(start_ms=None, end_ms=None, target_address=None, coin=None):
+    """历史查询的 WHERE 条件和参数 (条件列都在索引中)"""
+    where, params = [], []
+    if target_address:
+        where.append('target_address = ?')
+        params.append(target_address)
+    if coin:
+        where.append('coin = ?')
+        params.append(coin)
+    if start_ms is not None:
+        where.append('timestamp >= ?')
+        params.append(int(start_ms))
+    if end_ms is not None:
+        where.append('timestamp <= ?')
+        params.append(int(end_ms))
+    return where, params
+
+def iter_history_rows(table, start_ms=None, end_ms=None, target_address=None, coin=None, chunk_size=5000,
+                      rowid_range=None):
+    """按块读取历史表 (生成器)，每次产出最多 chunk_size 行 (元组列表)，按时间倒序
+
+    过滤条件均可选: 时间范围 [start_ms, end_ms] (毫秒)、目标地址、币种、rowid 范围 (归档用)。
+    一次只在内存中保留一块，用于大数据量的流式导出。
+    """
+    if table not in HISTORY_EXPORT_TABLES.values():
+        raise ValueError(f"unknown history table: {table}")
+    where, params = _history_filters(start_ms, end_ms, target_address, coin)
+    if rowid_range is not None:
+        where.append('rowid BETWEEN ? AND ?')
+        params.extend(rowid_range)
+    sql = f'SELECT * FROM {table}'
+    if where:
+        sql += ' WHERE ' + ' AND '.join(where)
+    sql += ' ORDER BY timestamp DESC'
+
+    conn = sqlite3.connect(HISTORY_DB_FILE)
+    try:
+        c = conn.execute(sql, params)
+        while True:
+            rows = c.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield rows
+    finally:
+        conn.close()
+
+def query_history_page(table, target_address=None, coin=None, start_ms=None, end_ms=None, after=None, limit=100):
+    """按时间倒序分页查询历史表 (keyset 分页)
+
+    after 为上一页返回的游标 (timestamp, rowid)，None 表示第一页。每页通过索引直接定位到
+    游标位置，耗时与翻到第几页无关。返回 (行字典列表, 下一页游标)，没有更多数据时游标为 None。
+    """
+    if table not in HISTORY_EXPORT_TABLES.values():
+        raise ValueError(f"unknown history table: {table}")
+    where, params = _history_filters(start_ms, end_ms, target_address, coin)
+    if after is not None:
+        where.append('(timestamp, rowid) < (?, ?)')
+        params.extend([int(after[0]), int(after[1])])
+    sql = f'SELECT rowid AS _rowid, * FROM {table}'
+    if where:
+        sql += ' WHERE ' + ' AND '.join(where)
+    sql += ' ORDER BY timestamp DESC, rowid DESC LIMIT ?'
+    params.append(int(limit) + 1)
+
+    conn = sqlite3.connect(HISTORY_DB_FILE)
+    conn.row_factory = sqlite3.Row
+    try:
+        rows = [dict(row) for row in conn.execute(sql, params)]
+    except Exception as e:
+        print(f"Query history error: {e}")
+        return [], None
+    finally:
+        conn.close()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = (rows[-1]['timestamp'], rows[-1]['_rowid'])
+    for row in rows:
+        del row['_rowid']
+    return rows, next_cursor
+
+def query_trades(target_address=None, coin=None, start_ms=None, end_ms=None, after=None, limit=100):
+    """目标成交分页查询，参数和返回值见 query_history_page"""
+    return query_history_page('history_trades', target_address, coin, start_ms, end_ms, after, limit)
+
+def query_orders(target_address=None, coin=None, start_ms=None, end_ms=None, after=None, limit=100):
+    """目标挂单分页查询，参数和返回值见 query_history_page"""
+    return query_history_page('history_orders', target_address, coin, start_ms, end_ms, after, limit)
+
+def query_positions(target_address=None, coin=None, start_ms=None, end_ms=None, after=None, limit=100):
+    """持仓快照分页查询，参数和返回值见 query_history_page"""
+    return query_history_page('history_positions', target_address, coin, start_ms, end_ms, after, limit)
+
+# --- 历史归档 (已结束的自然日移出 history.db，见 history_archive.py) ---
+
+DAY_MS = 86400000
+
+def get_history_days(table, before_ms):
+    """table 中 before_ms 之前有数据的 UTC 自然日 (每天 0 点的毫秒时间戳，升序)"""
+    if table not in HISTORY_EXPORT_TABLES.values():
+        raise ValueError(f"unknown history table: {table}")
+    conn = sqlite3.connect(HISTORY_DB_FILE)
+    try:
+        rows = conn.execute(f'SELECT DISTINCT timestamp / ? FROM {table} WHERE timestamp < ? ORDER BY 1',
+                            (DAY_MS, int(before_ms))).fetchall()
+        return [row[0] * DAY_MS for row in rows]
+    finally:
+        conn.close()
+
+def get_history_day_rowids(table, day_ms):
+    """某一天数据的 (最小 rowid, 最大 rowid, 行数)，归档时用来固定要移出的行
+
+    表中 rowid 最大的一行不参与归档: 删除它会让 SQLite 复用 rowid，破坏汇总的 rowid 水位。
+    """
+    if table not in HISTORY_EXPORT_TABLES.values():
+        raise ValueError(f"unknown history table: {table}")
+    conn = sqlite3.connect(HISTORY_DB_FILE)
+    try:
+        return conn.execute(f'''SELECT MIN(rowid), MAX(rowid), COUNT(*) FROM {table}
+                                WHERE timestamp >= ? AND timestamp < ? AND rowid < (SELECT MAX(rowid) FROM {table})''',
+                            (int(day_ms), int(day_ms) + DAY_MS)).fetchone()
+    finally:
+        conn.close()
+
+def delete_history_day(table, day_ms, rowid_range):
+    """删除已归档的一天数据 (只删 rowid_range 内的行，归档期间迟到的新行保留到下次)，返回删除行数"""
+    if table not in HISTORY_EXPORT_TABLES.values():
+        raise ValueError(f"unknown history table: {table}")
+    conn = sqlite3.connect(HISTORY_DB_FILE, timeout=30)
+    try:
+        c = conn.execute(f'DELETE FROM {table} WHERE timestamp >= ? AND timestamp < ? AND rowid BETWEEN ? AND ?',
+                         (int(day_ms), int(day_ms) + DAY_MS, rowid_range[0], rowid_range[1]))
+        conn.commit()
+        return c.rowcount
+    finally:
+        conn.close()
+
+def vacuum_history_db(max_pages=1000):
+    """增量回收 history.db 中已删除数据占用的空间，返回回收前后的文件页数
+
+    每次最多回收 max_pages 页并立即提交，写锁只占用很短时间，同时写入的成交不会等到超时。
+    新建的库默认为增量回收模式；更早创建的库切换模式需要一次完整 VACUUM (长时间锁库)，
+    这里不做切换，只是不缩小文件 (空闲页仍会被后续写入复用)。
+    """
+    conn = sqlite3.connect(HISTORY_DB_FILE, timeout=30)
+    try:
+        before = conn.execute('PRAGMA page_count').fetchone()[0]
+        if conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2:
+            while conn.execute('PRAGMA freelist_count').fetchone()[0]:
+                conn.execute(f'PRAGMA incremental_vacuum({int(max_pages)})').fetchall()
+                time.sleep(0.01)  # 让出写锁
+        return before, conn.execute('PRAGMA page_count').fetchone()[0]
+    finally:
+        conn.close()
+
+# --- 跟单盈亏 (pnl_engine.PnlEngine 的持久化) ---
+
+def load_pnl_state(target_address):
+    """返回 (账本 {(account, coin): 字段元组}, 归因 {coin: 字段元组}, 资金费游标 {account: ms})"""
+    conn = sqlite3.connect(HISTORY_DB_FILE)
+    try:
+        books = {(row[0], row[1]): row[2:] for row in conn.execute('''
+            SELECT account, coin, position, entry_px, realized_pnl, fees, funding, mark_px, baseline_pnl, last_time
+            FROM pnl_books WHERE target_address = ?''', (target_address,))}
+        attribution = {row[0]: row[1:] for row in conn.execute('''
+            SELECT coin, lag_cash, slippage_cash, rounding_qty, rounding_cash, skipped_qty, skipped_cash
+            FROM pnl_attribution WHERE target_address = ?''', (target_address,))}
+        cursors = dict(conn.execute('SELECT account, funding_ms FROM pnl_cursors WHERE target_address = ?',
+                                    (target_address,)).fetchall())
+        return books, attribution, cursors
+    except Exception as e:
+        print(f"Load pnl state error: {e}")
+        return {}, {}, {}
+    finally:
+        conn.close()
+
+def save_pnl_state(target_address, books, attribution, cursors):
+    """写回有变化的账本行和归因行 (一个事务)"""
+    now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    conn = sqlite3.connect(HISTORY_DB_FILE)
+    try:
+        conn.executemany('''
+            INSERT OR REPLACE INTO pnl_books
+            (target_address, account, coin, position, entry_px, realized_pnl, fees, funding, mark_px,
+             unrealized_pnl, baseline_pnl, last_time, total_pnl, update_time)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', [(target_address,) + row + (now,) for row in books])
+        conn.executemany('''
+            INSERT OR REPLACE INTO pnl_attribution
+            (target_address, coin, lag_cash, slippage_cash, rounding_qty, rounding_cash, skipped_qty, skipped_cash,
+             lag, slippage, rounding, skipped, fees, funding, other, gap, update_time)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', [(target_address,) + row + (now,) for row in attribution])
+        conn.executemany('INSERT OR REPLACE INTO pnl_cursors (target_address, account, funding_ms) VALUES (?, ?, ?)',
+                         [(target_address, account, ms) for account, ms in cursors.items()])
+        conn.commit()
+    except Exception as e:
+        print(f"Save pnl state error: {e}")
+    finally:
+        conn.close()
+
+def get_pnl_books(target_address):
+    """跟单盈亏账本 (DataFrame，每个账户每个币种一行)"""
+    conn = sqlite3.connect(HISTORY_DB_FILE)
+    try:
+        return pd.read_sql_query('SELECT * FROM pnl_books WHERE target_address = ? ORDER BY coin, account',
+                                 conn, params=(target_address,))
+    except Exception as e:
+        print(f"Get pnl books error: {e}")
+        return pd.DataFrame()
+    finally:
+        conn.close()
+
+def get_pnl_attribution(target_address):
+    """跟单差额归因 (DataFrame，每个币种一行)"""
     conn = sqlite3.connect(HISTORY_DB_FILE)
-    
-    dfs = {}
     try:
-        dfs['orders'] = pd.read_sql_query("SELECT * FROM history_orders ORDER BY timestamp DESC", conn)
-        dfs['trades'] = pd.read_sql_query("SELECT * FROM history_trades ORDER BY timestamp DESC", conn)
-        dfs['positions'] = pd.read_sql_query("SELECT * FROM history_positions ORDER BY timestamp DESC", conn)
+        return pd.read_sql_query('''SELECT coin, gap, lag, slippage, rounding, skipped, fees, funding, other, update_time
+                                    FROM pnl_attribution WHERE target_address = ? ORDER BY coin''',
+                                 conn, params=(target_address,))
     except Exception as e:
-        print(f"Export csv error: {e}")
-        return {}
+        print(f"Get pnl attribution error: {e}")
+        return pd.DataFrame()
+    finally:
+        conn.close()
+
+# --- 历史汇总 (时间桶) ---
+
+# 汇总粒度 -> 桶长度 (毫秒)，日桶按 UTC 切分
+ROLLUP_RESOLUTIONS = {'1m': 60000, '1h': 3600000, '1d': 86400000}
+
+def _rollup_watermark(conn, source):
+    """source 表已汇总到的 rowid；表被清空后 rowid 会从头分配，此时从 0 重新开始"""
+    row = conn.execute('SELECT last_rowid FROM rollup_state WHERE source = ?', (source,)).fetchone()
+    last = row[0] if row else 0
+    max_rowid = conn.execute(f'SELECT COALESCE(MAX(rowid), 0) FROM {source}').fetchone()[0]
+    if max_rowid < last:
+        last = 0
+    return last, max_rowid
+
+def update_history_rollups(batch_size=20000):
+    """把上次之后新写入的成交和持仓快照累加到 history_rollups，返回本次处理的行数
+
+    按 rowid 水位增量处理，只更新新行落入的时间桶 (迟到的成交也会累加到它所属的旧桶)。
+    每批在一个 IMMEDIATE 事务中同时更新汇总和水位，多个进程并发调用也不会重复累加。
+    """
+    conn = sqlite3.connect(HISTORY_DB_FILE, timeout=30)
+    processed = 0
+    try:
+        while True:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                trade_lo, trade_max = _rollup_watermark(conn, 'history_trades')
+                pos_lo, pos_max = _rollup_watermark(conn, 'history_positions')
+                trade_hi = min(trade_max, trade_lo + batch_size)
+                pos_hi = min(pos_max, pos_lo + batch_size)
+                for resolution, width in ROLLUP_RESOLUTIONS.items():
+                    if trade_hi > trade_lo:
+                        conn.execute('''
+                            INSERT INTO history_rollups
+                            (target_address, coin, resolution, bucket, fills, buy_sz, sell_sz, net_sz,
+                             volume, notional, vwap, fees, realized_pnl)
+                            SELECT target_address, coin, ?, (timestamp / ?) * ?, COUNT(*),
+                                   SUM(CASE WHEN side = 'B' THEN sz ELSE 0 END),
+                                   SUM(CASE WHEN side = 'B' THEN 0 ELSE sz END),
+                                   SUM(CASE WHEN side = 'B' THEN sz ELSE -sz END),
+                                   SUM(sz), SUM(px * sz), SUM(px * sz) / NULLIF(SUM(sz), 0),
+                                   SUM(COALESCE(fee, 0)), SUM(COALESCE(closed_pnl, 0))
+                            FROM history_trades
+                            WHERE rowid > ? AND rowid <= ?
+                            GROUP BY target_address, coin, timestamp / ?
+                            ON CONFLICT (target_address, coin, resolution, bucket) DO UPDATE SET
+                                fills = fills + excluded.fills,
+                                buy_sz = buy_sz + excluded.buy_sz,
+                                sell_sz = sell_sz + excluded.sell_sz,
+                                net_sz = net_sz + excluded.net_sz,
+                                volume = volume + excluded.volume,
+                                notional = notional + excluded.notional,
+                                vwap = (notional + excluded.notional) / NULLIF(volume + excluded.volume, 0),
+                                fees = fees + excluded.fees,
+                                realized_pnl = realized_pnl + excluded.realized_pnl
+                        ''', (resolution, width, width, trade_lo, trade_hi, width))
+                    if pos_hi > pos_lo:
+                        # 每个桶保留最后一个持仓快照 (快照按时间顺序写入，MAX(rowid) 时其余列取自该行)
+                        conn.execute('''
+                            INSERT INTO history_rollups
+                            (target_address, coin, resolution, bucket, position_sz, entry_px, position_ts)
+                            SELECT target_address, coin, ?, (timestamp / ?) * ?, size, entry_px, timestamp
+                            FROM (SELECT target_address, coin, timestamp, size, entry_px, MAX(rowid)
+                                  FROM history_positions WHERE rowid > ? AND rowid <= ?
+                                  GROUP BY target_address, coin, timestamp / ?)
+                            WHERE true
+                            ON CONFLICT (target_address, coin, resolution, bucket) DO UPDATE SET
+                                position_sz = CASE WHEN excluded.position_ts >= COALESCE(position_ts, 0)
+                                                   THEN excluded.position_sz ELSE position_sz END,
+                                entry_px = CASE WHEN excluded.position_ts >= COALESCE(position_ts, 0)
+                                                THEN excluded.entry_px ELSE entry_px END,
+                                position_ts = MAX(COALESCE(position_ts, 0), excluded.position_ts)
+                        ''', (resolution, width, width, pos_lo, pos_hi, width))
+                conn.executemany('INSERT OR REPLACE INTO rollup_state (source, last_rowid) VALUES (?, ?)',
+                                 [('history_trades', trade_hi), ('history_positions', pos_hi)])
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            done = (trade_hi - trade_lo) + (pos_hi - pos_lo)
+            processed += done
+            if done == 0 or (trade_hi == trade_max and pos_hi == pos_max):
+                break
+    except Exception as e:
+        print(f"Update rollups error: {e}")
+    finally:
+        conn.close()
+    return processed
+
+def get_history_rollups(target_address, resolution='1h', coin=None, start_ms=None, end_ms=None):
+    """读取时间桶汇总 (DataFrame，按桶时间升序)"""
+    if resolution not in ROLLUP_RESOLUTIONS:
+        raise ValueError(f"unknown rollup resolution: {resolution}")
+    where, params = ['target_address = ?', 'resolution = ?'], [target_address, resolution]
+    if coin:
+        where.append('coin = ?')
+        params.append(coin)
+    if start_ms is not None:
+        where.append('bucket >= ?')
+        params.append(int(start_ms) // ROLLUP_RESOLUTIONS[resolution] * ROLLUP_RESOLUTIONS[resolution])
+    if end_ms is not None:
+        where.append('bucket <= ?')
+        params.append(int(end_ms))
+    conn = sqlite3.connect(HISTORY_DB_FILE)
+    try:
+        return pd.read_sql_query(f'SELECT * FROM history_rollups WHERE {" AND ".join(where)} ORDER BY bucket',
+                                 conn, params=params)
+    except Exception as e:
+        print(f"Get rollups error: {e}")
+        return pd.DataFrame()
     finally:
         conn.close()
-        
-    return {k: v.to_csv(index=False) for k, v in dfs.items()}
 
 def get_user_config(email):
     conn = sqlite3.connect(DB_FILE)
@@ -251,6 +1178,31 @@ def save_user_config(email, private_key, target_address, copy_ratio, slippage, s
     conn.commit()
     conn.close()
 
+def get_app_setting(key, default=None):
+    """读取全局设置 (app_settings 表)"""
+    conn = sqlite3.connect(DB_FILE)
+    c = conn.cursor()
+    try:
+        c.execute('SELECT value FROM app_settings WHERE key = ?', (key,))
+        row = c.fetchone()
+        return row[0] if row else default
+    except sqlite3.OperationalError:
+        return default
+    finally:
+        conn.close()
+
+def set_app_setting(key, value):
+    """写入全局设置 (app_settings 表)"""
+    conn = sqlite3.connect(DB_FILE)
+    c = conn.cursor()
+    try:
+        c.execute('INSERT OR REPLACE INTO app_settings (key, value) VALUES (?, ?)', (key, str(value)))
+        conn.commit()
+    except Exception as e:
+        print(f"Set setting error: {e}")
+    finally:
+        conn.close()
+
 def get_admin_password():
     conn = sqlite3.connect(DB_FILE)
     c = conn.cursor()
@@ -0,0 +1,217 @@
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class ThrottledExchange:
+    """Exchange 代理: 全局限制同时在途的下单/撤单/改单请求数 (多个币种并发同步时共用)"""
+
+    def __init__(self, exchange, max_inflight=6):
+        self.exchange = exchange
+        self.max_inflight = max_inflight
+        self._slots = threading.BoundedSemaphore(max(1, max_inflight))
+
+    def __getattr__(self, name):
+        attr = getattr(self.exchange, name)
+        if not callable(attr):
+            return attr
+
+        def throttled(*args, **kwargs):
+            with self._slots:
+                return attr(*args, **kwargs)
+        return throttled
+
+
+class L2BookCache:
+    """短时缓存的 L2 盘口 (info.l2_snapshot)，同一币种在 ttl 秒内只请求一次"""
+
+    def __init__(self, info, ttl=1.0):
+        self.info = info
+        self.ttl = ttl
+        self._books = {}  # coin -> (fetch_time, book)
+
+    def put(self, coin, book, now=None):
+        """写入盘口 (也可用于注入录制的盘口做回放测试)"""
+        self._books[coin] = (time.monotonic() if now is None else now, book)
+
+    def invalidate(self, coin):
+        self._books.pop(coin, None)
+
+    def get(self, coin):
+        cached = self._books.get(coin)
+        if cached and time.monotonic() - cached[0] < self.ttl:
+            return cached[1]
+        try:
+            book = self.info.l2_snapshot(coin)
+        except Exception as e:
+            logger.warning(f"[{coin}] 获取盘口失败: {e}")
+            return cached[1] if cached else None
+        self.put(coin, book)
+        return book
+
+
+def book_mid(book):
+    """盘口中间价 (买一卖一均值)，盘口为空返回 None"""
+    levels = book.get('levels') if book else None
+    if not levels or len(levels) < 2 or not levels[0] or not levels[1]:
+        return None
+    return (float(levels[0][0]['px']) + float(levels[1][0]['px'])) / 2
+
+
+def estimate_fill(book, is_buy, sz):
+    """按盘口逐档吃单，估算成交均价
+
+    返回 (avg_px, mid, impact, filled_sz)，impact 为均价相对中间价的不利偏离比例。
+    盘口深度不足时 filled_sz < sz。
+    """
+    mid = book_mid(book)
+    if mid is None or sz <= 0:
+        return None, mid, 0.0, 0.0
+
+    # levels[0] 为买盘 (bids)，levels[1] 为卖盘 (asks)；买入吃卖盘
+    side_levels = book['levels'][1] if is_buy else book['levels'][0]
+    remaining = sz
+    cost = 0.0
+    for level in side_levels:
+        take = min(remaining, float(level['sz']))
+        cost += take * float(level['px'])
+        remaining -= take
+        if remaining <= 0:
+            break
+
+    filled = sz - max(remaining, 0.0)
+    if filled <= 0:
+        return None, mid, 0.0, 0.0
+    avg_px = cost / filled
+    impact = (avg_px - mid) / mid if is_buy else (mid - avg_px) / mid
+    return avg_px, mid, impact, filled
+
+
+def max_size_within(book, is_buy, max_impact):
+    """在不超过 max_impact 的前提下，盘口能吃下的最大数量"""
+    mid = book_mid(book)
+    if mid is None:
+        return 0.0
+    side_levels = book['levels'][1] if is_buy else book['levels'][0]
+    limit_px = mid * (1 + max_impact) if is_buy else mid * (1 - max_impact)
+
+    # 逐档累加，直到均价偏离超过阈值；在越界的那一档内按比例求解
+    total_sz, cost = 0.0, 0.0
+    for level in side_levels:
+        px, lvl_sz = float(level['px']), float(level['sz'])
+        if (is_buy and px > limit_px) or (not is_buy and px < limit_px):
+            # 该档价格已超过阈值: 求解 (cost + x*px) / (total_sz + x) == limit_px
+            if abs(px - limit_px) > 0:
+                x = (limit_px * total_sz - cost) / (px - limit_px)
+                total_sz += max(min(x, lvl_sz), 0.0)
+            break
+        total_sz += lvl_sz
+        cost += px * lvl_sz
+    return total_sz
+
+
+def parse_fills(res):
+    """从下单返回中汇总成交数量和均价，返回 (total_sz, avg_px)"""
+    total_sz, cost = 0.0, 0.0
+    for status in res.get('response', {}).get('data', {}).get('statuses', []):
+        filled = status.get('filled') if isinstance(status, dict) else None
+        if filled:
+            sz = float(filled.get('totalSz', 0))
+            total_sz += sz
+            cost += sz * float(filled.get('avgPx', 0))
+    return total_sz, (cost / total_sz if total_sz else 0.0)
+
+
+class ExecutionEngine:
+    """滑点感知的市价执行
+
+    先用缓存盘口估算整笔 diff 的成交均价；预估冲击不超过 max_impact 时直接一次
+    market_open，否则拆成若干 IOC 子单分批执行 (每笔子单只吃阈值内的深度)，
+    子单之间间隔 child_interval 秒并刷新盘口。每次执行都会报告相对中间价的实际滑点。
+    """
+
+    def __init__(self, exchange, book_cache, slippage, max_impact=0.002, child_interval=1.0,
+                 max_children=10, round_sz=None, round_px=None):
+        self.exchange = exchange
+        self.books = book_cache
+        self.slippage = slippage
+        self.max_impact = max_impact
+        self.child_interval = child_interval
+        self.max_children = max_children
+        self.round_sz = round_sz or (lambda coin, sz: sz)
+        self.round_px = round_px or (lambda coin, px: px)
+
+    def execute(self, coin, is_buy, sz, fallback_px):
+        """执行一笔市价调整，返回实际成交数量"""
+        book = self.books.get(coin)
+        avg_px, mid, impact, _ = estimate_fill(book, is_buy, sz) if book else (None, None, 0.0, 0.0)
+
+        if avg_px is None or impact <= self.max_impact:
+            res = self.exchange.market_open(coin, is_buy, sz, fallback_px, self.slippage)
+            if res['status'] != 'ok':
+                logger.error(f"[{coin}] 下单失败: {res}")
+                return 0.0
+            logger.info(f"[{coin}] 市价单成交")
+            filled_sz, filled_px = parse_fills(res)
+            self._report(coin, is_buy, filled_sz, filled_px, mid)
+            return filled_sz
+
+        logger.info(f"[{coin}] 预估冲击 {impact * 1e4:.1f}bps 超过阈值 {self.max_impact * 1e4:.1f}bps，拆分为 IOC 子单执行")
+        return self._execute_sliced(coin, is_buy, sz, mid)
+
+    def _execute_sliced(self, coin, is_buy, sz, decision_mid):
+        remaining = sz
+        total_filled, total_cost = 0.0, 0.0
+        min_child = self.round_sz(coin, sz / self.max_children)
+
+        for i in range(self.max_children):
+            if i > 0:
+                time.sleep(self.child_interval)
+                self.books.invalidate(coin)
+            book = self.books.get(coin)
+            mid = book_mid(book) if book else None
+            if mid is None:
+                logger.warning(f"[{coin}] 盘口为空，停止拆单执行")
+                break
+
+            child_sz = max(max_size_within(book, is_buy, self.max_impact), min_child)
+            if i == self.max_children - 1:
+                child_sz = remaining  # 最后一笔补齐剩余
+            child_sz = self.round_sz(coin, min(child_sz, remaining))
+            if child_sz <= 0:
+                break
+
+            limit_px = mid * (1 + self.max_impact) if is_buy else mid * (1 - self.max_impact)
+            limit_px = self.round_px(coin, limit_px)
+            try:
+                res = self.exchange.order(coin, is_buy, child_sz, limit_px, {"limit": {"tif": "Ioc"}})
+            except Exception as e:
+                logger.error(f"[{coin}] 子单异常: {e}")
+                break
+            if res['status'] != 'ok':
+                logger.error(f"[{coin}] 子单失败: {res}")
+                break
+
+            filled_sz, filled_px = parse_fills(res)
+            logger.info(f"[{coin}] 子单 {i + 1}: {child_sz} @ {limit_px} -> 成交 {filled_sz}")
+            if filled_sz > 0:
+                total_filled += filled_sz
+                total_cost += filled_sz * filled_px
+                remaining -= filled_sz
+            if remaining <= 0 or self.round_sz(coin, remaining) == 0:
+                break
+
+        if total_filled > 0:
+            self._report(coin, is_buy, total_filled, total_cost / total_filled, decision_mid)
+        if remaining > 0 and self.round_sz(coin, remaining) > 0:
+            logger.warning(f"[{coin}] 拆单执行未完成，剩余 {remaining}，等待下一轮同步")
+        return total_filled
+
+    def _report(self, coin, is_buy, filled_sz, avg_px, mid):
+        """报告相对决策时中间价的实际滑点"""
+        if not filled_sz or not mid:
+            return
+        slip = (avg_px - mid) / mid if is_buy else (mid - avg_px) / mid
+        logger.info(f"[{coin}] 成交 {filled_sz} 均价 {avg_px:.6g} | 中间价 {mid:.6g} | 实际滑点 {slip * 1e4:.1f}bps")
@@ -0,0 +1,119 @@
+"""本地故障注入服务 (模拟 Hyperliquid /info 接口)
+
+用于在本地验证 ResilientInfo 的对冲请求、熔断和退避逻辑:
+
+    server = FaultInjectingServer(responses={'allMids': {'ETH': '3000'}}, stall_rate=0.1)
+    server.start()
+    info = ResilientInfo(Info(server.url, skip_ws=True, meta=..., spot_meta=...))
+    ...
+    server.stop()
+
+也可以直接运行: python fault_server.py --port 8899 --error-rate 0.2 --stall-rate 0.05
+"""
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FaultInjectingServer:
+    """按请求 type 返回预设响应，并按概率注入延迟、卡顿和 500 错误"""
+
+    def __init__(self, responses=None, latency=0.0, latency_jitter=0.0, error_rate=0.0,
+                 stall_rate=0.0, stall_seconds=5.0, host='127.0.0.1', port=0, seed=None):
+        self.responses = responses or {}
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.error_rate = error_rate
+        self.stall_rate = stall_rate
+        self.stall_seconds = stall_seconds
+        self.rng = random.Random(seed)
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _decide(self):
+        """决定本次请求的故障类型: (延迟秒数, 是否返回错误)"""
+        with self._lock:
+            self.requests += 1
+            delay = self.latency + self.rng.uniform(0, self.latency_jitter)
+            if self.rng.random() < self.stall_rate:
+                delay += self.stall_seconds
+            fail = self.rng.random() < self.error_rate
+        return delay, fail
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                try:
+                    payload = json.loads(self.rfile.read(length) or b'{}')
+                except ValueError:
+                    payload = {}
+
+                delay, fail = server._decide()
+                if delay:
+                    time.sleep(delay)
+
+                if fail:
+                    body, status = b'injected failure', 500
+                else:
+                    response = server.responses.get(payload.get('type'), {})
+                    body, status = json.dumps(response).encode(), 200
+
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # 不输出访问日志
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="本地故障注入 /info 服务")
+    parser.add_argument('--port', type=int, default=8899)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--stall-rate', type=float, default=0.0)
+    parser.add_argument('--stall-seconds', type=float, default=5.0)
+    args = parser.parse_args()
+
+    server = FaultInjectingServer(latency=args.latency, error_rate=args.error_rate, stall_rate=args.stall_rate,
+                                  stall_seconds=args.stall_seconds, port=args.port)
+    print(f"故障注入服务已启动: {server.url}")
+    server.start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.stop()
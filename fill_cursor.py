@@ -0,0 +1,40 @@
+from collections import deque
+
+
+def fill_id(fill):
+    """成交唯一标识: 优先使用 tid (同一笔交易拆成的多笔部分成交 hash 相同，tid 不同)，没有 tid 时用 hash"""
+    if fill.get('tid') is not None:
+        return f"{fill['tid']}_{fill.get('coin')}"
+    return fill.get('hash')
+
+
+class FillCursor:
+    """成交增量游标
+
+    记录已处理到的成交时间 (ms)，下次只需 user_fills_by_time(address, cursor) 取新成交。
+    同一毫秒可能有多笔成交，因此游标取 "最后时间" 并配合最近成交的 id 去重。
+    """
+
+    def __init__(self, start_ms=0, memory=5000):
+        self.cursor = int(start_ms)
+        self._seen = set()
+        self._order = deque()
+        self.memory = memory
+
+    def _remember(self, fid):
+        self._seen.add(fid)
+        self._order.append(fid)
+        while len(self._order) > self.memory:
+            self._seen.discard(self._order.popleft())
+
+    def accept(self, fills):
+        """过滤出未处理过的成交 (按时间升序) 并推进游标"""
+        new = []
+        for fill in sorted(fills, key=lambda f: int(f.get('time', 0))):
+            fid = fill_id(fill)
+            if fid in self._seen or int(fill.get('time', 0)) < self.cursor:
+                continue
+            self._remember(fid)
+            new.append(fill)
+            self.cursor = max(self.cursor, int(fill.get('time', 0)))
+        return new
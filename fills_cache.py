@@ -0,0 +1,93 @@
+import time
+import threading
+
+import database as db
+from fill_cursor import FillCursor
+from history_archive import ARCHIVE_DIR, archived_until
+
+DAY_MS = 86400000
+
+# user_fills_by_time 单次最多返回的条数 (按时间升序，超过时以最后一条的时间继续翻页)
+FILLS_PAGE_LIMIT = 2000
+
+
+class FillsCache:
+    """看板成交浏览的本地缓存 (数据存放在 history.db 的 history_trades，与跟单程序共用)
+
+    - refresh(): 只用 user_fills_by_time 拉取游标之后的新成交并批量写库，成本与新增成交数成正比
+    - load_older(): 本地数据翻到底时，向前回补一段更早的历史 (时间跨度按结果自适应)
+    页面数据用 database.query_trades 按 keyset 分页读取。同一个对象可在多个看板会话之间共享。
+    已被跟单程序归档的时间段不写入 (归档会在对象存活期间推进，每次调用时重新读取)。
+    """
+
+    def __init__(self, info, address, archive_dir=ARCHIVE_DIR, max_span_ms=180 * DAY_MS):
+        self.info = info
+        self.address = address
+        self.archive_dir = archive_dir
+        self.max_span_ms = max_span_ms
+        self.exhausted = False
+        self._span_ms = DAY_MS
+        self._last_refresh = 0.0
+        self._lock = threading.Lock()
+        oldest, newest = db.get_trade_time_range(address)
+        self.oldest_ms = oldest
+        self.cursor = FillCursor(start_ms=newest or 0)
+
+    def refresh(self, max_age=0):
+        """拉取新成交 (距上次拉取不足 max_age 秒时跳过)，返回新写入的条数"""
+        with self._lock:
+            if time.time() - self._last_refresh < max_age:
+                return 0
+            self._last_refresh = time.time()
+            if self.cursor.cursor == 0:
+                # 本地还没有该地址的数据: 先取最近的成交
+                fills = self.info.user_fills(self.address)
+            else:
+                fills = self._fetch_range(self.cursor.cursor, None)
+            # 不写入已归档时间段的成交 (否则下次归档会重复)
+            floor = self.min_time_ms()
+            new = self.cursor.accept([f for f in fills if int(f['time']) >= floor])
+            if new and self.oldest_ms is None:
+                self.oldest_ms = int(new[0]['time'])
+            return db.log_trades(self.address, new)
+
+    def load_older(self):
+        """向前回补一段历史，返回新写入的条数；没有更早的数据时设置 exhausted"""
+        with self._lock:
+            if self.exhausted or self.oldest_ms is None:
+                self.exhausted = True
+                return 0
+            floor = self.min_time_ms()
+            while True:
+                end = self.oldest_ms - 1
+                start = max(end - self._span_ms, floor)
+                if end <= start:
+                    self.exhausted = True
+                    return 0
+                fills = self._fetch_range(start, end)
+                if fills:
+                    self.oldest_ms = min(int(f['time']) for f in fills)
+                    return db.log_trades(self.address, fills)
+                # 这一段没有成交: 扩大跨度继续向前找，超过上限视为没有更早的数据
+                self.oldest_ms = start
+                if self._span_ms >= self.max_span_ms:
+                    self.exhausted = True
+                    return 0
+                self._span_ms = min(self._span_ms * 4, self.max_span_ms)
+
+    def min_time_ms(self):
+        """可以写入的最早成交时间 (ms): 已归档到的时间"""
+        return archived_until(self.archive_dir, 'trades')
+
+    def _fetch_range(self, start, end):
+        fills = []
+        while True:
+            batch = (self.info.user_fills_by_time(self.address, start, end) if end is not None
+                     else self.info.user_fills_by_time(self.address, start))
+            fills.extend(batch)
+            if len(batch) < FILLS_PAGE_LIMIT:
+                return fills
+            last = max(int(f['time']) for f in batch)
+            if last == start:
+                return fills
+            start = last
@@ -0,0 +1,177 @@
+import os
+import logging
+from datetime import datetime, timezone
+
+import database as db
+
+try:
+    import fcntl
+except ImportError:  # Windows 没有 fcntl，不做跨进程互斥
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_DIR = 'history_archive'
+
+# SQLite 声明类型 -> Parquet 列类型名 (pyarrow 为可选依赖，按名称延迟解析)
+_PARQUET_TYPES = {'INTEGER': 'int64', 'REAL': 'float64', 'TEXT': 'string'}
+
+
+def parquet_available():
+    try:
+        import pyarrow  # noqa: F401
+        import pyarrow.parquet  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def write_parquet(stream, columns, chunks):
+    """把行块 (db.iter_history_rows 的输出) 写成 Parquet，每块一个 row group，返回行数"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([(name, getattr(pa, _PARQUET_TYPES.get(decl, 'string'))()) for name, decl in columns])
+    count = 0
+    # 内存中只保留当前块
+    with pq.ParquetWriter(pa.PythonFile(stream, mode='w'), schema, compression='zstd') as writer:
+        for rows in chunks:
+            arrays = [pa.array(values, type=field.type) for values, field in zip(zip(*rows), schema)]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            count += len(rows)
+    return count
+
+
+def partition_dir(archive_dir, name, day_ms):
+    day = datetime.fromtimestamp(day_ms / 1000, tz=timezone.utc).strftime('%Y-%m-%d')
+    return os.path.join(archive_dir, name, f"date={day}")
+
+
+def _partition_day_ms(entry):
+    return int(datetime.strptime(entry[5:], '%Y-%m-%d').replace(tzinfo=timezone.utc).timestamp() * 1000)
+
+
+def archived_until(archive_dir, name):
+    """已归档的最后一个自然日的结束时间 (ms)，没有归档时为 0
+
+    这之前的数据已从 history.db 移出，重启后接口再次返回的旧成交/挂单不应重新写入，
+    否则下次归档会为同一天生成重复的分区文件。
+    """
+    base = os.path.join(archive_dir, name)
+    if not os.path.isdir(base):
+        return 0
+    days = [entry for entry in os.listdir(base) if entry.startswith('date=')]
+    return _partition_day_ms(max(days)) + db.DAY_MS if days else 0
+
+
+def archive_history(hot_days=30, archive_dir=ARCHIVE_DIR, now_ms=None, vacuum=True):
+    """把 hot_days 天之前已结束的自然日 (UTC) 从 history.db 移到按日期分区的 Parquet 文件
+
+    布局: <archive_dir>/<orders|trades|positions>/date=YYYY-MM-DD/part-<首 rowid>-<末 rowid>.parquet
+    每天的数据先写临时文件、落盘后改名，之后才从 SQLite 删除；文件名由 rowid 范围决定，
+    中途退出后重跑不会重复归档。多个进程同时调用时只有一个执行。返回 {导出名: 归档行数}。
+    """
+    if not parquet_available():
+        raise RuntimeError("归档历史数据需要安装 pyarrow")
+    os.makedirs(archive_dir, exist_ok=True)
+    lock = open(os.path.join(archive_dir, '.lock'), 'w')
+    if fcntl is not None:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock.close()
+            return {}
+
+    with lock:
+        # 先把待归档的行计入时间桶汇总，归档后汇总仍然完整
+        db.update_history_rollups()
+        now_ms = now_ms if now_ms is not None else int(datetime.now().timestamp() * 1000)
+        cutoff = (now_ms // db.DAY_MS - hot_days) * db.DAY_MS
+        counts = {}
+        for name, table in db.HISTORY_EXPORT_TABLES.items():
+            columns = db.get_history_columns(table)
+            counts[name] = 0
+            for day_ms in db.get_history_days(table, cutoff):
+                first, last, rows = db.get_history_day_rowids(table, day_ms)
+                if not rows:
+                    continue
+                folder = partition_dir(archive_dir, name, day_ms)
+                os.makedirs(folder, exist_ok=True)
+                path = os.path.join(folder, f"part-{first}-{last}.parquet")
+                if not os.path.exists(path):
+                    tmp_path = path + '.tmp'
+                    with open(tmp_path, 'wb') as f:
+                        write_parquet(f, columns, db.iter_history_rows(table, day_ms, day_ms + db.DAY_MS - 1,
+                                                                       rowid_range=(first, last)))
+                        f.flush()
+                        os.fsync(f.fileno())
+                    os.replace(tmp_path, path)
+                counts[name] += db.delete_history_day(table, day_ms, (first, last))
+
+        if vacuum and any(counts.values()):
+            before, after = db.vacuum_history_db()
+            logger.info(f"历史数据归档完成: {counts}，history.db {before} -> {after} 页")
+        return counts
+
+
+def archived_files(archive_dir, name, start_ms=None, end_ms=None):
+    """时间范围内的归档文件 (按日期、rowid 倒序)，只按分区目录名过滤，不打开文件"""
+    base = os.path.join(archive_dir, name)
+    if not os.path.isdir(base):
+        return []
+    files = []
+    for entry in sorted(os.listdir(base), reverse=True):
+        if not entry.startswith('date='):
+            continue
+        day_ms = _partition_day_ms(entry)
+        if (end_ms is not None and day_ms > end_ms) or (start_ms is not None and day_ms + db.DAY_MS <= start_ms):
+            continue
+        parts = [f for f in os.listdir(os.path.join(base, entry)) if f.startswith('part-') and f.endswith('.parquet')]
+        parts.sort(key=lambda f: int(f[5:-8].split('-')[0]), reverse=True)
+        files.extend(os.path.join(base, entry, f) for f in parts)
+    return files
+
+
+def _iter_parquet(path, columns, start_ms, end_ms, target_address, coin, chunk_size):
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+        conditions = []
+        if start_ms is not None:
+            conditions.append(pc.greater_equal(batch.column('timestamp'), int(start_ms)))
+        if end_ms is not None:
+            conditions.append(pc.less_equal(batch.column('timestamp'), int(end_ms)))
+        if target_address:
+            conditions.append(pc.equal(batch.column('target_address'), target_address))
+        if coin:
+            conditions.append(pc.equal(batch.column('coin'), coin))
+        if conditions:
+            mask = conditions[0]
+            for condition in conditions[1:]:
+                mask = pc.and_(mask, condition)
+            batch = batch.filter(mask)
+        if not batch.num_rows:
+            continue
+        # 按当前表结构输出，归档之后新增的列填 None
+        names = batch.schema.names
+        values = [batch.column(names.index(c)).to_pylist() if c in names else [None] * batch.num_rows
+                  for c in columns]
+        yield list(zip(*values))
+
+
+def iter_history(name, start_ms=None, end_ms=None, target_address=None, coin=None, chunk_size=5000,
+                 archive_dir=ARCHIVE_DIR):
+    """跨 history.db 和归档的统一读取 (生成器)，产出与 db.iter_history_rows 相同的行块
+
+    先读 history.db 中的热数据，再按日期倒序读取时间范围内的归档分区。
+    """
+    table = db.HISTORY_EXPORT_TABLES[name]
+    yield from db.iter_history_rows(table, start_ms, end_ms, target_address, coin, chunk_size)
+
+    files = archived_files(archive_dir, name, start_ms, end_ms)
+    if files and not parquet_available():
+        raise RuntimeError("读取归档数据需要安装 pyarrow")
+    columns = [c for c, _ in db.get_history_columns(table)]
+    for path in files:
+        yield from _iter_parquet(path, columns, start_ms, end_ms, target_address, coin, chunk_size)
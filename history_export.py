@@ -0,0 +1,48 @@
+import io
+import csv
+import zipfile
+
+import database as db
+from history_archive import iter_history, parquet_available, write_parquet
+
+EXPORT_FORMATS = ('csv', 'parquet')
+
+
+def _write_csv(stream, columns, chunks):
+    text = io.TextIOWrapper(stream, encoding='utf-8', newline='')
+    writer = csv.writer(text, lineterminator='\n')
+    writer.writerow([name for name, _ in columns])
+    count = 0
+    for rows in chunks:
+        writer.writerows(rows)
+        count += len(rows)
+    text.flush()
+    text.detach()
+    return count
+
+
+def write_history_zip(fileobj, fmt='csv', start_ms=None, end_ms=None, target_address=None, coin=None,
+                      chunk_size=5000):
+    """把三张历史表按过滤条件流式写入 ZIP (fileobj 为可写的二进制文件对象)
+
+    每张表从 SQLite 和归档分区按块读取后直接写入 ZIP 条目，不在内存中构造整张表或整个压缩包；
+    fmt='parquet' 时每张表写成一个 Parquet 文件 (需要 pyarrow)。返回 {导出名: 行数}。
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"unknown export format: {fmt}")
+    if fmt == 'parquet' and not parquet_available():
+        raise RuntimeError("导出 Parquet 需要安装 pyarrow")
+
+    counts = {}
+    # Parquet 自带列压缩，ZIP 中直接存储
+    compression = zipfile.ZIP_STORED if fmt == 'parquet' else zipfile.ZIP_DEFLATED
+    with zipfile.ZipFile(fileobj, 'w', compression) as zf:
+        for name, table in db.HISTORY_EXPORT_TABLES.items():
+            columns = db.get_history_columns(table)
+            chunks = iter_history(name, start_ms, end_ms, target_address, coin, chunk_size)
+            with zf.open(f"history_{name}.{fmt}", 'w', force_zip64=True) as stream:
+                if fmt == 'parquet':
+                    counts[name] = write_parquet(stream, columns, chunks)
+                else:
+                    counts[name] = _write_csv(stream, columns, chunks)
+    return counts
@@ -1,7 +1,12 @@
 import os
 import time
+import asyncio
 import logging
 import math
+import hashlib
+import signal
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from decimal import Decimal
 from dotenv import load_dotenv
 from eth_account import Account
@@ -9,7 +14,22 @@ from eth_account import Account
 from hyperliquid.info import Info
 from hyperliquid.exchange import Exchange
 from hyperliquid.utils import constants
+from hyperliquid.utils.types import Cloid
 import database as db
+from order_links import OrderLinkBook, target_order_key
+from order_coalescer import OrderChangeCoalescer
+from margin_model import MarginModel
+from execution import ExecutionEngine, L2BookCache, ThrottledExchange, parse_fills
+from tick_journal import TickJournal
+from info_cache import CachedInfo
+from fill_cursor import FillCursor, fill_id
+from copy_tracker import CopyTracker
+from pnl_engine import PnlEngine
+from history_archive import archive_history, archived_until
+from state_model import AccountState, Order, Position
+from log_control import install_log_control, set_log_level
+from structured_log import JsonLogHandler
+from resilience import ResilientInfo, CircuitBreaker, Backoff, retry_with_backoff
 
 # --- 配置区域 ---
 
@@ -42,6 +62,79 @@ if not MARKET_TYPES:
 SYNC_PERP_ORDERS = os.getenv("SYNC_PERP_ORDERS", "1") == "1"
 SYNC_SPOT_ORDERS = os.getenv("SYNC_SPOT_ORDERS", "0") == "1"
 
+# 挂单变化合并窗口 (秒): 目标挂单在该时间内不再变化才同步，0 表示不合并
+ORDER_SETTLE_WINDOW = float(os.getenv("ORDER_SETTLE_WINDOW", "2"))
+# 合并等待上限 (秒): 目标持续改单时，自首次变化起最多等待这么久就强制同步
+ORDER_SETTLE_MAX_WAIT = float(os.getenv("ORDER_SETTLE_MAX_WAIT", "10"))
+
+# 新挂单优先级 (保证金不足时优先保留哪些挂单):
+# 'price' (价格从高到低), 'mid' (离中间价最近优先), 'notional' (名义价值最大优先)
+ORDER_PRIORITY = os.getenv("ORDER_PRIORITY", "price")
+# 无持仓币种的预估杠杆 (有持仓时使用持仓实际杠杆)
+MARGIN_DEFAULT_LEVERAGE = float(os.getenv("MARGIN_DEFAULT_LEVERAGE", "1"))
+# 可用保证金安全系数 (只使用可用保证金/余额的该比例)
+MARGIN_BUFFER = float(os.getenv("MARGIN_BUFFER", "0.95"))
+
+# 滑点感知执行: 预估冲击超过该比例 (默认 0.2%) 时拆分为 IOC 子单
+EXEC_MAX_IMPACT = float(os.getenv("EXEC_MAX_IMPACT", "0.002"))
+# 子单间隔 (秒) 与最多子单数
+EXEC_CHILD_INTERVAL = float(os.getenv("EXEC_CHILD_INTERVAL", "1"))
+EXEC_MAX_CHILDREN = int(os.getenv("EXEC_MAX_CHILDREN", "10"))
+# 盘口缓存有效期 (秒)
+L2_BOOK_TTL = float(os.getenv("L2_BOOK_TTL", "1"))
+
+# 状态日志: 每多少条事件压缩为一次快照
+JOURNAL_SNAPSHOT_EVERY = int(os.getenv("JOURNAL_SNAPSHOT_EVERY", "500"))
+
+# 配置热加载: 运行中定期检查 users 表中本机器人的配置 (收到 SIGHUP 时立即检查)
+USER_EMAIL = os.getenv("USER_EMAIL", "")
+CONFIG_RELOAD_INTERVAL = float(os.getenv("CONFIG_RELOAD_INTERVAL", "10"))
+
+# 异步 HTTP 引擎 (aiohttp): 状态/成交/中间价请求并发发出，下单/撤单也走同一个 keep-alive 连接池
+ASYNC_ENGINE = os.getenv("ASYNC_ENGINE", "0") == "1"
+HTTP_MAX_PER_HOST = int(os.getenv("HTTP_MAX_PER_HOST", "8"))
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "10"))
+
+# API 熔断: 连续失败次数阈值与熔断时长 (秒)
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", "5"))
+BREAKER_RESET = float(os.getenv("BREAKER_RESET", "30"))
+
+# 快速跟随通道: 'off' 关闭，'poll' 按成交游标高频拉取，'ws' 订阅成交推送
+FAST_PATH = os.getenv("FAST_PATH", "off")
+FAST_PATH_POLL_INTERVAL = float(os.getenv("FAST_PATH_POLL_INTERVAL", "0.5"))
+
+# 并发同步: 不同币种的调整并发执行的线程数，以及全局同时在途的交易请求上限
+RECONCILE_WORKERS = int(os.getenv("RECONCILE_WORKERS", "8"))
+MAX_INFLIGHT_ACTIONS = int(os.getenv("MAX_INFLIGHT_ACTIONS", "6"))
+
+# 共享 API 响应缓存: 看板可直接复用机器人刚取到的数据
+SHARED_API_CACHE = os.getenv("SHARED_API_CACHE", "1") == "1"
+
+# 历史数据归档: history.db 只保留最近 HISTORY_HOT_DAYS 天 (0 表示不归档)，更早的自然日按日期分区写入 Parquet
+HISTORY_HOT_DAYS = int(os.getenv("HISTORY_HOT_DAYS", "30"))
+HISTORY_ARCHIVE_DIR = os.getenv("HISTORY_ARCHIVE_DIR", "history_archive")
+ARCHIVE_INTERVAL_HOURS = float(os.getenv("ARCHIVE_INTERVAL_HOURS", "24"))
+
+# 跟单盈亏: 资金费记录的拉取间隔 (秒)
+FUNDING_POLL_INTERVAL = float(os.getenv("FUNDING_POLL_INTERVAL", "300"))
+
+# 可在运行中直接生效的配置项
+HOT_RELOAD_SETTINGS = ('COPY_RATIO', 'SLIPPAGE', 'SYNC_MODE', 'MARKET_TYPES',
+                       'SYNC_PERP_ORDERS', 'SYNC_SPOT_ORDERS', 'POLL_INTERVAL')
+
+def settings_from_config(cfg):
+    """将 users 表中的配置行转换为运行参数 (与 app.py 启动时传入的环境变量一致)"""
+    market_types = [t.strip() for t in str(cfg.get('market_type') or 'perps').split(",") if t.strip()]
+    return {
+        'COPY_RATIO': float(cfg['copy_ratio']),
+        'SLIPPAGE': float(cfg['slippage']),
+        'SYNC_MODE': str(cfg.get('sync_mode') or 'full'),
+        'MARKET_TYPES': market_types or ["perps"],
+        'SYNC_PERP_ORDERS': bool(cfg.get('sync_perp_orders', True)),
+        'SYNC_SPOT_ORDERS': bool(cfg.get('sync_spot_orders', False)),
+        'POLL_INTERVAL': int(cfg.get('auto_refresh_interval') or 5),
+    }
+
 # 日志设置
 logging.basicConfig(
     level=logging.INFO,
@@ -49,14 +142,47 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# 结构化日志 (JSON 行 + 轮转压缩 + 索引)，由 app.py 启动时传入路径；启用后标准输出只保留警告以上 (及崩溃信息)
+LOG_JSON_FILE = os.getenv("LOG_JSON_FILE", "")
+LOG_MAX_MB = float(os.getenv("LOG_MAX_MB", "50"))
+LOG_ROTATE_HOURS = float(os.getenv("LOG_ROTATE_HOURS", "24"))
+LOG_BACKUPS = int(os.getenv("LOG_BACKUPS", "30"))
+CONSOLE_LOG_LEVEL = os.getenv("CONSOLE_LOG_LEVEL", "WARNING")
+if LOG_JSON_FILE:
+    for handler in logging.getLogger().handlers:
+        handler.setLevel(CONSOLE_LOG_LEVEL)
+    logging.getLogger().addHandler(JsonLogHandler(LOG_JSON_FILE, max_bytes=int(LOG_MAX_MB * 1024 * 1024),
+                                                  rotate_seconds=LOG_ROTATE_HOURS * 3600, backup_count=LOG_BACKUPS))
+
+# 日志级别与逐条调试日志 (如每个挂单的检查) 的采样/限流，可在看板中运行时调整
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_SAMPLE_EVERY = int(os.getenv("LOG_SAMPLE_EVERY", "10"))
+LOG_RATE_LIMIT = int(os.getenv("LOG_RATE_LIMIT", "20"))
+LOG_RATE_PERIOD = float(os.getenv("LOG_RATE_PERIOD", "60"))
+log_filter = install_log_control(LOG_LEVEL, LOG_SAMPLE_EVERY, LOG_RATE_LIMIT, LOG_RATE_PERIOD)
+
 class MockExchange:
     """模拟交易所，用于无私钥模式下的模拟跟单"""
     def __init__(self, account_address):
         self.account_address = account_address
         self.positions = {}  # coin -> float(szi)
         self.orders = []     # list of order dicts
+        self.fills = []      # 模拟成交记录 (与 user_fills 格式一致)
         self.order_id_counter = 1
 
+    def _record_fill(self, coin, is_buy, sz, px):
+        tid = len(self.fills) + 1
+        self.fills.append({
+            'coin': coin,
+            'side': "B" if is_buy else "A",
+            'px': str(px),
+            'sz': str(sz),
+            'time': int(time.time() * 1000),
+            'tid': tid,
+            'hash': f"mock_{tid}",
+            'fee': '0'
+        })
+
     def market_open(self, coin, is_buy, sz, px, slippage):
         # 模拟成交
         side = "B" if is_buy else "A"
@@ -71,14 +197,25 @@ class MockExchange:
         # 简单的浮点数精度处理
         if abs(self.positions[coin]) < 1e-6:
              self.positions[coin] = 0.0
+        self._record_fill(coin, is_buy, sz, px)
 
-        return {'status': 'ok', 'response': {'data': {'statuses': [{}]}}}
+        return {'status': 'ok', 'response': {'data': {'statuses': [{'filled': {'totalSz': str(sz), 'avgPx': str(px)}}]}}}
 
-    def order(self, coin, is_buy, sz, limit_px, order_type, reduce_only=False):
+    def order(self, coin, is_buy, sz, limit_px, order_type, reduce_only=False, cloid=None):
         # 模拟挂单
         side = "B" if is_buy else "A"
         oid = self.order_id_counter
         self.order_id_counter += 1
+
+        # IOC 单按限价立即全部成交
+        if order_type.get('limit', {}).get('tif') == 'Ioc':
+            logger.info(f"[模拟操作] IOC {'买入' if is_buy else '卖出'} {coin} 数量:{sz} 价格:{limit_px}")
+            self.positions[coin] = self.positions.get(coin, 0.0) + (sz if is_buy else -sz)
+            if abs(self.positions[coin]) < 1e-6:
+                self.positions[coin] = 0.0
+            self._record_fill(coin, is_buy, sz, limit_px)
+            filled = {'totalSz': str(sz), 'avgPx': str(limit_px), 'oid': oid}
+            return {'status': 'ok', 'response': {'data': {'statuses': [{'filled': filled}]}}}
         
         logger.info(f"[模拟操作] 限价挂单 {coin} {side} 数量:{sz} 价格:{limit_px}")
         
@@ -90,9 +227,37 @@ class MockExchange:
             'oid': oid,
             'timestamp': int(time.time() * 1000)
         }
+        if cloid is not None:
+            new_order['cloid'] = cloid.to_raw()
         self.orders.append(new_order)
         
-        return {'status': 'ok', 'response': {'data': {'statuses': [{}]}}}
+        return {'status': 'ok', 'response': {'data': {'statuses': [{'resting': {'oid': oid}}]}}}
+
+    def bulk_modify_orders_new(self, modify_requests):
+        # 模拟批量改单 (oid 可以是整数或 Cloid)
+        statuses = []
+        for req in modify_requests:
+            ref = req['oid']
+            ref = ref.to_raw() if hasattr(ref, 'to_raw') else ref
+            target = None
+            for o in self.orders:
+                if o['oid'] == ref or o.get('cloid') == ref:
+                    target = o
+                    break
+            if target is None:
+                statuses.append({'error': 'Cannot modify canceled or filled order'})
+                continue
+
+            new = req['order']
+            logger.info(f"[模拟操作] 改单 {new['coin']} 数量:{new['sz']} 价格:{new['limit_px']}")
+            target['limitPx'] = str(new['limit_px'])
+            target['sz'] = str(new['sz'])
+            target['side'] = "B" if new['is_buy'] else "A"
+            target['oid'] = self.order_id_counter
+            self.order_id_counter += 1
+            statuses.append({'resting': {'oid': target['oid']}})
+
+        return {'status': 'ok', 'response': {'data': {'statuses': statuses}}}
 
     def bulk_cancel(self, cancels):
         # 模拟撤单
@@ -142,14 +307,24 @@ class HyperliquidCopier:
         logger.info(f"目标地址: {TARGET_ADDRESS} | 跟单比例: {COPY_RATIO}")
 
         # 初始化 SDK
-        self.info = Info(constants.MAINNET_API_URL, skip_ws=True)
+        # Info 外包两层代理: 缓存 (按接口 TTL + 相同请求合并) -> 容错 (对冲请求 + 熔断)
+        # 熔断器由同步 Info 和异步引擎 (ASYNC_ENGINE=1) 共用
+        self.info_breaker = CircuitBreaker(BREAKER_FAILURES, BREAKER_RESET)
+        resilient_info = ResilientInfo(
+            Info(constants.MAINNET_API_URL, skip_ws=True), timeout=HTTP_TIMEOUT, breaker=self.info_breaker
+        )
+        self.info = CachedInfo(resilient_info, shared=SHARED_API_CACHE)
+        # 获取状态失败后的重试等待 (抖动退避，上限为轮询间隔)
+        self.failure_backoff = Backoff(base=0.5, cap=POLL_INTERVAL)
         
         if self.is_dry_run:
             self.exchange = MockExchange(self.my_address)
         else:
             # 关键: Exchange 初始化时，如果使用 Agent 模式，需要传入主账户地址作为 account_address
             self.exchange = Exchange(self.account, constants.MAINNET_API_URL, account_address=self.my_address)
-
+        # 多币种并发同步时限制在途请求数 (模拟账户状态非线程安全，串行执行)
+        self.exchange = ThrottledExchange(self.exchange, 1 if self.is_dry_run else MAX_INFLIGHT_ACTIONS)
+        self.reconcile_pool = ThreadPoolExecutor(max_workers=max(1, RECONCILE_WORKERS), thread_name_prefix='reconcile')
         
         # 初始化 Spot Universe
         self.spot_universe = set()
@@ -177,14 +352,170 @@ class HyperliquidCopier:
         # 历史记录缓存 (去重用)
         self.seen_oids = set()
         self.seen_fill_hashes = set()
+        self.refresh_archived_until()
         self.last_position_snapshot = {}
+        # 每个地址上一轮解析出的状态 (未变化的挂单下一轮直接复用)
+        self.last_states = {}
         
+        # 滑点感知执行 (缓存盘口 + 大额拆单)
+        self.executor = ExecutionEngine(
+            self.exchange, L2BookCache(self.info, L2_BOOK_TTL), SLIPPAGE,
+            max_impact=EXEC_MAX_IMPACT, child_interval=EXEC_CHILD_INTERVAL, max_children=EXEC_MAX_CHILDREN,
+            round_sz=self.round_sz, round_px=self.round_limit_px
+        )
+
+        # 交易锁: 全量同步与快速跟随通道互斥
+        self.trade_lock = threading.Lock()
+        # 本地跟踪的我的持仓 (每轮全量同步时刷新，快速通道成交后增量更新)
+        self.local_positions = {}
+        # 最近一次全量同步所用目标快照的返回时间 (ms)，在此之前的成交已被全量同步覆盖
+        self.last_reconciled_ms = 0
+
+        # 跟单延迟/误差统计: 目标成交与我的成交配对
+        start_ms = int(time.time() * 1000)
+        self.copy_tracker = CopyTracker(TARGET_ADDRESS, COPY_RATIO, start_ms)
+        self.my_fill_cursor = FillCursor(start_ms=start_ms)
+
         # 挂单指纹记录
         self.last_target_keys = None
+        self.order_coalescer = OrderChangeCoalescer(ORDER_SETTLE_WINDOW, ORDER_SETTLE_MAX_WAIT)
+
+        # 目标挂单 -> 我的挂单 映射 (cloid)，持久化以便重启后继续改单而非撤单重挂
+        db.init_state_db()
+        db.init_history_db()
+        # 跟单盈亏与归因 (目标 / 理想跟单 / 我的实际三本账，增量维护)
+        self.pnl_engine = PnlEngine(TARGET_ADDRESS, COPY_RATIO, start_ms)
+        self.last_funding_poll = 0.0
+        self.order_links = OrderLinkBook(self.my_address, TARGET_ADDRESS)
+        if len(self.order_links):
+            logger.info(f"已恢复挂单映射 {len(self.order_links)} 条")
+
+        # 状态日志: 重启后恢复基准、挂单指纹和持仓快照，避免静默重建基准和全量重同步
+        journal_hash = hashlib.md5(f"{self.my_address}:{TARGET_ADDRESS}".lower().encode()).hexdigest()
+        self.journal = TickJournal(f"journal_{journal_hash}.jsonl", JOURNAL_SNAPSHOT_EVERY)
+        self.journal_lock = threading.Lock()
+        self.restore_from_journal()
+
+        # 配置热加载
+        self.last_config_check = time.monotonic()
+        self.reload_requested = False
+        if hasattr(signal, 'SIGHUP'):
+            signal.signal(signal.SIGHUP, self._on_sighup)
+        self.reload_log_settings()
 
         logger.info(f"跟单模式: {SYNC_MODE} ({'同步持仓' if SYNC_MODE == 'full' else '仅同步下单'})")
         logger.info(f"交易类型: {', '.join(MARKET_TYPES)}")
 
+    def restore_from_journal(self):
+        """读取状态日志并恢复内存状态"""
+        start = time.perf_counter()
+        try:
+            state = self.journal.load()
+        except Exception as e:
+            logger.error(f"读取状态日志失败，从空状态启动: {e}")
+            return
+        if not state:
+            return
+
+        # 模拟模式的持仓和挂单只存在于内存，重启后已清空，不能沿用基准和挂单指纹
+        if not self.is_dry_run:
+            baseline = state.get('baseline')
+            if baseline and SYNC_MODE == 'order':
+                self.target_baseline = baseline['target']
+                self.my_baseline = baseline['my']
+                self.initialized_baseline = True
+            if state.get('order_keys') is not None:
+                self.last_target_keys = set(tuple(k) for k in state['order_keys'])
+        self.last_position_snapshot = {coin: Position.from_api(p, coin) for coin, p in state.get('positions', {}).items()}
+
+        elapsed = (time.perf_counter() - start) * 1000
+        logger.info(f"已从状态日志恢复 (seq {state.get('seq')}, 耗时 {elapsed:.1f}ms) | "
+                    f"基准: {'已恢复' if self.initialized_baseline else '无'} | "
+                    f"挂单指纹: {len(self.last_target_keys or [])} | 持仓快照: {len(self.last_position_snapshot)}")
+
+    def journal_event(self, event_type, data):
+        """写入状态日志 (失败不影响主流程)"""
+        try:
+            with self.journal_lock:
+                self.journal.append(event_type, data)
+        except Exception as e:
+            logger.error(f"写入状态日志失败: {e}")
+
+    def set_target_keys(self, keys):
+        """更新已同步的挂单指纹并记录到状态日志"""
+        self.last_target_keys = keys
+        self.journal_event('order_keys', sorted(list(k) for k in keys))
+
+    def _on_sighup(self, signum, frame):
+        self.reload_requested = True
+
+    def maybe_reload_config(self):
+        """到达检查间隔或收到 SIGHUP 时，从 users 表重新读取配置并在两轮之间应用"""
+        now = time.monotonic()
+        if not self.reload_requested and now - self.last_config_check < CONFIG_RELOAD_INTERVAL:
+            return
+        self.reload_requested = False
+        self.last_config_check = now
+
+        self.reload_log_settings()
+        if not USER_EMAIL:
+            return
+
+        try:
+            cfg = db.get_user_config(USER_EMAIL)
+        except Exception as e:
+            logger.warning(f"读取配置失败: {e}")
+            return
+        if not cfg:
+            return
+
+        # 身份相关配置无法热更新
+        if (cfg.get('target_address') or '').lower() != TARGET_ADDRESS.lower():
+            logger.warning(f"目标地址已改为 {cfg.get('target_address')}，需重启机器人后生效")
+
+        self.apply_settings(settings_from_config(cfg))
+
+    def reload_log_settings(self):
+        """从全局设置读取日志级别和采样参数 (看板 "运行日志" 中调整)"""
+        try:
+            level = db.get_app_setting('log_level')
+            sample_every = db.get_app_setting('log_sample_every')
+            rate = db.get_app_setting('log_rate_limit')
+        except Exception as e:
+            logger.warning(f"读取日志设置失败: {e}")
+            return
+        if level and set_log_level(level):
+            logger.warning(f"日志级别已调整为 {level.upper()}")
+        log_filter.configure(sample_every=sample_every, rate=rate)
+
+    def apply_settings(self, settings):
+        """应用新的运行参数 (保留缓存、映射和基准等状态)，返回发生变化的配置项"""
+        changed = {}
+        for name in HOT_RELOAD_SETTINGS:
+            if name in settings and globals()[name] != settings[name]:
+                changed[name] = (globals()[name], settings[name])
+        if not changed:
+            return changed
+
+        for name, (old, new) in changed.items():
+            globals()[name] = new
+            logger.info(f"配置已更新: {name} {old} -> {new}")
+
+        if 'SLIPPAGE' in changed:
+            self.executor.slippage = SLIPPAGE
+        if 'COPY_RATIO' in changed:
+            self.copy_tracker.copy_ratio = COPY_RATIO
+            self.pnl_engine.copy_ratio = COPY_RATIO
+        if 'POLL_INTERVAL' in changed:
+            self.failure_backoff.cap = POLL_INTERVAL
+        if 'SYNC_MODE' in changed and SYNC_MODE == 'order':
+            # 切换到 '仅同步下单' 时以当前仓位重新建立基准
+            self.initialized_baseline = False
+        if changed.keys() & {'COPY_RATIO', 'MARKET_TYPES', 'SYNC_PERP_ORDERS', 'SYNC_SPOT_ORDERS'}:
+            # 数量或挂单范围变化，下一轮强制重新对齐挂单
+            self.last_target_keys = None
+        return changed
+
     def get_sz_decimals(self, coin):
         """获取币种数量精度"""
         # Normalize coin name
@@ -215,50 +546,17 @@ class HyperliquidCopier:
     def get_user_state(self, address):
         # 模拟模式下，如果是查询我的地址，直接返回内存中的模拟状态
         if self.is_dry_run and address == self.my_address:
-             state = {'assetPositions': [], 'openOrders': []}
-             
-             # 构造持仓
-             # self.exchange 是 MockExchange 实例
-             for coin, szi in self.exchange.positions.items():
-                 if szi != 0:
-                     state['assetPositions'].append({
-                         'position': {
-                             'coin': coin,
-                             'szi': str(szi),
-                             'entryPx': 0.0
-                         }
-                     })
-             
-             # 构造挂单
-             state['openOrders'] = list(self.exchange.orders)
-             return state
-
-        state = {'assetPositions': [], 'openOrders': []}
+            return self.get_mock_state()
+
+        raw = {}
         success = True
+        # 我自己的状态直接请求最新数据: 同步依据过期的挂单快照会误判 "我的挂单已消失"
+        fresh = {'max_age': 0} if address == self.my_address else {}
         
         # 1. 获取现货状态
         if 'spot' in MARKET_TYPES:
             try:
-                raw_state = self.info.spot_user_state(address)
-                # 转换为统一格式
-                # Spot state: {'balances': [{'coin': 'PURR', 'total': '100.0', ...}]}
-                # Unified state: {'assetPositions': [{'position': {'coin': 'PURR', 'szi': '100.0'}}]}
-                for b in raw_state.get('balances', []):
-                    if b['coin'] == 'USDC':
-                        continue
-                    
-                    # Normalize coin name to Pair Name (e.g. PURR -> PURR/USDC)
-                    coin_name = b['coin']
-                    if coin_name in self.spot_token_to_pair:
-                        coin_name = self.spot_token_to_pair[coin_name]
-                    
-                    state['assetPositions'].append({
-                        'position': {
-                            'coin': coin_name,
-                            'szi': b['total'],
-                            'entryPx': 0.0, # 现货没有持仓均价概念(或API不返回)
-                        }
-                    })
+                raw['spot'] = self.info.spot_user_state(address, **fresh)
             except Exception as e:
                 logger.error(f"获取现货状态失败 {address}: {e}")
                 success = False
@@ -266,52 +564,98 @@ class HyperliquidCopier:
         # 2. 获取合约状态
         if 'perps' in MARKET_TYPES:
             try:
-                perp_state = self.info.user_state(address)
-                # 合约状态直接追加，不需要额外 normalize，除了过滤掉空仓位可能在外部做
-                if 'assetPositions' in perp_state:
-                    state['assetPositions'].extend(perp_state['assetPositions'])
+                raw['perps'] = self.info.user_state(address, **fresh)
             except Exception as e:
                 logger.error(f"获取合约状态失败 {address}: {e}")
                 success = False
 
-        # 3. 获取挂单并过滤
+        # 3. 获取挂单
         try:
-            orders = self.info.open_orders(address)
-            if address == self.my_address:
-                logger.info(f"[DEBUG] 原始挂单获取: {len(orders)} 个 | 地址: {address}")
-                
-            filtered_orders = []
-            for o in orders:
-                # Normalize coin name to Pair Name (e.g. PURR -> PURR/USDC)
-                # Ensure consistency with assetPositions and internal logic
-                original_coin = o['coin']
-                if o['coin'] in self.spot_token_to_pair:
-                    o['coin'] = self.spot_token_to_pair[o['coin']]
-
-                # If order coin is just "PURR", it might be Perp or Spot depending on context?
-                # Usually open_orders returns canonical names.
-                # If we are in Spot mode, we want Spot orders.
-                # If open_orders returns "PURR/USDC", then is_spot_asset is True.
-                # If it returns "PURR", is_spot_asset is False (Perp).
-                
-                is_spot = self.is_spot_asset(o['coin'])
-                
-                if address == self.my_address:
-                    logger.info(f"[DEBUG] 挂单检查: {original_coin} -> {o['coin']} | IsSpot: {is_spot} | MarketTypes: {MARKET_TYPES}")
-                
-                if 'spot' in MARKET_TYPES and is_spot:
-                    filtered_orders.append(o)
-                elif 'perps' in MARKET_TYPES and not is_spot:
-                    filtered_orders.append(o)
-            state['openOrders'] = filtered_orders
+            raw['orders'] = self.info.open_orders(address, **fresh)
         except Exception as e:
             logger.warning(f"获取挂单失败 {address}: {e}")
             # 挂单失败通常不致命，但也可能导致误撤单。安全起见，如果不完整，也视为失败。
-            state['openOrders'] = []
             success = False
-            
+
+        state = self.build_state(address, raw)
         return state if success else None
 
+    async def get_user_state_async(self, address):
+        """get_user_state 的异步版本: 现货/合约/挂单三个请求并发发出"""
+        if self.is_dry_run and address == self.my_address:
+            return self.get_mock_state()
+
+        calls = {}
+        if 'spot' in MARKET_TYPES:
+            calls['spot'] = self.async_info.spot_user_state(address)
+        if 'perps' in MARKET_TYPES:
+            calls['perps'] = self.async_info.user_state(address)
+        calls['orders'] = self.async_info.open_orders(address)
+
+        results = await asyncio.gather(*calls.values(), return_exceptions=True)
+        raw = {}
+        success = True
+        labels = {'spot': '现货状态', 'perps': '合约状态', 'orders': '挂单'}
+        for name, result in zip(calls.keys(), results):
+            if isinstance(result, Exception):
+                logger.error(f"获取{labels[name]}失败 {address}: {result}")
+                success = False
+            else:
+                raw[name] = result
+
+        state = self.build_state(address, raw)
+        return state if success else None
+
+    async def prime_mids_async(self):
+        """异步获取中间价并写入缓存，本轮同步中的 all_mids 调用直接命中"""
+        try:
+            self.info.prime('all_mids', (), await self.async_info.all_mids())
+        except Exception as e:
+            logger.warning(f"获取中间价失败: {e}")
+
+    async def get_fills_async(self):
+        """并发获取目标和我的最近成交，失败的一方返回 None (由 update_history 按同步方式重试)"""
+        addresses = [TARGET_ADDRESS] if self.is_dry_run else [TARGET_ADDRESS, self.my_address]
+        results = await asyncio.gather(*(self.async_info.user_fills(a) for a in addresses), return_exceptions=True)
+        fills = [None, None]
+        for i, (address, result) in enumerate(zip(addresses, results)):
+            if isinstance(result, Exception):
+                logger.warning(f"获取成交记录失败 {address}: {result}")
+            else:
+                fills[i] = result
+        return fills
+
+    def get_mock_state(self):
+        """模拟模式下我的账户状态 (来自 MockExchange 内存)"""
+        positions = {coin: Position(coin, szi) for coin, szi in self.exchange.positions.items() if szi != 0}
+        return AccountState(positions, [Order.from_api(o) for o in self.exchange.orders])
+
+    def build_state(self, address, raw):
+        """将原始 API 响应 (raw: spot / perps / orders) 解析为 AccountState (币种统一为交易对名，挂单按市场类型过滤)"""
+        orders = raw.get('orders', [])
+        is_mine = address == self.my_address
+        debug = is_mine and logger.isEnabledFor(logging.DEBUG)
+        counts = {'spot': 0, 'perps': 0, 'skipped': 0}
+
+        def keep_order(o):
+            is_spot = self.is_spot_asset(o.coin)
+            keep = ('spot' in MARKET_TYPES and is_spot) or ('perps' in MARKET_TYPES and not is_spot)
+            counts['spot' if is_spot else 'perps'] += keep
+            counts['skipped'] += not keep
+            if debug:
+                logger.debug("[DEBUG] 挂单检查: %s | IsSpot: %s | MarketTypes: %s", o.coin, is_spot, MARKET_TYPES,
+                             extra={'log_key': 'order_check'})
+            return keep
+
+        state = AccountState.from_api(raw.get('perps'), raw.get('spot'), orders, token_to_pair=self.spot_token_to_pair,
+                                      order_filter=keep_order, previous=self.last_states.get(address))
+        self.last_states[address] = state
+        if is_mine:
+            # 每轮一行汇总，逐个挂单的明细只在 DEBUG 级别按采样输出
+            logger.info(f"挂单检查 {len(orders)} 个 | 合约: {counts['perps']} | 现货: {counts['spot']} | "
+                        f"过滤: {counts['skipped']} | 地址: {address}")
+        return state
+
     def round_sz(self, coin, sz):
         """根据币种精度修剪数量"""
         decimals = self.get_sz_decimals(coin)
@@ -324,30 +668,31 @@ class HyperliquidCopier:
         # Hyperliquid API 返回的 px 字符串通常已经是标准化的
         return float(px)
 
+    def round_limit_px(self, coin, px):
+        """将计算得到的限价修剪为交易所接受的价格 (5 位有效数字，且小数位不超过 6/8 - szDecimals)"""
+        max_decimals = 8 if self.is_spot_asset(coin) else 6
+        return round(float(f"{px:.5g}"), max(max_decimals - self.get_sz_decimals(coin), 0))
+
     def sync_positions(self, target_state, my_state):
         """同步仓位 (市价单修补)"""
-        def parse_positions(state):
-            pos_map = {}
-            for p in state.get('assetPositions', []):
-                core = p.get('position', p)
-                coin = core.get('coin')
-                if coin:
-                    pos_map[coin] = float(core.get('szi', 0))
-            return pos_map
-
-        target_positions = parse_positions(target_state)
-        my_positions = parse_positions(my_state)
+        target_positions = target_state.position_sizes()
+        my_positions = my_state.position_sizes()
+        self.local_positions = my_positions.copy()
         
         # 模式2: 初始化基准
         if SYNC_MODE == 'order' and not self.initialized_baseline:
             self.target_baseline = target_positions.copy()
             self.my_baseline = my_positions.copy()
             self.initialized_baseline = True
+            self.journal_event('baseline', {'target': self.target_baseline, 'my': self.my_baseline})
             logger.info("已初始化 '仅同步下单' 模式的基准仓位，忽略初始差异。")
             return
 
         all_coins = set(target_positions.keys()) | set(my_positions.keys())
         
+        # 1. 计算每个币种需要的调整
+        reduces, increases = [], []
+        price_ctx = None
         for coin in all_coins:
             t_sz = target_positions.get(coin, 0.0)
             m_sz = my_positions.get(coin, 0.0)
@@ -369,7 +714,8 @@ class HyperliquidCopier:
             if abs(diff) < 0.0001:
                 continue
 
-            price_ctx = self.info.all_mids()
+            if price_ctx is None:
+                price_ctx = self.info.all_mids()
             current_price = float(price_ctx.get(coin, 0.0))
             if current_price == 0:
                 continue
@@ -385,24 +731,61 @@ class HyperliquidCopier:
                 if rounded_sz == 0:
                     continue
 
-                try:
-                    logger.info(f"[{coin}] 执行市价{'买入' if is_buy else '卖出'} {rounded_sz}")
-                    res = self.exchange.market_open(coin, is_buy, rounded_sz, current_price, SLIPPAGE)
-                    if res['status'] == 'ok':
-                        logger.info(f"[{coin}] 市价单成交")
-                    else:
-                        logger.error(f"[{coin}] 下单失败: {res}")
-                except Exception as e:
-                    logger.error(f"[{coin}] 下单异常: {e}")
+                action = (coin, t_sz, m_sz, is_buy, rounded_sz, current_price)
+                # 朝 0 方向调整 (且不穿过 0) 为减仓
+                if m_sz != 0 and (m_sz > 0) != is_buy and rounded_sz <= abs(m_sz):
+                    reduces.append(action)
+                else:
+                    increases.append(action)
+
+        # 2. 先减仓 (释放保证金)，再加仓；同一阶段内各币种并发执行
+        self.run_per_coin(reduces, self._adjust_position)
+        self.run_per_coin(increases, self._adjust_position)
+
+    def _adjust_position(self, coin, t_sz, m_sz, is_buy, rounded_sz, current_price):
+        """执行单个币种的仓位调整"""
+        self.journal_event('decision', {'coin': coin, 'target': t_sz, 'my': m_sz, 'is_buy': is_buy, 'sz': rounded_sz})
+
+        self.pnl_engine.note_reference(coin, current_price, int(time.time() * 1000))
+        try:
+            logger.info(f"[{coin}] 执行市价{'买入' if is_buy else '卖出'} {rounded_sz}")
+            filled = self.executor.execute(coin, is_buy, rounded_sz, current_price)
+            self.local_positions[coin] = m_sz + (filled if is_buy else -filled)
+        except Exception as e:
+            logger.error(f"[{coin}] 下单异常: {e}")
+
+    def run_per_coin(self, tasks, fn):
+        """按币种并发执行任务: 每个任务元组的第一个元素为币种，同一币种的任务按顺序在同一个线程中执行"""
+        if not tasks:
+            return
+        by_coin = {}
+        for task in tasks:
+            by_coin.setdefault(task[0], []).append(task)
+
+        def run_coin(coin_tasks):
+            for task in coin_tasks:
+                if fn(*task) is False:
+                    break  # 返回 False 表示该币种后续任务不再执行
+
+        if RECONCILE_WORKERS <= 1 or len(by_coin) == 1:
+            for coin_tasks in by_coin.values():
+                run_coin(coin_tasks)
+            return
+        futures = [self.reconcile_pool.submit(run_coin, coin_tasks) for coin_tasks in by_coin.values()]
+        for future in futures:
+            try:
+                future.result()
+            except Exception as e:
+                logger.error(f"并发同步出错: {e}")
 
     def sync_open_orders(self, target_state, my_state):
-        """同步挂单 (新逻辑: 优先清理，高价优先挂单，保证金检查，支持过滤)"""
-        target_orders = target_state.get('openOrders', [])
-        my_orders = my_state.get('openOrders', [])
+        """同步挂单 (基于 cloid 映射: 改单优先，撤销多余挂单，高价优先新挂单，保证金检查，支持过滤)"""
+        target_orders = target_state.orders
+        my_orders = my_state.orders
         
         # --- 过滤逻辑 (Local) ---
         def is_allowed_order(o):
-            is_spot = self.is_spot_asset(o['coin'])
+            is_spot = self.is_spot_asset(o.coin)
             if is_spot:
                 return SYNC_SPOT_ORDERS
             else:
@@ -413,37 +796,108 @@ class HyperliquidCopier:
         my_orders = [o for o in my_orders if is_allowed_order(o)]
         # -----------------------
 
-        # DEBUG LOG
-        # logger.info(f"[DEBUG] 同步检查 | 目标挂单数: {len(target_orders)} | 我的挂单数: {len(my_orders)}")
-        if len(my_orders) > 0:
-            pass
-            # logger.info(f"[DEBUG] 我的首个挂单: {my_orders[0]}")
-        
         # 1. 构建指纹映射
-        # 指纹: (coin, side, price) -> 详情
+        # 指纹: (coin, side, price, size) -> 详情 (包含数量，以便识别改量)
         def get_order_key(o):
-            return (o['coin'], o['side'], self.round_px(o['coin'], float(o['limitPx'])))
+            return (o.coin, o.side, self.round_px(o.coin, o.limit_px), o.sz)
 
         target_map = {get_order_key(o): o for o in target_orders}
-        my_map = {get_order_key(o): o for o in my_orders}
         
         # 2. 检测变化 (基于目标挂单的指纹集合)
         current_target_keys = set(target_map.keys())
         
         # 如果是第一次运行，或者 target_keys 发生了变化，则执行同步
         if self.last_target_keys == current_target_keys:
+            # 仍需通知合并窗口: 目标可能在挂起期间回到了已同步状态
+            self.order_coalescer.should_sync(self.last_target_keys, current_target_keys)
+            return
+
+        # 合并窗口: 等待目标挂单稳定后只同步最终状态
+        was_pending = self.order_coalescer.is_pending
+        if not self.order_coalescer.should_sync(self.last_target_keys, current_target_keys):
+            if not was_pending:
+                logger.info(f"检测到挂单变化，等待目标挂单稳定 (窗口 {ORDER_SETTLE_WINDOW}s，最长 {ORDER_SETTLE_MAX_WAIT}s)...")
             return
 
-        logger.info(f"检测到挂单变化，开始全量同步... (目标挂单数: {len(target_orders)})")
+        oc = self.order_coalescer
+        logger.info(f"检测到挂单变化，开始增量同步... (目标挂单数: {len(target_orders)} | 已映射: {len(self.order_links)})")
+        logger.info(f"合并统计 | 观察到变化: {oc.observed_changes} | 实际同步: {oc.resyncs} | 节省同步: {oc.saved}")
 
-        # 3. 取消我账户中已有的所有挂单
-        if my_orders:
-            cancels = [{"coin": o['coin'], "oid": o['oid']} for o in my_orders]
-            logger.info(f"取消我账户所有挂单 ({len(cancels)} 个)")
+        # 3. 对照映射生成操作计划: 保留 / 改单 / 撤单 / 新挂单
+        def desired(o):
+            return self.round_px(o.coin, o.limit_px), self.round_sz(o.coin, o.sz * COPY_RATIO)
+
+        target_by_key = {target_order_key(o): o for o in target_orders}
+        my_by_oid = {o.oid: o for o in my_orders}
+        my_by_cloid = {o.cloid: o for o in my_orders if o.cloid}
+
+        # 3.1 映射对应的我的挂单已不存在 (已成交或被撤)，标记为已消耗，目标挂单消失前不再补挂
+        self.order_links.release_consumed(target_by_key)
+        linked_oids = set()
+        linked_mine = {}  # target_key -> 我的挂单
+        for key, link in self.order_links.items():
+            mine = self.order_links.find_open_order(link, my_by_oid, my_by_cloid)
+            if mine is None:
+                self.order_links.consume(key)
+            else:
+                link['my_oid'] = mine.oid
+                linked_oids.add(mine.oid)
+                linked_mine[key] = mine
+
+        # 3.2 目标仍在的挂单: 价格或数量变化则改单
+        to_modify = []  # (target_key, target_order)
+        new_keys = []
+        for key, o in target_by_key.items():
+            link = self.order_links.get(key)
+            if link is None:
+                if not self.order_links.is_consumed(key):
+                    new_keys.append(key)
+            elif (link['limit_px'], link['sz']) != desired(o):
+                to_modify.append((key, o))
+
+        # 3.3 目标已消失的挂单: 同币种同方向、且价格或数量之一不变的新挂单视为目标改单 (oid 会变)，否则撤单
+        # (只按币种和方向匹配时，同方向的两个挂单可能互换映射)
+        to_cancel = []
+        for key, link in self.order_links.items():
+            if key in target_by_key:
+                continue
+            candidates = [k for k in new_keys
+                          if target_by_key[k].coin == link['coin'] and target_by_key[k].side == link['side']
+                          and (desired(target_by_key[k])[0] == link['limit_px']
+                               or desired(target_by_key[k])[1] == link['sz'])]
+            if candidates:
+                best = min(candidates, key=lambda k: abs(target_by_key[k].limit_px - link['limit_px']))
+                new_keys.remove(best)
+                self.order_links.relink(key, best)
+                if key in linked_mine:
+                    linked_mine[best] = linked_mine.pop(key)
+                to_modify.append((best, target_by_key[best]))
+            else:
+                to_cancel.append({"coin": link['coin'], "oid": link['my_oid']})
+                self.order_links.unlink(key)
+
+        # 3.4 我账户中没有映射的挂单 (手动挂单或映射丢失) 一并撤销
+        for o in my_orders:
+            if o.oid not in linked_oids:
+                to_cancel.append({"coin": o.coin, "oid": o.oid})
+
+        logger.info(f"同步计划 | 改单: {len(to_modify)} | 撤单: {len(to_cancel)} | 新挂单: {len(new_keys)}")
+
+        # 本地保证金模型: 预估撤单/改单后的可用保证金，只发送预计能成功的新挂单
+        margin = MarginModel(my_state, MARGIN_DEFAULT_LEVERAGE, MARGIN_BUFFER,
+                             pair_to_token={v: k for k, v in self.spot_token_to_pair.items()})
+
+        # 4. 撤单 (先撤，释放保证金)
+        if to_cancel:
+            logger.info(f"撤销挂单 ({len(to_cancel)} 个)")
             try:
-                res = self.exchange.bulk_cancel(cancels)
+                res = self.exchange.bulk_cancel(to_cancel)
                 if res['status'] == 'ok':
                     logger.info("撤单请求已发送")
+                    for c in to_cancel:
+                        o = my_by_oid.get(c['oid'])
+                        if o:
+                            margin.release(o.coin, o.is_buy, o.limit_px, o.sz, self.is_spot_asset(o.coin))
                 else:
                     logger.error(f"撤单请求失败: {res}")
                 
@@ -452,39 +906,113 @@ class HyperliquidCopier:
             except Exception as e:
                 logger.error(f"撤单异常: {e}")
 
-        # 4. 准备下单列表 (全部目标挂单)
-        to_create = list(target_orders)
+        # 5. 改单 (一次 bulk_modify，保留队列位置)
+        modify_requests = []
+        modify_keys = []
+        modify_sizes = {}  # target_key -> (实际改单数量, 累计已成交)
+        for key, o in to_modify:
+            px, sz = desired(o)
+            link = self.order_links.get(key)
+            if sz == 0:
+                # 按比例缩小后数量为 0，无法改单，直接撤销
+                self._cancel_linked(key, link)
+                continue
+            # 我的挂单已部分成交: 改单数量扣除成交量 (目标同期成交的部分已体现在目标剩余量中，不重复扣除)
+            mine = linked_mine.get(key)
+            filled = link.get('filled', 0.0) + (mine.filled_sz if mine is not None else 0.0)
+            excess = max(filled - o.filled_sz * COPY_RATIO, 0.0)
+            send_sz = self.round_sz(o.coin, sz - excess)
+            if send_sz <= 0:
+                # 已成交的数量已覆盖目标挂单，撤销剩余部分且不再补挂
+                self._cancel_linked(key, link)
+                self.order_links.consume(key)
+                continue
+            modify_sizes[key] = (send_sz, filled)
+            cloid = Cloid.from_str(link['cloid'])
+            modify_requests.append({
+                "oid": cloid,
+                "order": {
+                    "coin": o.coin,
+                    "is_buy": o.is_buy,
+                    "sz": send_sz,
+                    "limit_px": px,
+                    "order_type": {"limit": {"tif": "Gtc"}},
+                    "reduce_only": False,
+                    "cloid": cloid
+                }
+            })
+            modify_keys.append(key)
+
+        if modify_requests:
+            logger.info(f"批量改单 ({len(modify_requests)} 个)")
+            try:
+                res = self.exchange.bulk_modify_orders_new(modify_requests)
+                if res['status'] == 'ok':
+                    statuses = res['response']['data']['statuses']
+                    for i, key in enumerate(modify_keys):
+                        status = statuses[i] if i < len(statuses) else {}
+                        o = target_by_key[key]
+                        if 'error' in status:
+                            # 改单失败 (通常是我的订单刚成交/被撤)，与 3.1 相同处理，不再补挂
+                            logger.error(f"改单业务错误: {o.coin} {status['error']}")
+                            self.order_links.consume(key)
+                        else:
+                            px, sz = desired(o)
+                            send_sz, filled = modify_sizes[key]
+                            link = self.order_links.get(key)
+                            mine = linked_mine.get(key)
+                            is_spot = self.is_spot_asset(o.coin)
+                            margin.release(o.coin, o.is_buy, link['limit_px'], mine.sz if mine is not None else link['sz'],
+                                           is_spot)
+                            margin.reserve(o.coin, o.is_buy, px, send_sz, is_spot)
+                            my_oid = self._status_oid(status)
+                            # 改单生成新订单 (origSz 重新计算)，之前的成交量记入映射
+                            self.order_links.link(key, link['cloid'], my_oid if my_oid is not None else link['my_oid'],
+                                                  o.coin, o.side, px, sz, filled=filled)
+                else:
+                    logger.error(f"改单请求失败: {res}")
+            except Exception as e:
+                logger.error(f"改单异常: {e}")
+
+        # 6. 准备新挂单列表
+        to_create = [target_by_key[k] for k in new_keys]
         
         if not to_create:
-            self.last_target_keys = current_target_keys
+            self.set_target_keys(current_target_keys)
             return
 
-        # 5. 排序: 从高价往低价 (Price DESC)
-        # key 结构: (coin, side, price)
-        # 这里直接用 target_order 对象排序
-        to_create.sort(key=lambda x: self.round_px(x['coin'], float(x['limitPx'])), reverse=True)
-        
-        # 6. 逐个下单直到保证金不足
-        logger.info(f"计划执行 {len(to_create)} 个挂单，按价格从高到低...")
+        # 7. 按优先级排序，并用本地保证金模型挑出放得下的挂单
+        to_create = self._prioritize_orders(to_create)
+        planned = []
+        for o in to_create:
+            px, sz = desired(o)
+            planned.append((o, o.coin, o.is_buy, px, sz, self.is_spot_asset(o.coin)))
+        to_create, skipped = margin.select(planned)
+        if skipped:
+            logger.warning(f"⚠️ 预估保证金/余额不足，跳过 {len(skipped)} 个挂单 (优先级: {ORDER_PRIORITY})")
         
-        for target_order in to_create:
-            coin = target_order['coin']
-            side = target_order['side']
-            px = self.round_px(coin, float(target_order['limitPx']))
-            
-            # 计算跟单数量
-            target_sz = float(target_order['sz'])
-            sz_to_place = self.round_sz(coin, target_sz * COPY_RATIO)
+        # 8. 下单: 同一币种按优先级顺序逐个下单，不同币种并发 (保留保证金错误兜底)
+        logger.info(f"计划执行 {len(to_create)} 个挂单 (优先级: {ORDER_PRIORITY})...")
+        margin_exhausted = threading.Event()
+
+        def place(coin, target_order):
+            if margin_exhausted.is_set():
+                return False
+            side = target_order.side
+            px, sz_to_place = desired(target_order)
             
             if sz_to_place == 0:
-                continue
+                return
 
             is_buy = (side == 'B')
+            key = target_order_key(target_order)
+            cloid = self.order_links.make_cloid(key)
             
             try:
                 # 检查日志避免刷屏
                 logger.info(f"尝试挂单: {coin} {side} {sz_to_place} @ {px}")
-                res = self.exchange.order(coin, is_buy, sz_to_place, px, {"limit": {"tif": "Gtc"}})
+                res = self.exchange.order(coin, is_buy, sz_to_place, px, {"limit": {"tif": "Gtc"}},
+                                          cloid=Cloid.from_str(cloid))
                 
                 if res['status'] == 'ok':
                     status = res['response']['data']['statuses'][0]
@@ -494,118 +1022,407 @@ class HyperliquidCopier:
                         # 检查是否为 margin 相关错误
                         if 'Margin' in err_msg or 'balance' in err_msg.lower():
                             logger.warning("⚠️ 保证金不足，停止继续挂单")
-                            break
+                            margin_exhausted.set()
+                            return False
                     else:
-                        pass # 成功
+                        # 成功: 记录映射
+                        self.order_links.link(key, cloid, self._status_oid(status), coin, side, px, sz_to_place)
                 else:
                     logger.error(f"挂单请求失败: {res}")
             except Exception as e:
                 logger.error(f"挂单异常: {e}")
                 if 'margin' in str(e).lower():
                     logger.warning("⚠️ 捕获保证金异常，停止继续挂单")
-                    break
+                    margin_exhausted.set()
+                    return False
             
             # 稍微间隔一下避免速率限制
             time.sleep(0.1)
 
+        self.run_per_coin([(o.coin, o) for o in to_create], place)
+
         # 更新状态指纹
-        self.last_target_keys = current_target_keys
+        self.set_target_keys(current_target_keys)
+
+    def _prioritize_orders(self, orders):
+        """按 ORDER_PRIORITY 对待下挂单排序 (保证金有限时排在前面的优先)"""
+        if ORDER_PRIORITY == 'notional':
+            return sorted(orders, key=lambda o: o.notional, reverse=True)
+        if ORDER_PRIORITY == 'mid':
+            try:
+                mids = self.info.all_mids()
+            except Exception as e:
+                logger.warning(f"获取中间价失败，按价格排序: {e}")
+                mids = {}
+            def distance(o):
+                mid = float(mids.get(o.coin, 0) or 0)
+                if mid <= 0:
+                    return float('inf')
+                return abs(o.limit_px - mid) / mid
+            return sorted(orders, key=distance)
+        # 默认: 从高价往低价 (Price DESC)
+        return sorted(orders, key=lambda o: self.round_px(o.coin, o.limit_px), reverse=True)
+
+    def _status_oid(self, status):
+        """从下单/改单返回的 status 中提取订单 oid"""
+        for k in ('resting', 'filled'):
+            if k in status and 'oid' in status[k]:
+                return status[k]['oid']
+        return None
+
+    def _cancel_linked(self, key, link):
+        """撤销映射对应的我的挂单并删除映射"""
+        try:
+            if link.get('my_oid') is not None:
+                self.exchange.bulk_cancel([{"coin": link['coin'], "oid": link['my_oid']}])
+        except Exception as e:
+            logger.error(f"撤单异常: {e}")
+        self.order_links.unlink(key)
 
-    def update_history(self, target_state):
-        """更新历史记录到数据库"""
+    def update_history(self, target_state, fills=None, my_fills=None):
+        """更新历史记录到数据库 (fills / my_fills 为异步引擎预先取回的目标/我的成交，None 时在此获取)"""
         try:
+            # 0. 首轮用持仓快照校准盈亏账本 (快照之后的成交再逐笔累加)
+            snapshot_ms = self.last_reconciled_ms or int(time.time() * 1000)
+            self.pnl_engine.seed_positions('target', target_state.positions, snapshot_ms)
+            my_state = self.get_mock_state() if self.is_dry_run else self.last_states.get(self.my_address)
+            if my_state is not None:
+                self.pnl_engine.seed_positions('follower', my_state.positions, snapshot_ms)
+
             # 1. 记录挂单
             # 注意: 这里只记录看到的 open orders。如果需要记录 cancel/fill，需要更复杂的逻辑或 stream。
             # 目前只记录出现过的挂单 (oid 唯一)
-            for o in target_state['openOrders']:
-                if o['oid'] not in self.seen_oids:
-                    db.log_order(TARGET_ADDRESS, o)
-                    self.seen_oids.add(o['oid'])
+            # 已归档日期内的数据不再写入 (重启后去重集合为空，旧挂单/成交会再次出现)
+            for o in target_state.orders:
+                if o.oid not in self.seen_oids:
+                    if o.timestamp >= self.archived_until['orders']:
+                        db.log_order(TARGET_ADDRESS, o.to_api())
+                    self.seen_oids.add(o.oid)
             
-            # 2. 记录持仓 (仅当发生变化时)
-            # 过滤掉 szi=0 的空仓位
-            # 注意: p 可能是 {'position': {...}} 结构，也可能是扁平结构(取决于构造方式)
-            # 统一取 core
-            current_positions = {}
-            for p in target_state['assetPositions']:
-                core = p.get('position', p)
-                if float(core.get('szi', 0)) != 0:
-                    current_positions[core['coin']] = core
-
-            for coin, pos in current_positions.items():
+            # 2. 记录持仓 (仅当数量或入场价变化时，过滤掉 szi=0 的空仓位)
+            for coin, pos in target_state.positions.items():
+                if pos.szi == 0:
+                    continue
                 prev_pos = self.last_position_snapshot.get(coin)
-                # 检查是否发生变化 (数量或入场价)
-                is_changed = False
-                if not prev_pos:
-                    is_changed = True
-                else:
-                    if float(prev_pos['szi']) != float(pos['szi']):
-                        is_changed = True
-                    elif float(prev_pos.get('entryPx', 0)) != float(pos.get('entryPx', 0)):
-                        is_changed = True
-                
-                if is_changed:
-                    db.log_position(TARGET_ADDRESS, pos)
-                    self.last_position_snapshot[coin] = pos.copy()
+                if prev_pos is None or prev_pos.szi != pos.szi or prev_pos.entry_px != pos.entry_px:
+                    db.log_position(TARGET_ADDRESS, pos.to_api())
+                    self.last_position_snapshot[coin] = pos
+                    self.journal_event('positions', {coin: pos.to_api()})
 
             # 3. 记录成交
             # user_fills 接口获取最近成交
-            fills = []
-            max_retries = 3
-            for i in range(max_retries):
+            if fills is None:
+                fills = []
+                max_retries = 3
                 try:
-                    fills = self.info.user_fills(TARGET_ADDRESS)
-                    break
+                    fills = retry_with_backoff(lambda: self.info.user_fills(TARGET_ADDRESS), retries=max_retries)
                 except Exception as e:
-                    if i == max_retries - 1:
-                        logger.warning(f"获取成交记录失败 (重试{max_retries}次后放弃): {e}")
-                    else:
-                        time.sleep(1)
+                    logger.warning(f"获取成交记录失败 (重试{max_retries}次后放弃): {e}")
 
             for fill in fills:
-                # 构建唯一标识，SDK 返回的 fill可能有 hash，也可能没有，用 tid+coin 兜底
-                # 注意: fill 结构可能随 SDK 版本变化，这里做一定容错
-                fill_hash = fill.get('hash') or f"{fill.get('tid')}_{fill.get('coin')}"
+                # 唯一标识按 tid (同一笔交易的部分成交共用 hash)，没有 tid 时用 hash
+                fill_hash = fill_id(fill)
                 
                 if fill_hash not in self.seen_fill_hashes:
-                    db.log_trade(TARGET_ADDRESS, fill)
+                    if int(fill['time']) >= self.archived_until['trades']:
+                        db.log_trade(TARGET_ADDRESS, fill)
                     self.seen_fill_hashes.add(fill_hash)
+                    self.copy_tracker.add_target_fill(fill)
+                    self.pnl_engine.add_fill('target', fill)
+
+            # 4. 记录我的成交，并与目标成交配对统计跟单延迟/误差
+            self.update_follower_history(my_fills)
+
+            # 5. 把新记录的成交/持仓快照累加到时间桶汇总 (只更新受影响的桶)
+            db.update_history_rollups()
+
+            # 6. 刷新盈亏账本的标记价和资金费，写回有变化的币种
+            self.update_pnl()
                     
         except Exception as e:
             # 历史记录错误不应中断主流程
             logger.error(f"历史记录更新失败: {e}")
 
+    def update_follower_history(self, my_fills=None):
+        """记录我的新成交，并刷新跟单延迟/误差统计"""
+        if self.is_dry_run:
+            my_fills = list(self.exchange.fills)
+        elif my_fills is None:
+            try:
+                my_fills = self.info.user_fills(self.my_address, max_age=0)
+            except Exception as e:
+                logger.warning(f"获取我的成交记录失败: {e}")
+                my_fills = []
+
+        for fill in self.my_fill_cursor.accept(my_fills):
+            db.log_follower_trade(self.my_address, TARGET_ADDRESS, fill)
+            self.copy_tracker.add_follower_fill(fill)
+            self.pnl_engine.add_fill('follower', fill)
+
+        for row in self.copy_tracker.process(int(time.time() * 1000)):
+            self.pnl_engine.add_match(row)
+            if row['lag_ms'] is None:
+                logger.warning(f"[跟单统计] [{row['coin']}] 目标成交 {row['target_sz']} @ {row['target_px']} 未在窗口内跟上")
+            else:
+                logger.info(f"[跟单统计] [{row['coin']}] 延迟 {row['lag_ms']}ms | 价差 {row['price_diff_bps']:.1f}bps | "
+                            f"数量误差 {row['size_error'] * 100:.1f}%")
+
+    def update_pnl(self):
+        """刷新跟单盈亏账本: 标记价每轮更新，资金费按 FUNDING_POLL_INTERVAL 增量拉取"""
+        try:
+            self.pnl_engine.update_marks(self.info.all_mids())
+        except Exception as e:
+            logger.warning(f"获取标记价失败: {e}")
+
+        if time.time() - self.last_funding_poll >= FUNDING_POLL_INTERVAL:
+            self.last_funding_poll = time.time()
+            accounts = [('target', TARGET_ADDRESS)]
+            if not self.is_dry_run:
+                accounts.append(('follower', self.my_address))
+            for account, address in accounts:
+                start = self.pnl_engine.funding_cursor.get(account, self.pnl_engine.start_ms) + 1
+                try:
+                    self.pnl_engine.add_funding(account, self.info.user_funding_history(address, start))
+                except Exception as e:
+                    logger.warning(f"获取资金费记录失败 ({account}): {e}")
+
+        self.pnl_engine.flush()
+
+    # --- 历史归档 ---
+
+    def start_history_archiver(self):
+        """后台定期把过期的历史数据移到归档并回收 history.db 空间 (不阻塞主循环)"""
+        if HISTORY_HOT_DAYS <= 0:
+            return
+
+        def loop():
+            while True:
+                try:
+                    archive_history(HISTORY_HOT_DAYS, HISTORY_ARCHIVE_DIR)
+                    self.refresh_archived_until()
+                except Exception as e:
+                    logger.warning(f"历史数据归档失败: {e}")
+                time.sleep(ARCHIVE_INTERVAL_HOURS * 3600)
+
+        threading.Thread(target=loop, daemon=True, name='history-archiver').start()
+
+    def refresh_archived_until(self):
+        """各历史表已归档到的时间 (ms)，早于它的挂单/成交不再写入 history.db"""
+        self.archived_until = {name: archived_until(HISTORY_ARCHIVE_DIR, name) for name in ('orders', 'trades')}
+
+    # --- 快速跟随通道 ---
+
+    def start_fast_path(self):
+        """启动目标成交的快速跟随通道 (ws: 订阅成交推送，poll: 按成交游标高频拉取)"""
+        if FAST_PATH not in ('ws', 'poll'):
+            return
+        self.fill_cursor = FillCursor(start_ms=int(time.time() * 1000))
+        if FAST_PATH == 'ws':
+            self.ws_info = Info(constants.MAINNET_API_URL, skip_ws=False)
+            self.ws_info.subscribe({"type": "userFills", "user": TARGET_ADDRESS}, self._on_fills_message)
+        else:
+            threading.Thread(target=self._fast_path_poll_loop, daemon=True, name='fast-path').start()
+        logger.info(f"快速跟随通道已启动 ({FAST_PATH})")
+
+    def _on_fills_message(self, msg):
+        data = msg.get('data', {})
+        # 订阅建立时推送的历史快照不跟
+        if data.get('isSnapshot'):
+            return
+        try:
+            self.on_target_fills(data.get('fills', []))
+        except Exception as e:
+            logger.error(f"[快速通道] 处理成交推送出错: {e}")
+
+    def _fast_path_poll_loop(self):
+        while True:
+            try:
+                fills = self.info.user_fills_by_time(TARGET_ADDRESS, self.fill_cursor.cursor)
+                self.on_target_fills(fills)
+            except Exception as e:
+                logger.warning(f"[快速通道] 获取成交失败: {e}")
+            time.sleep(FAST_PATH_POLL_INTERVAL)
+
+    def on_target_fills(self, fills):
+        for fill in self.fill_cursor.accept(fills):
+            self.mirror_fill(fill)
+
+    def mirror_fill(self, fill):
+        """按比例立即跟随目标的一笔成交 (IOC)，仓位偏差由下一轮全量同步修正"""
+        coin = fill['coin']
+        is_spot = self.is_spot_asset(coin)
+        if ('spot' if is_spot else 'perps') not in MARKET_TYPES:
+            return
+        if SYNC_MODE == 'order' and not self.initialized_baseline:
+            return
+
+        is_buy = fill['side'] == 'B'
+        px = float(fill['px'])
+        sz = float(fill['sz']) * COPY_RATIO
+
+        with self.trade_lock:
+            if int(fill['time']) <= self.last_reconciled_ms:
+                return  # 已被全量同步覆盖
+            my_pos = self.local_positions.get(coin, 0.0)
+
+            # 目标减仓时，最多平掉我当前同方向的持仓，避免反向开仓
+            start_pos = float(fill.get('startPosition', 0) or 0)
+            target_reducing = start_pos != 0 and (start_pos > 0) != is_buy
+            if target_reducing:
+                closable = max(-my_pos, 0.0) if is_buy else max(my_pos, 0.0)
+                sz = min(sz, closable)
+
+            sz = self.round_sz(coin, sz)
+            if sz == 0 or sz * px < POSITION_DIFF_THRESHOLD_USD:
+                return
+
+            limit_px = self.round_limit_px(coin, px * (1 + SLIPPAGE) if is_buy else px * (1 - SLIPPAGE))
+            lag_ms = int(time.time() * 1000) - int(fill['time'])
+            self.pnl_engine.note_reference(coin, px, int(time.time() * 1000))
+            logger.info(f"[快速通道] [{coin}] 目标成交 {fill['side']} {fill['sz']} @ {fill['px']} -> "
+                        f"IOC {'买入' if is_buy else '卖出'} {sz} @ {limit_px} (延迟 {lag_ms}ms)")
+            try:
+                res = self.exchange.order(coin, is_buy, sz, limit_px, {"limit": {"tif": "Ioc"}},
+                                          reduce_only=target_reducing and not is_spot)
+            except Exception as e:
+                logger.error(f"[快速通道] [{coin}] 下单异常: {e}")
+                return
+            if res['status'] != 'ok':
+                logger.error(f"[快速通道] [{coin}] 下单失败: {res}")
+                return
+
+            filled_sz, filled_px = parse_fills(res)
+            if filled_sz:
+                self.local_positions[coin] = my_pos + (filled_sz if is_buy else -filled_sz)
+            self.journal_event('decision', {'coin': coin, 'source': 'fast_path', 'fill': fill_id(fill),
+                                            'is_buy': is_buy, 'sz': sz, 'filled': filled_sz})
+
+    # --- 主循环 ---
+
+    def tick(self):
+        """一轮全量同步，返回目标状态 (获取失败返回 None)
+
+        持有交易锁，避免与快速跟随通道的下单交错 (否则可能基于旧快照重复调仓)。
+        """
+        with self.trade_lock:
+            # 1. 获取目标状态
+            target_state = self.get_user_state(TARGET_ADDRESS)
+            # 水位取在快照返回之后: 请求途中发生的成交已包含在快照里，不能再由快速通道跟一次
+            # (返回后才被计入快照时间之前的成交会漏跟，由下一轮全量同步补齐，只会晚跟不会重复)
+            snapshot_ms = int(time.time() * 1000)
+            
+            if target_state is None:
+                logger.warning(f"获取目标状态失败 (可能由于网络或API限制)，跳过本次同步")
+                return None
+
+            # 2. 获取我的状态
+            my_state = self.get_user_state(self.my_address)
+            
+            if my_state is None:
+                logger.warning(f"获取我的状态失败 (可能由于网络或API限制)，跳过本次同步")
+                return target_state, False
+            
+            # 3. 执行同步
+            self.sync_positions(target_state, my_state)
+            self.sync_open_orders(target_state, my_state)
+            self.last_reconciled_ms = snapshot_ms
+            return target_state, True
+
     def run(self):
         logger.info("跟单程序已启动...")
+        self.start_fast_path()
+        self.start_history_archiver()
         while True:
+            ok = False
             try:
-                # 1. 获取目标状态
-                target_state = self.get_user_state(TARGET_ADDRESS)
-                
-                if target_state is None:
-                    logger.warning(f"获取目标状态失败 (可能由于网络或API限制)，跳过本次同步")
-                    time.sleep(POLL_INTERVAL)
-                    continue
-
-                # 更新历史记录
-                self.update_history(target_state)
+                # 0. 应用运行中修改的配置
+                self.maybe_reload_config()
 
-                # 2. 获取我的状态
-                my_state = self.get_user_state(self.my_address)
-                
-                if my_state is None:
-                    logger.warning(f"获取我的状态失败 (可能由于网络或API限制)，跳过本次同步")
-                    time.sleep(POLL_INTERVAL)
-                    continue
-                
-                # 3. 执行同步
-                self.sync_positions(target_state, my_state)
-                self.sync_open_orders(target_state, my_state)
-                
+                result = self.tick()
+                if result is not None:
+                    target_state, ok = result
+                    # 更新历史记录 (不占用交易锁)
+                    self.update_history(target_state)
             except Exception as e:
                 logger.error(f"轮询出错: {e}")
-            
-            time.sleep(POLL_INTERVAL)
+                ok = True  # 非网络错误，按正常间隔重试
+
+            if not ok:
+                time.sleep(self.failure_backoff.next())
+                continue
+            self.failure_backoff.reset()
+            time.sleep(self.order_coalescer.poll_interval(POLL_INTERVAL))
+
+    async def run_async(self):
+        """异步主循环: 状态、中间价和成交通过 AsyncInfo 并发获取；下单/撤单由事件循环上的 AsyncExchange 执行"""
+        from async_client import AsyncExchange, AsyncHTTPEngine, AsyncInfo, LoopExchange
+
+        engine = AsyncHTTPEngine(constants.MAINNET_API_URL, max_per_host=HTTP_MAX_PER_HOST, timeout=HTTP_TIMEOUT)
+        self.async_info = AsyncInfo(engine, breaker=self.info_breaker)
+        sync_exchange = self.exchange.exchange
+        if not self.is_dry_run:
+            # 同步逻辑在工作线程中执行，其中的下单/撤单提交回事件循环 (ThrottledExchange 的在途限制仍然生效)
+            try:
+                await self.async_info.load_meta()
+                async_exchange = AsyncExchange(engine, self.account, self.async_info, account_address=self.my_address)
+                self.exchange.exchange = LoopExchange(async_exchange, sync_exchange, asyncio.get_running_loop(),
+                                                      timeout=HTTP_TIMEOUT * 3)
+            except Exception as e:
+                logger.warning(f"加载元数据失败，下单/撤单使用同步 Exchange: {e}")
+        logger.info("跟单程序已启动 (异步引擎)...")
+        self.start_fast_path()
+        self.start_history_archiver()
+        try:
+            while True:
+                ok = False
+                try:
+                    # 0. 应用运行中修改的配置
+                    self.maybe_reload_config()
+
+                    await asyncio.to_thread(self.trade_lock.acquire)
+                    try:
+                        # 1. 并发获取目标和我的状态 (水位取在快照返回之后，见 tick)
+                        target_state, my_state, _ = await asyncio.gather(
+                            self.get_user_state_async(TARGET_ADDRESS),
+                            self.get_user_state_async(self.my_address),
+                            self.prime_mids_async()
+                        )
+                        snapshot_ms = int(time.time() * 1000)
+
+                        if target_state is None:
+                            logger.warning(f"获取目标状态失败 (可能由于网络或API限制)，跳过本次同步")
+                        elif my_state is None:
+                            logger.warning(f"获取我的状态失败 (可能由于网络或API限制)，跳过本次同步")
+                        else:
+                            # 2. 执行同步
+                            await asyncio.to_thread(self.sync_positions, target_state, my_state)
+                            await asyncio.to_thread(self.sync_open_orders, target_state, my_state)
+                            self.last_reconciled_ms = snapshot_ms
+                            ok = True
+                    finally:
+                        self.trade_lock.release()
+
+                    # 更新历史记录 (不占用交易锁)，目标和我的成交并发获取
+                    if target_state is not None:
+                        fills, my_fills = await self.get_fills_async()
+                        await asyncio.to_thread(self.update_history, target_state, fills, my_fills)
+
+                except Exception as e:
+                    logger.error(f"轮询出错: {e}")
+                    ok = True
+
+                if not ok:
+                    await asyncio.sleep(self.failure_backoff.next())
+                    continue
+                self.failure_backoff.reset()
+                await asyncio.sleep(self.order_coalescer.poll_interval(POLL_INTERVAL))
+        finally:
+            self.exchange.exchange = sync_exchange
+            await engine.close()
 
 if __name__ == "__main__":
-    HyperliquidCopier().run()
+    copier = HyperliquidCopier()
+    if ASYNC_ENGINE:
+        asyncio.run(copier.run_async())
+    else:
+        copier.run()
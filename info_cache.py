@@ -0,0 +1,129 @@
+import time
+import threading
+from collections import OrderedDict
+
+import database as db
+
+# 各接口默认缓存有效期 (秒)
+DEFAULT_TTLS = {
+    'user_state': 2.0,
+    'spot_user_state': 2.0,
+    'open_orders': 2.0,
+    'user_fills': 5.0,
+    'all_mids': 1.0,
+}
+
+
+class _Flight:
+    """一个正在进行中的请求，相同请求的其他调用方等待它的结果"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class CachedInfo:
+    """Info 的缓存代理
+
+    - 按接口设置 TTL，调用方可通过 max_age 参数指定自己能接受的陈旧程度
+    - 相同参数的并发请求只发一次 (single-flight)，其余调用方共享结果
+    - 内存缓存条目数有上限，按 LRU 淘汰
+    - shared=True 时同时读写跨进程共享缓存 (api_cache.db)，
+      看板可以直接复用机器人刚取到的数据
+
+    未被缓存的属性/方法原样转发给底层 Info。返回的对象在调用方之间共享，不应修改。
+    """
+
+    def __init__(self, info, ttls=None, max_entries=256, shared=False):
+        self.info = info
+        self.ttls = dict(DEFAULT_TTLS, **(ttls or {}))
+        self.max_entries = max_entries
+        self.shared = shared
+        self._cache = OrderedDict()  # key -> (fetched_at, value)
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'shared_hits': 0, 'coalesced': 0, 'misses': 0}
+        if shared:
+            db.init_api_cache_db()
+
+    def __getattr__(self, name):
+        attr = getattr(self.info, name)
+        if name in self.ttls and callable(attr):
+            def cached_call(*args, max_age=None):
+                return self._call(name, args, max_age)
+            return cached_call
+        return attr
+
+    def _shared_key(self, key):
+        return ':'.join(str(k) for k in key)
+
+    def _call(self, name, args, max_age):
+        key = (name,) + tuple(args)
+        ttl = self.ttls[name] if max_age is None else max_age
+        now = time.time()
+
+        # 1. 内存缓存
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry and now - entry[0] <= ttl:
+                self._cache.move_to_end(key)
+                self.stats['hits'] += 1
+                return entry[1]
+
+            # 2. 相同请求正在进行中，等待其结果
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                self._inflight[key] = flight
+            else:
+                self.stats['coalesced'] += 1
+
+        if not leader:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            # 3. 跨进程共享缓存
+            cached = db.load_api_cache(self._shared_key(key), ttl) if self.shared else None
+            if cached is not None:
+                fetched_at, value = cached
+                self.stats['shared_hits'] += 1
+            else:
+                value = getattr(self.info, name)(*args)
+                fetched_at = time.time()
+                self.stats['misses'] += 1
+                if self.shared:
+                    db.save_api_cache(self._shared_key(key), value, fetched_at)
+            self._store(key, fetched_at, value)
+            flight.value = value
+            return value
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight.event.set()
+
+    def _store(self, key, fetched_at, value):
+        with self._lock:
+            self._cache[key] = (fetched_at, value)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+
+    def prime(self, name, args, value):
+        """写入在别处取到的结果 (如异步引擎并发取回的数据)，TTL 内的同步调用直接命中"""
+        self._store((name,) + tuple(args), time.time(), value)
+
+    def invalidate(self, name=None, *args):
+        """清除缓存 (不带参数时清空全部)"""
+        with self._lock:
+            if name is None:
+                self._cache.clear()
+            else:
+                self._cache.pop((name,) + tuple(args), None)
@@ -0,0 +1,92 @@
+import time
+import logging
+import threading
+
+# 界面/配置中使用的日志级别名称
+LOG_LEVELS = ['DEBUG', 'INFO', 'WARNING', 'ERROR']
+
+# 第三方库的日志不跟随调到 DEBUG (连接池等明细没有排查价值)
+QUIET_LIBRARIES = ('urllib3', 'websocket', 'asyncio', 'aiohttp')
+
+
+class SampledLogFilter(logging.Filter):
+    """按消息键采样和限流的日志过滤器
+
+    只处理带 log_key 的记录 (logger.debug(..., extra={'log_key': 'order_check'}))，其余记录原样放行:
+      - 采样: 同一个键每 sample_every 条只输出 1 条
+      - 限流: 同一个键每 period 秒最多输出 rate 条 (rate <= 0 表示不限)
+    被丢弃的条数会附在该键下一条输出的日志末尾，避免静默丢失。
+    """
+
+    def __init__(self, sample_every=1, rate=0, period=60.0):
+        super().__init__()
+        self.sample_every = sample_every
+        self.rate = rate
+        self.period = period
+        self._keys = {}  # log_key -> [seen, window_start, emitted_in_window, suppressed]
+        self._lock = threading.Lock()
+
+    def configure(self, sample_every=None, rate=None, period=None):
+        with self._lock:
+            if sample_every is not None:
+                self.sample_every = max(int(sample_every), 1)
+            if rate is not None:
+                self.rate = int(rate)
+            if period is not None:
+                self.period = float(period)
+
+    def filter(self, record):
+        key = getattr(record, 'log_key', None)
+        if key is None:
+            return True
+
+        now = time.monotonic()
+        with self._lock:
+            stats = self._keys.setdefault(key, [0, now, 0, 0])
+            stats[0] += 1
+            if now - stats[1] >= self.period:
+                stats[1], stats[2] = now, 0
+
+            sampled_out = (stats[0] - 1) % self.sample_every != 0
+            limited = self.rate > 0 and stats[2] >= self.rate
+            if sampled_out or limited:
+                stats[3] += 1
+                return False
+
+            stats[2] += 1
+            suppressed, stats[3] = stats[3], 0
+
+        if suppressed:
+            record.msg = f"{record.getMessage()} (已省略 {suppressed} 条同类日志)"
+            record.args = None
+        return True
+
+    def stats(self):
+        """log_key -> (已见条数, 已省略条数)"""
+        with self._lock:
+            return {key: (s[0], s[3]) for key, s in self._keys.items()}
+
+
+def install_log_control(level='INFO', sample_every=1, rate=0, period=60.0):
+    """在根日志的所有 handler 上挂载采样过滤器并设置级别，返回过滤器 (用于运行中调整)"""
+    log_filter = SampledLogFilter(sample_every, rate, period)
+    root = logging.getLogger()
+    for handler in root.handlers:
+        handler.addFilter(log_filter)
+    set_log_level(level)
+    return log_filter
+
+
+def set_log_level(level):
+    """运行中调整日志级别，返回是否发生变化"""
+    level = str(level).upper()
+    if level not in LOG_LEVELS:
+        return False
+    root = logging.getLogger()
+    new_level = getattr(logging, level)
+    if root.level == new_level:
+        return False
+    root.setLevel(new_level)
+    for name in QUIET_LIBRARIES:
+        logging.getLogger(name).setLevel(max(new_level, logging.INFO))
+    return True
@@ -0,0 +1,148 @@
+import os
+import io
+import re
+import csv
+import json
+import bisect
+import threading
+
+# 文本日志格式: "2025-01-01 12:00:00,123 - INFO - 消息"
+_LINE_RE = re.compile(r'^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2},\d{3}) - (\w+) - (.*)$')
+
+
+class LogCsvExporter:
+    """日志 -> CSV 的流式导出
+
+    只缓存稀疏的字节偏移索引: 每 index_every 条记录记一次 (时间, 记录起始偏移)，并记住已索引到的
+    偏移，每次导出只为新追加的部分补索引；文件被清空或替换时重建。导出时按时间二分找到起点，
+    从磁盘顺序读取并逐行解析，内存占用与日志大小无关。支持文本日志和结构化日志 (.jsonl)。
+    时间字符串格式固定，可直接按字符串比较做时间范围过滤。
+    """
+
+    def __init__(self, path, read_size=1024 * 1024, index_every=1000):
+        self.path = path
+        self.read_size = read_size
+        self.index_every = index_every
+        self.is_json = path.endswith('.jsonl')
+        self._lock = threading.Lock()
+        self._reset(None)
+
+    def _reset(self, inode):
+        self._inode = inode
+        self.offset = 0
+        self.count = 0
+        self._index_times = []
+        self._index_offsets = []
+
+    def __len__(self):
+        return self.count
+
+    def _parse_line(self, raw):
+        """解析一行，返回 (时间, 级别, 消息)；不是新记录的行返回 None"""
+        line = raw.decode('utf-8', errors='ignore').strip()
+        if not line:
+            return None
+        if self.is_json:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                return None
+            return entry.get('time', ''), entry.get('level', ''), entry.get('msg', '')
+        match = _LINE_RE.match(line)
+        return match.groups() if match else None
+
+    def refresh(self):
+        """为上次偏移之后新追加的完整行补索引，返回新增条数"""
+        with self._lock:
+            try:
+                st = os.stat(self.path)
+            except OSError:
+                self._reset(None)
+                return 0
+            if st.st_ino != self._inode or st.st_size < self.offset:
+                self._reset(st.st_ino)
+
+            before = self.count
+            with open(self.path, 'rb') as f:
+                f.seek(self.offset)
+                pending = b''
+                while True:
+                    chunk = f.read(self.read_size)
+                    if not chunk:
+                        break
+                    data = pending + chunk
+                    cut = data.rfind(b'\n') + 1
+                    pos = self.offset
+                    for raw in data[:cut].split(b'\n')[:-1]:
+                        entry = self._parse_line(raw)
+                        if entry:
+                            if self.count % self.index_every == 0:
+                                self._index_times.append(entry[0])
+                                self._index_offsets.append(pos)
+                            self.count += 1
+                        pos += len(raw) + 1
+                    self.offset += cut
+                    pending = data[cut:]
+                # 末尾不完整的一行 (仍在写入) 留到下次
+            return self.count - before
+
+    def _records(self, start, stop):
+        """从字节偏移 start 顺序读到 stop (均在行首)，产出 (时间, 级别, 消息)；不匹配的行 (如异常堆栈) 并入上一条"""
+        current = None
+        with open(self.path, 'rb') as f:
+            f.seek(start)
+            remaining = stop - start
+            pending = b''
+            while remaining > 0:
+                chunk = f.read(min(self.read_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                data = pending + chunk
+                cut = data.rfind(b'\n') + 1
+                pending = data[cut:]
+                for raw in data[:cut].split(b'\n')[:-1]:
+                    entry = self._parse_line(raw)
+                    if entry:
+                        if current:
+                            yield current
+                        current = list(entry)
+                    elif current and not self.is_json:
+                        line = raw.decode('utf-8', errors='ignore').strip()
+                        if line:
+                            current[2] += " | " + line
+        if current:
+            yield current
+
+    def iter_csv(self, start=None, end=None, chunk_rows=5000):
+        """按块生成 CSV (utf-8-sig)；start / end 为 "YYYY-mm-dd HH:MM:SS" 形式的时间字符串，包含两端"""
+        self.refresh()
+        with self._lock:
+            stop = self.offset
+            # 从最后一个早于 start 的索引点开始读，之前的块不会有符合条件的记录
+            i = bisect.bisect_left(self._index_times, start) - 1 if start else -1
+            begin = self._index_offsets[i] if i >= 0 else 0
+        upper = end + '\uffff' if end else None
+
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        writer.writerow(['Time', 'Level', 'Message'])
+        yield buf.getvalue().encode('utf-8-sig')
+        rows = []
+        for row in self._records(begin, stop):
+            if start and row[0] < start:
+                continue
+            if upper and row[0] > upper:
+                break
+            rows.append(row)
+            if len(rows) >= chunk_rows:
+                buf.seek(0)
+                buf.truncate()
+                writer.writerows(rows)
+                rows = []
+                yield buf.getvalue().encode('utf-8')
+        if rows:
+            buf.seek(0)
+            buf.truncate()
+            writer.writerows(rows)
+            yield buf.getvalue().encode('utf-8')
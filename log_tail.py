@@ -0,0 +1,69 @@
+import os
+import threading
+
+
+class LogTail:
+    """从文件末尾读取最后 N 行，并按偏移增量维护总行数
+
+    - tail(n): 从末尾按块向前读取，直到凑够 n 行，耗时只与显示的行数有关
+    - line_count(): 记住上次统计到的字节偏移，之后只统计新追加的部分；
+      文件被清空/截断或被替换 (inode 变化) 时重新统计
+    同一个对象可在多个看板会话之间共享 (st.cache_resource)。
+    """
+
+    def __init__(self, path, block_size=64 * 1024):
+        self.path = path
+        self.block_size = block_size
+        self._inode = None
+        self._offset = 0
+        self._lines = 0
+        self._lock = threading.Lock()
+
+    def size(self):
+        try:
+            return os.path.getsize(self.path)
+        except OSError:
+            return 0
+
+    def line_count(self):
+        with self._lock:
+            try:
+                st = os.stat(self.path)
+            except OSError:
+                self._inode, self._offset, self._lines = None, 0, 0
+                return 0
+            if st.st_ino != self._inode or st.st_size < self._offset:
+                self._inode, self._offset, self._lines = st.st_ino, 0, 0
+            if st.st_size > self._offset:
+                with open(self.path, 'rb') as f:
+                    f.seek(self._offset)
+                    remaining = st.st_size - self._offset
+                    while remaining > 0:
+                        chunk = f.read(min(self.block_size, remaining))
+                        if not chunk:
+                            break
+                        self._lines += chunk.count(b'\n')
+                        remaining -= len(chunk)
+                        self._offset += len(chunk)
+            return self._lines
+
+    def tail(self, n):
+        """返回最后 n 行 (str 列表，不含换行符)"""
+        if n <= 0:
+            return []
+        try:
+            f = open(self.path, 'rb')
+        except OSError:
+            return []
+        with f:
+            end = f.seek(0, os.SEEK_END)
+            pos = end
+            data = b''
+            # 末尾的换行不算一行的开始，需要多找到一个换行
+            while pos > 0 and data.count(b'\n') <= n:
+                step = min(self.block_size, pos)
+                pos -= step
+                f.seek(pos)
+                data = f.read(step) + data
+        lines = data.splitlines()
+        return [line.decode('utf-8', errors='replace') for line in lines[-n:]]
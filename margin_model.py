@@ -0,0 +1,108 @@
+class MarginModel:
+    """我的账户本地保证金/余额模型
+
+    由 get_user_state 返回的 AccountState 构建 (合约: marginSummary / withdrawable / 持仓杠杆，
+    现货: spot 余额)，在发送挂单前预估哪些订单放得下，避免靠交易所返回
+    "Margin"/"balance" 错误来发现保证金不足。
+
+    快照中没有保证金信息时 (例如模拟模式)，视为不受限。
+    """
+
+    def __init__(self, state, default_leverage=1.0, buffer=0.95, pair_to_token=None):
+        self.default_leverage = max(float(default_leverage), 1.0)
+        self.buffer = buffer
+        self.pair_to_token = pair_to_token or {}
+
+        # --- 合约 ---
+        self.perp_known = state.account_value is not None
+        self.account_value = 0.0
+        self.perp_available = 0.0
+        if self.perp_known:
+            self.account_value = state.account_value
+            if state.withdrawable is not None:
+                self.perp_available = state.withdrawable
+            else:
+                self.perp_available = self.account_value - state.margin_used
+            self.perp_available *= buffer
+
+        self.positions = {}
+        self.leverage = {}
+        for coin, p in state.positions.items():
+            self.positions[coin] = p.szi
+            if p.leverage:
+                self.leverage[coin] = p.leverage
+
+        # --- 现货: token -> 可用数量 (total - hold) ---
+        balances = state.spot_balances
+        self.spot_known = balances is not None
+        self.spot_free = {}
+        for token, (total, hold) in (balances or {}).items():
+            self.spot_free[token] = (total - hold) * buffer
+
+        # 本轮计划中已预留的减仓数量 (coin -> 已用掉的可减仓数量)
+        self._reduce_used = {}
+
+    def get_leverage(self, coin):
+        return self.leverage.get(coin, self.default_leverage)
+
+    def _reducible(self, coin, is_buy):
+        """反向挂单可以不占保证金的数量 (减仓部分)"""
+        pos = self.positions.get(coin, 0.0)
+        if pos == 0 or (pos > 0) == is_buy:
+            return 0.0
+        return max(abs(pos) - self._reduce_used.get(coin, 0.0), 0.0)
+
+    def perp_margin(self, coin, is_buy, px, sz):
+        """合约挂单需要的初始保证金 (扣除减仓部分)"""
+        open_sz = max(sz - self._reducible(coin, is_buy), 0.0)
+        return px * open_sz / self.get_leverage(coin)
+
+    def release(self, coin, is_buy, px, sz, is_spot=False):
+        """撤单后释放的保证金/余额"""
+        if is_spot:
+            token = self.pair_to_token.get(coin, coin.split('/')[0])
+            if is_buy:
+                self.spot_free['USDC'] = self.spot_free.get('USDC', 0.0) + px * sz
+            else:
+                self.spot_free[token] = self.spot_free.get(token, 0.0) + sz
+        else:
+            self.perp_available += px * sz / self.get_leverage(coin)
+
+    def reserve(self, coin, is_buy, px, sz, is_spot=False):
+        """尝试为一笔挂单预留保证金/余额，放得下则扣减并返回 True"""
+        if is_spot:
+            if not self.spot_known:
+                return True
+            if is_buy:
+                token, need = 'USDC', px * sz
+            else:
+                token, need = self.pair_to_token.get(coin, coin.split('/')[0]), sz
+            if self.spot_free.get(token, 0.0) < need:
+                return False
+            self.spot_free[token] -= need
+            return True
+
+        if not self.perp_known:
+            return True
+        reduce_sz = min(self._reducible(coin, is_buy), sz)
+        need = self.perp_margin(coin, is_buy, px, sz)
+        if need > self.perp_available:
+            return False
+        self.perp_available -= need
+        if reduce_sz > 0:
+            self._reduce_used[coin] = self._reduce_used.get(coin, 0.0) + reduce_sz
+        return True
+
+    def select(self, orders):
+        """按给定顺序挑出放得下的挂单
+
+        orders: [(item, coin, is_buy, px, sz, is_spot), ...]，已按优先级排序
+        返回 (可下单的 item 列表, 放不下的 item 列表)
+        """
+        selected, skipped = [], []
+        for item, coin, is_buy, px, sz, is_spot in orders:
+            if self.reserve(coin, is_buy, px, sz, is_spot):
+                selected.append(item)
+            else:
+                skipped.append(item)
+        return selected, skipped
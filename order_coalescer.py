@@ -0,0 +1,71 @@
+import time
+
+
+class OrderChangeCoalescer:
+    """目标挂单变化的合并窗口 (防抖)
+
+    目标在几秒内连续改价时，每次指纹变化都全量同步会追逐很快就被放弃的中间状态。
+    检测到变化后先挂起，直到目标挂单在 window 秒内不再变化 (已稳定)，
+    或自首次变化起已等待 max_wait 秒，才放行一次同步。
+    """
+
+    def __init__(self, window, max_wait):
+        self.window = window
+        self.max_wait = max(max_wait, window)
+        self.prev_keys = None       # 上一次观察到的目标挂单指纹
+        self.pending_since = None   # 本轮变化首次被观察到的时间
+        self.last_change = 0.0      # 最近一次观察到变化的时间
+
+        # 统计
+        self.observed_changes = 0   # 观察到的指纹变化次数
+        self.resyncs = 0            # 实际执行的同步次数
+
+    @property
+    def saved(self):
+        """被合并掉 (节省) 的同步次数"""
+        return max(0, self.observed_changes - self.resyncs)
+
+    @property
+    def is_pending(self):
+        return self.pending_since is not None
+
+    def should_sync(self, synced_keys, current_keys, now=None):
+        """是否应立即同步 current_keys (synced_keys 为上次已同步的指纹)"""
+        now = time.monotonic() if now is None else now
+
+        if current_keys != self.prev_keys:
+            self.observed_changes += 1
+            self.prev_keys = current_keys
+            self.last_change = now
+
+        # 首次运行直接同步
+        if synced_keys is None:
+            return self._release()
+
+        # 目标回到了已同步的状态，放弃等待
+        if current_keys == synced_keys:
+            self.pending_since = None
+            return False
+
+        if self.window <= 0:
+            return self._release()
+
+        if self.pending_since is None:
+            self.pending_since = now
+
+        settled = now - self.last_change >= self.window
+        timed_out = now - self.pending_since >= self.max_wait
+        if settled or timed_out:
+            return self._release()
+        return False
+
+    def _release(self):
+        self.pending_since = None
+        self.resyncs += 1
+        return True
+
+    def poll_interval(self, default):
+        """挂起期间缩短轮询间隔，以便尽快确认目标挂单是否已稳定"""
+        if self.is_pending and self.window > 0:
+            return min(default, self.window)
+        return default
@@ -0,0 +1,108 @@
+import hashlib
+import threading
+
+import database as db
+
+
+def target_order_key(o):
+    """目标挂单 (state_model.Order) 的身份标识: 优先使用目标自己的 cloid，否则使用 oid"""
+    if o.cloid:
+        return f"c:{o.cloid}"
+    return f"o:{o.oid}"
+
+
+class OrderLinkBook:
+    """目标挂单 -> 我的挂单 的持久化映射
+
+    我的挂单统一带上 cloid 下单，映射记录 cloid、我方 oid 以及最后一次下单的
+    价格和数量。目标改价/改量时据此直接 modify 原订单，而不是撤单重挂。
+    映射实时写入 STATE_DB_FILE，重启后自动恢复。
+
+    我的挂单已成交 (或被撤) 而目标挂单仍在时，映射改为 "已消耗" 标记: 目标挂单消失之前
+    不再为它补挂 (cloid 相同，补挂会让已成交的部分重复持仓)。
+
+    并发同步时各币种的下单线程会同时更新映射，所有修改 (字典和数据库) 在同一把锁内完成。
+    """
+
+    def __init__(self, my_address, target_address):
+        self.my_address = my_address
+        self.target_address = target_address
+        self.links = db.load_order_links(my_address, target_address)
+        self.consumed = db.load_consumed_order_keys(my_address, target_address)
+        self._lock = threading.RLock()
+
+    def __contains__(self, target_key):
+        return target_key in self.links
+
+    def __len__(self):
+        return len(self.links)
+
+    def get(self, target_key):
+        return self.links.get(target_key)
+
+    def items(self):
+        with self._lock:
+            return list(self.links.items())
+
+    def make_cloid(self, target_key):
+        """由 (我的地址, 目标地址, 目标挂单标识) 确定性地生成 cloid (16 字节 hex)"""
+        raw = f"{self.my_address}:{self.target_address}:{target_key}".lower()
+        return '0x' + hashlib.md5(raw.encode()).hexdigest()
+
+    def link(self, target_key, cloid, my_oid, coin, side, limit_px, sz, filled=0.0):
+        """sz 为按目标挂单计算的期望数量；filled 为我的挂单在之前的改单中累计已成交的数量"""
+        link = {
+            'cloid': cloid,
+            'my_oid': my_oid,
+            'coin': coin,
+            'side': side,
+            'limit_px': float(limit_px),
+            'sz': float(sz),
+            'filled': float(filled)
+        }
+        with self._lock:
+            self.links[target_key] = link
+            db.save_order_link(self.my_address, self.target_address, target_key, link)
+        return link
+
+    def relink(self, old_key, new_key):
+        """目标改单后 oid 变化: 将映射迁移到新的目标挂单标识"""
+        with self._lock:
+            link = self.links.pop(old_key, None)
+            if link is None:
+                return None
+            db.delete_order_link(self.my_address, self.target_address, old_key)
+            self.links[new_key] = link
+            db.save_order_link(self.my_address, self.target_address, new_key, link)
+        return link
+
+    def unlink(self, target_key):
+        with self._lock:
+            if self.links.pop(target_key, None) is not None:
+                db.delete_order_link(self.my_address, self.target_address, target_key)
+
+    def find_open_order(self, link, my_by_oid, my_by_cloid):
+        """在我的当前挂单中找到映射对应的订单 (先按 cloid，再按 oid)"""
+        o = my_by_cloid.get(link['cloid'])
+        if o is None and link.get('my_oid') is not None:
+            o = my_by_oid.get(link['my_oid'])
+        return o
+
+    def consume(self, target_key):
+        """我的挂单已成交/被撤: 删除映射并标记该目标挂单已消耗"""
+        with self._lock:
+            self.unlink(target_key)
+            if target_key not in self.consumed:
+                self.consumed.add(target_key)
+                db.save_consumed_order_key(self.my_address, self.target_address, target_key)
+
+    def is_consumed(self, target_key):
+        return target_key in self.consumed
+
+    def release_consumed(self, live_keys):
+        """清除目标挂单已消失的已消耗标记"""
+        with self._lock:
+            gone = self.consumed - set(live_keys)
+            if gone:
+                self.consumed -= gone
+                db.delete_consumed_order_keys(self.my_address, self.target_address, gone)
@@ -0,0 +1,271 @@
+import database as db
+
+# 账本: 目标实际、按跟单比例缩放的理想跟单、我的实际
+ACCOUNTS = ('target', 'ideal', 'follower')
+
+# 跟单差额的归因项
+ATTRIBUTION_KEYS = ('lag', 'slippage', 'rounding', 'skipped', 'fees', 'funding', 'other')
+
+# 决策价晚于我的第一笔成交多久仍视为有效 (本地时钟与成交时间的误差)
+REFERENCE_TOLERANCE_MS = 2000
+
+
+class _Book:
+    """单个账户单个币种的持仓与盈亏 (平均成本法，每笔成交 O(1) 更新)"""
+
+    __slots__ = ('position', 'entry_px', 'realized', 'fees', 'funding', 'mark_px', 'baseline', 'last_time')
+
+    def __init__(self, position=0.0, entry_px=0.0, realized=0.0, fees=0.0, funding=0.0, mark_px=None,
+                 baseline=0.0, last_time=0):
+        self.position = position
+        self.entry_px = entry_px
+        self.realized = realized
+        self.fees = fees
+        self.funding = funding
+        self.mark_px = mark_px
+        self.baseline = baseline    # 开始跟踪时已有持仓的浮动盈亏，不计入之后的表现
+        self.last_time = last_time
+
+    def apply_fill(self, is_buy, sz, px, fee=0.0):
+        qty = sz if is_buy else -sz
+        pos = self.position
+        if pos == 0 or (pos > 0) == is_buy:
+            self.entry_px = (self.entry_px * abs(pos) + px * sz) / (abs(pos) + sz)
+        else:
+            closed = min(sz, abs(pos))
+            self.realized += closed * (px - self.entry_px) * (1 if pos > 0 else -1)
+            if sz > abs(pos):
+                self.entry_px = px  # 反向开仓，剩余部分以成交价为成本
+        self.position = pos + qty
+        if abs(self.position) < 1e-12:
+            self.position, self.entry_px = 0.0, 0.0
+        self.fees += fee
+        if self.mark_px is None:
+            self.mark_px = px
+
+    def unrealized(self):
+        if not self.position or self.mark_px is None:
+            return 0.0
+        return self.position * (self.mark_px - self.entry_px)
+
+    def total(self):
+        """开始跟踪以来的净盈亏 (已实现 + 浮动 - 手续费 + 资金费)"""
+        return self.realized + self.unrealized() - self.fees + self.funding - self.baseline
+
+
+class _Attribution:
+    """单个币种 (我的实际 - 理想跟单) 差额的分项
+
+    盈亏对成交是线性的，差额可以拆成若干组 "虚拟成交"，每组的盈亏 = 现金流 + 净数量 x 标记价:
+      - lag / slippage: 已跟上部分的价差 (只有现金流，立即确定)
+      - rounding / skipped: 数量差 (按目标成交价建立的虚拟持仓，随标记价浮动)
+    """
+
+    __slots__ = ('lag_cash', 'slippage_cash', 'rounding_qty', 'rounding_cash', 'skipped_qty', 'skipped_cash')
+
+    def __init__(self, lag_cash=0.0, slippage_cash=0.0, rounding_qty=0.0, rounding_cash=0.0,
+                 skipped_qty=0.0, skipped_cash=0.0):
+        self.lag_cash = lag_cash
+        self.slippage_cash = slippage_cash
+        self.rounding_qty = rounding_qty
+        self.rounding_cash = rounding_cash
+        self.skipped_qty = skipped_qty
+        self.skipped_cash = skipped_cash
+
+
+class PnlEngine:
+    """跟单盈亏与归因 (增量)
+
+    消费目标/我的成交、资金费和配对结果 (CopyTracker.process 的输出)，维护每个币种三本账:
+    目标实际 (target)、目标成交按跟单比例缩放的理想跟单 (ideal)、我的实际 (follower)。
+    我的实际与理想跟单的差额拆分为:
+      - lag: 从目标成交到我方下单决策之间的价格变化
+      - slippage: 我的成交价相对决策价的偏离 (没有决策价时价差全部计入 lag)
+      - rounding: 已跟上部分的数量误差 (round_sz 取整、部分成交)
+      - skipped: 完全没有跟上的目标成交
+      - fees / funding: 手续费、资金费差额
+      - other: 其余部分 (手动交易、全量同步修正、开始跟踪前的持仓等)
+    每个事件 O(1) 更新，只写回有变化的币种；重启后从 history.db 恢复。
+    """
+
+    def __init__(self, target_address, copy_ratio, start_ms):
+        self.target_address = target_address
+        self.copy_ratio = copy_ratio
+        self.start_ms = start_ms
+        self.books = {}          # (account, coin) -> _Book
+        self.attribution = {}    # coin -> _Attribution
+        self.references = {}     # coin -> (决策时间 ms, 决策价)
+        self.funding_cursor = {}  # account -> 已处理到的资金费时间 (ms)
+        self.seeded = {}         # account -> 本次运行校准所用持仓快照的时间 (ms)，之前的成交已包含在快照中
+        self.dirty = set()
+        self._load()
+
+    def _load(self):
+        books, attribution, cursors = db.load_pnl_state(self.target_address)
+        for (account, coin), values in books.items():
+            self.books[(account, coin)] = _Book(*values)
+        for coin, values in attribution.items():
+            self.attribution[coin] = _Attribution(*values)
+        self.funding_cursor.update(cursors)
+
+    def _book(self, account, coin):
+        book = self.books.get((account, coin))
+        if book is None:
+            book = self.books[(account, coin)] = _Book()
+        self.dirty.add(coin)
+        return book
+
+    def _attr(self, coin):
+        attr = self.attribution.get(coin)
+        if attr is None:
+            attr = self.attribution[coin] = _Attribution()
+        self.dirty.add(coin)
+        return attr
+
+    # --- 输入 ---
+
+    def seed_positions(self, account, positions, snapshot_ms):
+        """用持仓快照校准账本 (每个账户每次运行一次): 开始跟踪前的持仓及停机期间错过的成交"""
+        if account in self.seeded:
+            return
+        self.seeded[account] = snapshot_ms
+        accounts = (account, 'ideal') if account == 'target' else (account,)
+        coins = {coin for (acc, coin) in self.books if acc == account} | set(positions)
+        for coin in coins:
+            pos = positions.get(coin)
+            szi = pos.szi if pos is not None else 0.0
+            for acc in accounts:
+                scale = self.copy_ratio if acc == 'ideal' else 1.0
+                book = self.books.get((acc, coin))
+                if abs((book.position if book else 0.0) - szi * scale) < 1e-9:
+                    continue
+                book = self._book(acc, coin)
+                before = book.total()
+                book.position = szi * scale
+                # 现货余额没有入场价，以当前标记价为成本
+                book.entry_px = (pos.entry_px if pos is not None else 0.0) or book.mark_px or 0.0
+                if book.mark_px is None:
+                    book.mark_px = book.entry_px
+                book.baseline += book.total() - before
+
+    def add_fill(self, account, fill):
+        """目标 ('target') 或我的 ('follower') 一笔新成交"""
+        if int(fill['time']) < max(self.start_ms, self.seeded.get(account, 0)):
+            return
+        coin = fill['coin']
+        is_buy = fill['side'] == 'B'
+        sz, px, fee = float(fill['sz']), float(fill['px']), float(fill.get('fee') or 0)
+        book = self._book(account, coin)
+        book.apply_fill(is_buy, sz, px, fee)
+        book.last_time = max(book.last_time, int(fill['time']))
+        if account == 'target':
+            self._book('ideal', coin).apply_fill(is_buy, sz * self.copy_ratio, px, fee * self.copy_ratio)
+
+    def add_funding(self, account, entries):
+        """资金费记录 (info.user_funding_history 的返回)，已处理过的时间段自动跳过"""
+        cursor = self.funding_cursor.get(account, self.start_ms)
+        latest = cursor
+        for entry in entries:
+            t = int(entry['time'])
+            delta = entry.get('delta', {})
+            if t <= cursor or delta.get('type') != 'funding':
+                continue
+            coin, usdc = delta['coin'], float(delta['usdc'])
+            self._book(account, coin).funding += usdc
+            if account == 'target':
+                self._book('ideal', coin).funding += usdc * self.copy_ratio
+            latest = max(latest, t)
+        self.funding_cursor[account] = latest
+        return latest
+
+    def note_reference(self, coin, px, time_ms):
+        """我方针对某币种下单时的决策价 (用于区分延迟与滑点)"""
+        self.references[coin] = (time_ms, px)
+
+    def add_match(self, row):
+        """一条目标成交的配对结果 (CopyTracker 的输出行)，把价差和数量差计入归因"""
+        if row['target_time'] < self.start_ms:
+            return
+        coin = row['coin']
+        s = 1 if row['side'] == 'B' else -1
+        want = row['target_sz'] * self.copy_ratio
+        got = row['follower_sz']
+        t_px = row['target_px']
+        attr = self._attr(coin)
+
+        if got:
+            f_px = row['follower_px']
+            first_time = row['target_time'] + row['lag_ms']
+            ref = self.references.get(coin)
+            if ref and row['target_time'] <= ref[0] <= first_time + REFERENCE_TOLERANCE_MS:
+                attr.lag_cash -= s * got * (ref[1] - t_px)
+                attr.slippage_cash -= s * got * (f_px - ref[1])
+            else:
+                attr.lag_cash -= s * got * (f_px - t_px)
+            attr.rounding_qty += s * (got - want)
+            attr.rounding_cash -= s * (got - want) * t_px
+        else:
+            attr.skipped_qty -= s * want
+            attr.skipped_cash += s * want * t_px
+
+    def update_marks(self, mids):
+        """刷新标记价 (all_mids)，没有报价的币种沿用最近成交价"""
+        for (account, coin), book in self.books.items():
+            px = mids.get(coin)
+            if px is None:
+                continue
+            px = float(px)
+            if px != book.mark_px:
+                book.mark_px = px
+                if book.position:
+                    self.dirty.add(coin)
+
+    # --- 输出 ---
+
+    def mark_px(self, coin):
+        for account in ('follower', 'target', 'ideal'):
+            book = self.books.get((account, coin))
+            if book is not None and book.mark_px is not None:
+                return book.mark_px
+        return 0.0
+
+    def breakdown(self, coin):
+        """单个币种的归因 {项: 盈亏}，另含 gap (我的实际 - 理想跟单)"""
+        attr = self.attribution.get(coin) or _Attribution()
+        follower = self.books.get(('follower', coin)) or _Book()
+        ideal = self.books.get(('ideal', coin)) or _Book()
+        mark = self.mark_px(coin)
+        result = {
+            'lag': attr.lag_cash,
+            'slippage': attr.slippage_cash,
+            'rounding': attr.rounding_cash + attr.rounding_qty * mark,
+            'skipped': attr.skipped_cash + attr.skipped_qty * mark,
+            'fees': -(follower.fees - ideal.fees),
+            'funding': follower.funding - ideal.funding,
+        }
+        gap = follower.total() - ideal.total()
+        result['other'] = gap - sum(result.values())
+        result['gap'] = gap
+        return result
+
+    def flush(self):
+        """把有变化的币种写回 history.db"""
+        if not self.dirty:
+            return
+        coins, self.dirty = self.dirty, set()
+        books = []
+        for coin in coins:
+            for account in ACCOUNTS:
+                book = self.books.get((account, coin))
+                if book is not None:
+                    books.append((account, coin, book.position, book.entry_px, book.realized, book.fees,
+                                  book.funding, book.mark_px, book.unrealized(), book.baseline, book.last_time,
+                                  book.total()))
+        attribution = []
+        for coin in coins:
+            attr = self.attribution.get(coin) or _Attribution()
+            result = self.breakdown(coin)
+            attribution.append((coin, attr.lag_cash, attr.slippage_cash, attr.rounding_qty, attr.rounding_cash,
+                                attr.skipped_qty, attr.skipped_cash)
+                               + tuple(result[k] for k in ATTRIBUTION_KEYS) + (result['gap'],))
+        db.save_pnl_state(self.target_address, books, attribution, self.funding_cursor)
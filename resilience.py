@@ -0,0 +1,186 @@
+import time
+import random
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+logger = logging.getLogger(__name__)
+
+# 默认做对冲/熔断保护的只读接口
+READ_METHODS = ('user_state', 'spot_user_state', 'open_orders', 'user_fills', 'user_fills_by_time',
+                'all_mids', 'l2_snapshot', 'meta', 'spot_meta')
+
+
+class CircuitOpenError(Exception):
+    """熔断器打开时快速失败"""
+
+
+class Backoff:
+    """带随机抖动的指数退避 (full jitter): 第 n 次等待 uniform(0, min(cap, base * 2^n))"""
+
+    def __init__(self, base=0.5, cap=10.0):
+        self.base = base
+        self.cap = cap
+        self.attempt = 0
+
+    def next(self):
+        delay = random.uniform(0, min(self.cap, self.base * (2 ** self.attempt)))
+        self.attempt += 1
+        return delay
+
+    def reset(self):
+        self.attempt = 0
+
+
+def retry_with_backoff(fn, retries=3, base=0.5, cap=5.0, on_error=None):
+    """调用 fn，失败时按抖动退避重试，最后一次仍失败则抛出异常"""
+    backoff = Backoff(base, cap)
+    for i in range(retries):
+        try:
+            return fn()
+        except Exception as e:
+            if i == retries - 1:
+                raise
+            if on_error:
+                on_error(i, e)
+            time.sleep(backoff.next())
+
+
+class LatencyTracker:
+    """滚动窗口内的请求耗时，用于估算 p95"""
+
+    def __init__(self, window=200):
+        self.samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self.samples.append(seconds)
+
+    def percentile(self, p, default=None):
+        with self._lock:
+            data = sorted(self.samples)
+        if len(data) < 20:
+            return default
+        idx = min(int(len(data) * p), len(data) - 1)
+        return data[idx]
+
+
+class CircuitBreaker:
+    """熔断器
+
+    连续失败 failure_threshold 次后打开，打开期间直接快速失败；
+    reset_timeout 秒后进入半开状态，只放行一个探测请求，成功则关闭，失败则重新打开。
+    """
+
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_inflight = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._probe_inflight = False
+            if self.state == self.HALF_OPEN and not self._probe_inflight:
+                self._probe_inflight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self.state != self.CLOSED:
+                logger.info("API 熔断恢复 (探测请求成功)")
+            self.state = self.CLOSED
+            self.failures = 0
+            self._probe_inflight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.warning(f"API 连续失败 {self.failures} 次，熔断 {self.reset_timeout}s")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                self._probe_inflight = False
+
+
+class ResilientInfo:
+    """Info 的容错代理
+
+    - 对冲请求: 只读请求超过该接口 p95 耗时仍未返回时，再并发发出一个相同请求，先返回者胜出
+    - 熔断: 连续失败后快速失败，半开状态下用单个请求探测恢复
+    - 总超时: 超过 timeout 秒仍无结果则视为失败 (底层同步请求无法取消，由线程池兜底)
+
+    未被保护的属性/方法原样转发给底层 Info。
+    """
+
+    def __init__(self, info, methods=READ_METHODS, timeout=10.0, min_hedge_delay=0.2, max_workers=16,
+                 breaker=None):
+        self.info = info
+        self.methods = set(methods)
+        self.timeout = timeout
+        self.min_hedge_delay = min_hedge_delay
+        self.breaker = breaker or CircuitBreaker()
+        self.latency = {}
+        self.stats = {'calls': 0, 'hedged': 0, 'hedge_wins': 0, 'fast_fails': 0, 'failures': 0}
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='info')
+
+    def __getattr__(self, name):
+        attr = getattr(self.info, name)
+        if name in self.methods and callable(attr):
+            def protected_call(*args, **kwargs):
+                return self._call(name, attr, args, kwargs)
+            return protected_call
+        return attr
+
+    def _call(self, name, fn, args, kwargs):
+        if not self.breaker.allow():
+            self.stats['fast_fails'] += 1
+            raise CircuitOpenError(f"{name}: API 熔断中，快速失败")
+
+        self.stats['calls'] += 1
+        tracker = self.latency.setdefault(name, LatencyTracker())
+        hedge_delay = max(tracker.percentile(0.95, default=self.timeout / 2), self.min_hedge_delay)
+        start = time.monotonic()
+        deadline = start + self.timeout
+
+        primary = self._pool.submit(fn, *args, **kwargs)
+        pending = {primary}
+        done, pending = wait(pending, timeout=hedge_delay)
+        if not done:
+            # 超过 p95 仍未返回，发出对冲请求
+            self.stats['hedged'] += 1
+            pending.add(self._pool.submit(fn, *args, **kwargs))
+
+        error = None
+        while True:
+            for future in done:
+                if future.exception() is None:
+                    tracker.record(time.monotonic() - start)
+                    if future is not primary:
+                        self.stats['hedge_wins'] += 1
+                    self.breaker.record_success()
+                    return future.result()
+                error = future.exception()
+            remaining = deadline - time.monotonic()
+            if not pending or remaining <= 0:
+                break
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+
+        self.stats['failures'] += 1
+        self.breaker.record_failure()
+        if error is None:
+            error = TimeoutError(f"{name}: 请求超过 {self.timeout}s 未返回")
+        raise error
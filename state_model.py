@@ -0,0 +1,154 @@
+import sys
+
+_intern = sys.intern
+
+
+class Position:
+    """单个持仓 (数值字段已解析为 float，coin 已驻留)；不保留原始响应，写库/状态日志时用 to_api() 还原"""
+
+    __slots__ = ('coin', 'szi', 'entry_px', 'leverage', 'unrealized_pnl')
+
+    def __init__(self, coin, szi, entry_px=0.0, leverage=None, unrealized_pnl=0.0):
+        self.coin = _intern(coin)
+        self.szi = szi
+        self.entry_px = entry_px
+        self.leverage = leverage
+        self.unrealized_pnl = unrealized_pnl
+
+    @classmethod
+    def from_api(cls, p, coin=None):
+        """解析 {'position': {...}} 或扁平的持仓字典"""
+        core = p.get('position', p)
+        lev = core.get('leverage')
+        if isinstance(lev, dict):
+            lev = lev.get('value')
+        return cls(coin or core['coin'], float(core.get('szi') or 0), float(core.get('entryPx') or 0),
+                   float(lev) if lev else None, float(core.get('unrealizedPnl') or 0))
+
+    def to_api(self):
+        """还原为扁平的持仓字典 (database.log_position / 状态日志使用)"""
+        return {'coin': self.coin, 'szi': str(self.szi), 'entryPx': self.entry_px, 'leverage': self.leverage,
+                'unrealizedPnl': self.unrealized_pnl}
+
+    def __repr__(self):
+        return f"Position({self.coin} {self.szi} @ {self.entry_px})"
+
+
+class Order:
+    """单个挂单 (数值字段已解析为 float，coin 已驻留)；不保留原始响应，写库时用 to_api() 还原"""
+
+    __slots__ = ('coin', 'side', 'limit_px', 'sz', 'oid', 'cloid', 'timestamp', 'order_type', 'orig_sz')
+
+    def __init__(self, coin, side, limit_px, sz, oid, cloid=None, timestamp=0, order_type='Limit', orig_sz=None):
+        self.coin = _intern(coin)
+        self.side = side
+        self.limit_px = limit_px
+        self.sz = sz              # 剩余未成交数量
+        self.oid = oid
+        self.cloid = cloid
+        self.timestamp = timestamp
+        self.order_type = order_type
+        self.orig_sz = sz if orig_sz is None else orig_sz  # 下单 (或最近一次改单) 时的数量
+
+    @classmethod
+    def from_api(cls, o, coin=None):
+        orig_sz = o.get('origSz')
+        return cls(coin or o['coin'], o['side'], float(o['limitPx']), float(o['sz']), o['oid'],
+                   o.get('cloid'), o.get('timestamp', 0), o.get('orderType', 'Limit'),
+                   float(orig_sz) if orig_sz is not None else None)
+
+    def to_api(self):
+        """还原为 API 响应格式的字典 (database.log_order 使用)"""
+        return {'coin': self.coin, 'side': self.side, 'limitPx': str(self.limit_px), 'sz': str(self.sz),
+                'oid': self.oid, 'cloid': self.cloid, 'timestamp': self.timestamp, 'orderType': self.order_type,
+                'origSz': str(self.orig_sz)}
+
+    @property
+    def is_buy(self):
+        return self.side == 'B'
+
+    @property
+    def filled_sz(self):
+        """已部分成交的数量"""
+        return max(self.orig_sz - self.sz, 0.0)
+
+    @property
+    def notional(self):
+        return self.limit_px * self.sz
+
+    def __repr__(self):
+        return f"Order({self.coin} {self.side} {self.sz} @ {self.limit_px} oid={self.oid})"
+
+
+class AccountState:
+    """一次轮询得到的账户状态，每个 API 响应只解析一次，供同步、历史记录、保证金模型和看板共用
+
+    positions: coin -> Position (现货余额已转换为 "PURR/USDC" 形式的持仓)
+    orders: [Order, ...]
+    spot_balances: token -> (total, hold)，未获取现货状态时为 None
+    account_value / margin_used / withdrawable: 合约保证金概要，未获取时为 None
+    """
+
+    __slots__ = ('positions', 'orders', 'spot_balances', 'account_value', 'margin_used', 'withdrawable', '_order_index')
+
+    def __init__(self, positions=None, orders=None):
+        self.positions = positions if positions is not None else {}
+        self.orders = orders if orders is not None else []
+        self._order_index = {}  # oid -> (limitPx, sz, coin, Order)，下一轮解析时复用未变化的挂单
+        self.spot_balances = None
+        self.account_value = None
+        self.margin_used = None
+        self.withdrawable = None
+
+    @classmethod
+    def from_api(cls, perps=None, spot=None, orders=None, token_to_pair=None, order_filter=None, previous=None):
+        """由原始响应 (user_state / spot_user_state / open_orders) 构建
+
+        token_to_pair: 现货 token 到交易对名的映射 (PURR -> PURR/USDC)，持仓和挂单的 coin 统一为交易对名
+        order_filter: 可选，order_filter(order) 为 False 的挂单被丢弃
+        previous: 同一账户上一轮的 AccountState；oid、价格、数量均未变化的挂单直接复用上一轮的 Order，不再解析
+        """
+        token_to_pair = token_to_pair or {}
+        state = cls()
+
+        # 1. 现货余额
+        if spot is not None:
+            state.spot_balances = {}
+            for b in spot.get('balances', []):
+                total = float(b.get('total') or 0)
+                state.spot_balances[_intern(b['coin'])] = (total, float(b.get('hold') or 0))
+                if b['coin'] == 'USDC':
+                    continue
+                coin = token_to_pair.get(b['coin'], b['coin'])
+                state.positions[coin] = Position(coin, total)
+
+        # 2. 合约持仓与保证金概要
+        if perps is not None:
+            for p in perps.get('assetPositions', []):
+                pos = Position.from_api(p)
+                state.positions[pos.coin] = pos
+            summary = perps.get('marginSummary')
+            if summary is not None:
+                state.account_value = float(summary.get('accountValue') or 0)
+                state.margin_used = float(summary.get('totalMarginUsed') or 0)
+                if perps.get('withdrawable') is not None:
+                    state.withdrawable = float(perps['withdrawable'])
+
+        # 3. 挂单 (挂单大多跨轮不变，按原始字符串比对后复用)
+        prev_index = previous._order_index if previous is not None else {}
+        index = state._order_index
+        for o in orders or []:
+            oid, px, sz, coin = o['oid'], o['limitPx'], o['sz'], o['coin']
+            cached = prev_index.get(oid)
+            if cached is not None and cached[0] == px and cached[1] == sz and cached[2] == coin:
+                order = cached[3]
+            else:
+                order = Order.from_api(o, token_to_pair.get(coin))
+            index[oid] = (px, sz, coin, order)
+            if order_filter is None or order_filter(order):
+                state.orders.append(order)
+        return state
+
+    def position_sizes(self):
+        """coin -> 持仓数量"""
+        return {coin: p.szi for coin, p in self.positions.items()}
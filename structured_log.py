@@ -0,0 +1,350 @@
+"""结构化日志: JSON 行格式 + 按大小/时间轮转 + gzip 压缩 + 时间/级别/币种索引
+
+机器人通过 JsonLogHandler 写入 bot_<hash>.jsonl，每行一条:
+    {"ts": 1760000000000, "time": "2025-10-09 12:00:00,000", "level": "INFO", "logger": "...", "msg": "...", "coin": "ETH"}
+
+文件写满 max_bytes 或打开超过 rotate_seconds 后轮转为 bot_<hash>.<时间>.jsonl.gz，
+压缩在后台线程完成。日志按约 block_bytes 分块，每块在旁路索引 (<path>.idx，SQLite) 中记录
+字节区间、时间范围、出现过的级别和币种；压缩时每块单独成为一个 gzip member，
+因此查询 (query_logs) 只需读取命中的块，而不用扫描全部历史。
+"""
+import os
+import re
+import json
+import gzip
+import time
+import sqlite3
+import logging
+import threading
+from datetime import datetime
+
+LEVEL_BITS = {'DEBUG': 1, 'INFO': 2, 'WARNING': 4, 'ERROR': 8, 'CRITICAL': 16}
+
+# 从 "[ETH] ..." / "[快速通道] [PURR/USDC] ..." 这类消息中提取币种
+_COIN_RE = re.compile(r'\[([A-Z0-9]{2,}(?:/[A-Z0-9]+)?)\]')
+_NOT_COINS = {'DEBUG'}
+
+
+def extract_coin(record_or_msg):
+    coin = getattr(record_or_msg, 'coin', None)
+    if coin:
+        return coin
+    msg = record_or_msg if isinstance(record_or_msg, str) else record_or_msg.getMessage()
+    for m in _COIN_RE.finditer(msg):
+        if m.group(1) not in _NOT_COINS:
+            return m.group(1)
+    return None
+
+
+def _connect_index(index_path):
+    conn = sqlite3.connect(index_path, timeout=10, check_same_thread=False)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS blocks (
+            segment TEXT,
+            start INTEGER,
+            end INTEGER,
+            gz_start INTEGER,
+            gz_end INTEGER,
+            ts_min INTEGER,
+            ts_max INTEGER,
+            levels INTEGER,
+            coins TEXT,
+            lines INTEGER
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_blocks_ts ON blocks (ts_max, ts_min)')
+    conn.commit()
+    return conn
+
+
+class _Block:
+    """正在写入的块的统计"""
+
+    def __init__(self, start):
+        self.start = start
+        self.end = start
+        self.ts_min = None
+        self.ts_max = None
+        self.levels = 0
+        self.coins = set()
+        self.lines = 0
+
+    def add(self, entry, nbytes):
+        ts = entry['ts']
+        self.ts_min = ts if self.ts_min is None else min(self.ts_min, ts)
+        self.ts_max = ts if self.ts_max is None else max(self.ts_max, ts)
+        self.levels |= LEVEL_BITS.get(entry.get('level'), 0)
+        if entry.get('coin'):
+            self.coins.add(entry['coin'])
+        self.lines += 1
+        self.end += nbytes
+
+
+class JsonLogHandler(logging.Handler):
+    """写 JSON 行日志的 handler，负责轮转、后台压缩和维护分块索引"""
+
+    def __init__(self, path, max_bytes=50 * 1024 * 1024, rotate_seconds=86400, backup_count=30,
+                 block_bytes=256 * 1024):
+        super().__init__()
+        self.path = path
+        self.index_path = path + '.idx'
+        self.max_bytes = max_bytes
+        self.rotate_seconds = rotate_seconds
+        self.backup_count = backup_count
+        self.block_bytes = block_bytes
+        self.segment = os.path.basename(path)
+        self._index = _connect_index(self.index_path)
+        self._compressors = []
+        self._open()
+        self._resume_compression()
+
+    # --- 文件与索引 ---
+
+    def _open(self):
+        self._file = open(self.path, 'ab')
+        size = self._file.tell()
+        indexed, first_ts = self._index.execute('SELECT MAX(end), MIN(ts_min) FROM blocks WHERE segment = ?',
+                                                (self.segment,)).fetchone()
+        indexed = indexed or 0
+        # 分段的打开时间: 续写已有文件时取其第一条日志的时间
+        self._opened_at = first_ts / 1000 if size and first_ts else time.time()
+        self._block = _Block(indexed)
+        if indexed < size:
+            self._index_existing(indexed, size)  # 上次异常退出时未入索引的尾部
+
+    def _resume_compression(self):
+        """上次轮转后未来得及压缩就退出的分段，重新压缩"""
+        directory = os.path.dirname(os.path.abspath(self.path))
+        for (segment,) in self._index.execute(
+                "SELECT DISTINCT segment FROM blocks WHERE segment != ? AND segment NOT LIKE '%.gz'", (self.segment,)).fetchall():
+            closed = os.path.join(directory, segment)
+            if os.path.exists(closed):
+                self._start_compression(closed)
+
+    def _start_compression(self, closed):
+        t = threading.Thread(target=compress_segment, args=(closed, self.index_path, self.backup_count),
+                             daemon=True, name='log-compress')
+        t.start()
+        self._compressors = [c for c in self._compressors if c.is_alive()] + [t]
+
+    def _index_existing(self, start, end):
+        with open(self.path, 'rb') as f:
+            f.seek(start)
+            for line in f:
+                if self._block.end + len(line) > end:
+                    break
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    entry = {'ts': self._block.ts_max or 0}
+                self._block.add(entry, len(line))
+                if self._block.end - self._block.start >= self.block_bytes:
+                    self._flush_block()
+
+    def _flush_block(self):
+        b = self._block
+        if b.lines:
+            self._index.execute(
+                'INSERT INTO blocks (segment, start, end, ts_min, ts_max, levels, coins, lines) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (self.segment, b.start, b.end, b.ts_min, b.ts_max, b.levels,
+                 ',' + ','.join(sorted(b.coins)) + ',', b.lines))
+            self._index.commit()
+        self._block = _Block(b.end)
+
+    # --- 写入 ---
+
+    def emit(self, record):
+        try:
+            entry = {
+                'ts': int(record.created * 1000),
+                'time': datetime.fromtimestamp(record.created).strftime('%Y-%m-%d %H:%M:%S') + f",{int(record.msecs):03d}",
+                'level': record.levelname,
+                'logger': record.name,
+                'msg': record.getMessage(),
+            }
+            if record.exc_info:
+                entry['msg'] += '\n' + logging.Formatter().formatException(record.exc_info)
+            coin = extract_coin(record)
+            if coin:
+                entry['coin'] = coin
+            data = (json.dumps(entry, ensure_ascii=False) + '\n').encode('utf-8')
+
+            self.acquire()
+            try:
+                if self._should_rotate(len(data)):
+                    self._rotate()
+                self._file.write(data)
+                self._file.flush()
+                self._block.add(entry, len(data))
+                if self._block.end - self._block.start >= self.block_bytes:
+                    self._flush_block()
+            finally:
+                self.release()
+        except Exception:
+            self.handleError(record)
+
+    def _should_rotate(self, incoming):
+        size = self._block.end
+        if size == 0:
+            return False
+        return size + incoming > self.max_bytes or time.time() - self._opened_at >= self.rotate_seconds
+
+    def _rotate(self):
+        self._flush_block()
+        self._file.close()
+
+        base, ext = os.path.splitext(self.path)
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+        closed, n = f"{base}.{stamp}{ext}", 1
+        while os.path.exists(closed) or os.path.exists(closed + '.gz'):
+            closed, n = f"{base}.{stamp}-{n}{ext}", n + 1
+        os.replace(self.path, closed)
+        closed_name = os.path.basename(closed)
+        self._index.execute('UPDATE blocks SET segment = ? WHERE segment = ?', (closed_name, self.segment))
+        self._index.commit()
+
+        self._start_compression(closed)
+        self._open()
+
+    def close(self):
+        self.acquire()
+        try:
+            self._flush_block()
+            self._file.close()
+            self._index.close()
+        finally:
+            self.release()
+        for t in self._compressors:
+            t.join(timeout=30)
+        super().close()
+
+
+def compress_segment(path, index_path, backup_count=30):
+    """将已关闭的分段按块压缩为多 member 的 .gz，记录每块压缩后的偏移，并清理超出保留数的旧分段"""
+    conn = _connect_index(index_path)
+    try:
+        name = os.path.basename(path)
+        gz_path = path + '.gz'
+        rows = conn.execute('SELECT rowid, start, end FROM blocks WHERE segment = ? ORDER BY start', (name,)).fetchall()
+        updates = []
+        with open(path, 'rb') as src, open(gz_path + '.tmp', 'wb') as dst:
+            for rowid, start, end in rows:
+                src.seek(start)
+                gz_start = dst.tell()
+                dst.write(gzip.compress(src.read(end - start)))
+                updates.append((gz_start, dst.tell(), os.path.basename(gz_path), rowid))
+        os.replace(gz_path + '.tmp', gz_path)
+        conn.executemany('UPDATE blocks SET gz_start = ?, gz_end = ?, segment = ? WHERE rowid = ?', updates)
+        conn.commit()
+        os.remove(path)
+
+        # 保留最近 backup_count 个压缩分段
+        directory = os.path.dirname(os.path.abspath(path))
+        segments = [r[0] for r in conn.execute(
+            "SELECT segment FROM blocks WHERE segment LIKE '%.gz' GROUP BY segment ORDER BY MIN(ts_min)")]
+        for old in segments[:max(len(segments) - backup_count, 0)]:
+            try:
+                os.remove(os.path.join(directory, old))
+            except FileNotFoundError:
+                pass
+            conn.execute('DELETE FROM blocks WHERE segment = ?', (old,))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _read_block(directory, segment, start, end, gz_start, gz_end):
+    path = os.path.join(directory, segment)
+    with open(path, 'rb') as f:
+        if segment.endswith('.gz'):
+            f.seek(gz_start)
+            return gzip.decompress(f.read(gz_end - gz_start))
+        f.seek(start)
+        return f.read(end - start)
+
+
+def _matches(entry, start_ms, end_ms, levels, coin):
+    ts = entry.get('ts', 0)
+    if start_ms is not None and ts < start_ms:
+        return False
+    if end_ms is not None and ts > end_ms:
+        return False
+    if levels and entry.get('level') not in levels:
+        return False
+    if coin and entry.get('coin') != coin:
+        return False
+    return True
+
+
+def query_logs(path, start_ms=None, end_ms=None, levels=None, coin=None, limit=None):
+    """按时间范围 / 级别 / 币种查询结构化日志 (按时间升序逐条返回)
+
+    先用索引挑出可能命中的块，只读取这些块；当前分段中尚未入索引的尾部直接扫描。
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    index_path = path + '.idx'
+    if not os.path.exists(index_path):
+        return
+
+    sql = 'SELECT segment, start, end, gz_start, gz_end FROM blocks WHERE 1 = 1'
+    params = []
+    if start_ms is not None:
+        sql += ' AND ts_max >= ?'
+        params.append(start_ms)
+    if end_ms is not None:
+        sql += ' AND ts_min <= ?'
+        params.append(end_ms)
+    if levels:
+        sql += ' AND (levels & ?) != 0'
+        params.append(sum(LEVEL_BITS.get(lv, 0) for lv in levels))
+    if coin:
+        sql += ' AND coins LIKE ?'
+        params.append(f'%,{coin},%')
+    sql += ' ORDER BY ts_min, start'
+
+    conn = _connect_index(index_path)
+    try:
+        blocks = conn.execute(sql, params).fetchall()
+        current = os.path.basename(path)
+        tail_start = conn.execute('SELECT MAX(end) FROM blocks WHERE segment = ?', (current,)).fetchone()[0] or 0
+    finally:
+        conn.close()
+
+    count = 0
+    for segment, start, end, gz_start, gz_end in blocks:
+        if segment.endswith('.gz') and gz_start is None:
+            continue  # 正在压缩
+        try:
+            data = _read_block(directory, segment, start, end, gz_start, gz_end)
+        except FileNotFoundError:
+            continue  # 已被清理或刚完成压缩
+        for line in data.splitlines():
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if _matches(entry, start_ms, end_ms, levels, coin):
+                yield entry
+                count += 1
+                if limit and count >= limit:
+                    return
+
+    # 当前分段尚未入索引的尾部
+    if os.path.exists(path):
+        with open(path, 'rb') as f:
+            f.seek(tail_start)
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if _matches(entry, start_ms, end_ms, levels, coin):
+                    yield entry
+                    count += 1
+                    if limit and count >= limit:
+                        return
+
+
+def format_entry(entry):
+    """格式化为与原文本日志一致的一行"""
+    return f"{entry.get('time')} - {entry.get('level')} - {entry.get('msg')}"
@@ -0,0 +1,140 @@
+import time
+import logging
+import threading
+
+from state_model import AccountState
+
+logger = logging.getLogger(__name__)
+
+
+class TargetSnapshot:
+    """某个地址最近一次轮询的结果 (在会话之间共享，只读)"""
+
+    __slots__ = ('user_state', 'open_orders', 'account', 'fetched_at', 'error')
+
+    def __init__(self, user_state=None, open_orders=None, account=None, fetched_at=0.0, error=None):
+        self.user_state = user_state
+        self.open_orders = open_orders
+        self.account = account
+        self.fetched_at = fetched_at
+        self.error = error
+
+
+# 轮询失败后的退避上限 (秒)
+MAX_BACKOFF = 60.0
+
+
+class _Watch:
+    __slots__ = ('requested', 'last_viewed', 'snapshot', 'ready', 'force', 'failures')
+
+    def __init__(self, interval):
+        self.requested = {interval: time.time()}  # 会话请求的间隔 -> 最近一次请求时间
+        self.last_viewed = time.time()
+        self.snapshot = TargetSnapshot()
+        self.ready = threading.Event()
+        self.force = False
+        self.failures = 0  # 连续失败次数
+
+    def interval(self, now):
+        """当前轮询间隔: 仍在刷新的会话中最短的请求间隔，连续失败时按次数加倍退避"""
+        # 超过 3 个自身间隔没有再请求的会话视为已离开 (至少保留最近一次的请求)
+        latest = max(self.requested, key=self.requested.get)
+        for interval, seen in list(self.requested.items()):
+            if interval != latest and now - seen > max(interval * 3, 10.0):
+                del self.requested[interval]
+        interval = min(self.requested)
+        if self.failures:
+            interval = min(interval * 2 ** min(self.failures, 10), max(MAX_BACKOFF, interval))
+        return interval
+
+
+class TargetPoller:
+    """看板的共享后台轮询 (放在 st.cache_resource 中，所有会话共用一个实例)
+
+    每个被查看的地址由后台线程按间隔轮询一次 user_state / open_orders 并解析为 AccountState，
+    会话只读取最新快照，打开多少个页面都不会增加 API 请求。超过 idle_timeout 秒没有会话查看的地址
+    停止轮询并移除。
+    """
+
+    def __init__(self, info, idle_timeout=300.0, first_fetch_timeout=10.0):
+        self.info = info
+        self.idle_timeout = idle_timeout
+        self.first_fetch_timeout = first_fetch_timeout
+        self._watches = {}  # address -> _Watch
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = threading.Thread(target=self._loop, daemon=True, name='target-poller')
+        self._thread.start()
+
+    def get(self, address, interval=5.0):
+        """返回 address 的最新快照；首次查看时等待第一次轮询完成 (最多 first_fetch_timeout 秒)"""
+        with self._lock:
+            watch = self._watches.get(address)
+            if watch is None:
+                watch = self._watches[address] = _Watch(interval)
+                self._wakeup.set()
+            watch.last_viewed = time.time()
+            # 多个会话以不同间隔查看同一地址时按最短的间隔轮询，会话离开后恢复
+            watch.requested[interval] = watch.last_viewed
+        watch.ready.wait(self.first_fetch_timeout)
+        return watch.snapshot
+
+    def request_refresh(self, address):
+        """让某个地址在下一轮立即重新轮询 (页面上的手动刷新)"""
+        with self._lock:
+            watch = self._watches.get(address)
+            if watch is not None:
+                watch.force = True
+                watch.ready.clear()
+        self._wakeup.set()
+
+    def watched(self):
+        with self._lock:
+            return list(self._watches)
+
+    def _loop(self):
+        while True:
+            now = time.time()
+            with self._lock:
+                for address in [a for a, w in self._watches.items() if now - w.last_viewed > self.idle_timeout]:
+                    del self._watches[address]
+                    logger.info(f"停止轮询空闲地址: {address}")
+                intervals = {a: w.interval(now) for a, w in self._watches.items()}
+                due = [(a, w) for a, w in self._watches.items()
+                       if w.force or now - w.snapshot.fetched_at >= intervals[a]]
+                next_due = min((w.snapshot.fetched_at + intervals[a] for a, w in self._watches.items()),
+                               default=now + 1)
+
+            for address, watch in due:
+                watch.snapshot = self._fetch(address, watch, intervals[address])
+                watch.ready.set()
+
+            self._wakeup.wait(max(min(next_due - time.time(), 1.0), 0.05))
+            self._wakeup.clear()
+
+    def _fetch(self, address, watch, interval):
+        previous = watch.snapshot
+        # 手动刷新时不使用缓存 (force / failures 会被会话线程和 _loop 同时读写，统一在锁内修改)
+        with self._lock:
+            max_age = 0 if watch.force else interval
+            watch.force = False
+        try:
+            user_state = self.info.user_state(address, max_age=max_age)
+        except Exception as e:
+            # 保留上一次的数据，由页面提示错误；下一次轮询退避
+            with self._lock:
+                watch.failures += 1
+            return TargetSnapshot(previous.user_state, previous.open_orders, previous.account, time.time(), e)
+        try:
+            open_orders = self.info.open_orders(address, max_age=max_age)
+        except Exception as e:
+            # 持仓照常更新，挂单保留上一次的数据 (而不是显示为没有挂单)，由页面提示错误；下一次轮询退避
+            with self._lock:
+                watch.failures += 1
+            open_orders = previous.open_orders or []
+            account = AccountState.from_api(perps=user_state, orders=open_orders)
+            return TargetSnapshot(user_state, open_orders, account, time.time(), e)
+        with self._lock:
+            watch.failures = 0  # 恢复正常后回到请求的间隔
+        account = AccountState.from_api(perps=user_state, orders=open_orders)
+        return TargetSnapshot(user_state, open_orders, account, time.time())
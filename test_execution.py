@@ -0,0 +1,146 @@
+"""滑点感知执行 (ExecutionEngine / L2BookCache) 的盘口回放测试
+
+    python -m pytest -q test_execution.py
+"""
+import pytest
+
+from execution import ExecutionEngine, L2BookCache, book_mid, estimate_fill, max_size_within
+
+
+def level(px, sz):
+    return {'px': str(px), 'sz': str(sz), 'n': 1}
+
+
+# 录制的 ETH l2Book 快照 (info.l2_snapshot 返回格式)，按请求顺序回放
+RECORDED_BOOKS = [
+    {'coin': 'ETH', 'time': 1760000000000,
+     'levels': [[level(1999.0, 5.0), level(1998.0, 5.0)],
+                [level(2001.0, 1.0), level(2002.0, 1.0), level(2005.0, 10.0)]]},
+    # 第一笔子单吃掉卖一卖二后，盘口补上新的流动性
+    {'coin': 'ETH', 'time': 1760000001000,
+     'levels': [[level(1999.0, 5.0)],
+                [level(2001.0, 3.0), level(2003.0, 20.0)]]},
+]
+
+
+class ReplayInfo:
+    """按顺序返回录制盘口的 Info"""
+
+    def __init__(self, books):
+        self.books = list(books)
+        self.calls = 0
+
+    def l2_snapshot(self, coin):
+        book = self.books[min(self.calls, len(self.books) - 1)]
+        self.calls += 1
+        return book
+
+
+class BookExchange:
+    """按最近一次回放的盘口撮合 IOC 子单: 只成交限价以内的深度"""
+
+    def __init__(self, info):
+        self.info = info
+        self.children = []  # (sz, limit_px)
+        self.market_orders = []
+
+    def _book(self):
+        return self.info.books[min(self.info.calls, len(self.info.books)) - 1]
+
+    def order(self, coin, is_buy, sz, limit_px, order_type):
+        assert order_type == {'limit': {'tif': 'Ioc'}}
+        self.children.append((sz, limit_px))
+        side = self._book()['levels'][1 if is_buy else 0]
+        remaining, cost = sz, 0.0
+        for lvl in side:
+            px = float(lvl['px'])
+            if (is_buy and px > limit_px) or (not is_buy and px < limit_px) or remaining <= 0:
+                break
+            take = min(remaining, float(lvl['sz']))
+            cost += take * px
+            remaining -= take
+        filled = sz - remaining
+        status = {'filled': {'totalSz': str(filled), 'avgPx': str(cost / filled)}} if filled else {'resting': {'oid': 1}}
+        return {'status': 'ok', 'response': {'data': {'statuses': [status]}}}
+
+    def market_open(self, coin, is_buy, sz, px, slippage):
+        self.market_orders.append((coin, is_buy, sz))
+        return {'status': 'ok', 'response': {'data': {'statuses': [{'filled': {'totalSz': str(sz), 'avgPx': '2001.0'}}]}}}
+
+
+def build_engine(books, max_impact=0.002):
+    info = ReplayInfo(books)
+    exchange = BookExchange(info)
+    engine = ExecutionEngine(exchange, L2BookCache(info, ttl=60), slippage=0.01, max_impact=max_impact,
+                             child_interval=0, round_sz=lambda coin, sz: round(sz, 2),
+                             round_px=lambda coin, px: round(px, 1))
+    return engine, exchange, info
+
+
+def test_book_math_on_recorded_snapshot():
+    book = RECORDED_BOOKS[0]
+    assert book_mid(book) == pytest.approx(2000.0)
+    # 吃 2 个: (2001 + 2002) / 2
+    avg_px, mid, impact, filled = estimate_fill(book, True, 2.0)
+    assert avg_px == pytest.approx(2001.5)
+    assert impact == pytest.approx(1.5 / 2000)
+    assert filled == 2.0
+    # 深度不足时只报告能成交的部分
+    assert estimate_fill(book, True, 50.0)[3] == 12.0
+    # 20bps 以内: 2001 + 2002 全部，再加 2005 档的 5 个使均价正好为 2004
+    assert max_size_within(book, True, 0.002) == pytest.approx(7.0)
+    assert max_size_within(book, False, 0.002) == pytest.approx(10.0)
+
+
+def test_small_order_goes_out_as_single_market_order():
+    engine, exchange, _ = build_engine(RECORDED_BOOKS)
+    assert engine.execute('ETH', True, 1.0, 2001.0) == 1.0
+    assert exchange.market_orders == [('ETH', True, 1.0)]
+    assert exchange.children == []
+
+
+def test_large_order_is_sliced_into_ioc_children():
+    engine, exchange, info = build_engine(RECORDED_BOOKS)
+    filled = engine.execute('ETH', True, 20.0, 2001.0)
+
+    # 子单 1: 按阈值内深度下 7 个，限价 mid x (1 + 20bps)，只成交限价内的 2 个
+    # 子单 2: 刷新盘口后剩余 18 个都在阈值内，一次吃完
+    assert exchange.children == [(7.0, 2004.0), (18.0, 2004.0)]
+    assert filled == pytest.approx(20.0)
+    assert exchange.market_orders == []
+    assert info.calls == 2  # 估算和第一笔子单共用缓存盘口，之后每笔子单刷新一次
+
+
+def test_sell_children_use_lower_limit_and_last_child_takes_remaining():
+    thin = {'coin': 'ETH', 'time': 1760000002000,
+            'levels': [[level(1999.0, 0.5), level(1990.0, 100.0)], [level(2001.0, 5.0)]]}
+    engine, exchange, _ = build_engine([thin], max_impact=0.001)
+    engine.max_children = 3
+    filled = engine.execute('ETH', False, 3.0, 1999.0)
+
+    # 阈值内只有 0.5，最小子单 = 3 / 3 = 1；每笔成交 0.5，最后一笔补齐剩余 2；限价 2000 x (1 - 10bps)
+    assert exchange.children == [(1.0, 1998.0), (1.0, 1998.0), (2.0, 1998.0)]
+    assert filled == pytest.approx(1.5)
+
+
+def test_book_cache_ttl_and_stale_fallback():
+    class FlakyInfo:
+        def __init__(self):
+            self.calls = 0
+
+        def l2_snapshot(self, coin):
+            self.calls += 1
+            if self.calls > 1:
+                raise TimeoutError('timeout')
+            return RECORDED_BOOKS[0]
+
+    info = FlakyInfo()
+    cache = L2BookCache(info, ttl=60)
+    assert cache.get('ETH') is RECORDED_BOOKS[0]
+    assert cache.get('ETH') is RECORDED_BOOKS[0]
+    assert info.calls == 1
+    # 过期后请求失败时退回旧盘口
+    cache.put('ETH', RECORDED_BOOKS[1], now=0)
+    assert cache.get('ETH') is RECORDED_BOOKS[1]
+    assert info.calls == 2
+    assert L2BookCache(info).get('BTC') is None
@@ -0,0 +1,72 @@
+"""快速跟随通道与全量同步的衔接: 全量同步已覆盖的目标成交不应再被快速通道跟一次
+
+    python -m pytest -q test_fast_path.py
+"""
+import threading
+import time
+
+import hyperliquid_copy_trader as copier
+from state_model import AccountState
+
+
+class OrderExchange:
+    def __init__(self):
+        self.orders = []
+
+    def order(self, coin, is_buy, sz, limit_px, order_type, reduce_only=False, cloid=None):
+        self.orders.append((coin, is_buy, sz))
+        return {'status': 'ok', 'response': {'data': {'statuses': [{'filled': {'totalSz': str(sz), 'avgPx': '2000'}}]}}}
+
+
+class NullPnl:
+    def note_reference(self, *args):
+        pass
+
+
+def build_copier(get_user_state):
+    bot = copier.HyperliquidCopier.__new__(copier.HyperliquidCopier)
+    bot.exchange = OrderExchange()
+    bot.trade_lock = threading.Lock()
+    bot.last_reconciled_ms = 0
+    bot.local_positions = {}
+    bot.initialized_baseline = True
+    bot.my_address = '0xme'
+    bot.pnl_engine = NullPnl()
+    bot.is_spot_asset = lambda coin: False
+    bot.round_sz = lambda coin, sz: round(sz, 4)
+    bot.round_limit_px = lambda coin, px: round(px, 1)
+    bot.journal_event = lambda event_type, data: None
+    bot.get_user_state = get_user_state
+    bot.sync_positions = lambda target, mine: None
+    bot.sync_open_orders = lambda target, mine: None
+    return bot
+
+
+def fill_at(time_ms):
+    return {'coin': 'ETH', 'side': 'B', 'px': '2000', 'sz': '1.0', 'time': time_ms, 'tid': time_ms,
+            'hash': '0xabc', 'startPosition': '0'}
+
+
+def test_fill_during_target_fetch_is_not_mirrored_again(monkeypatch):
+    monkeypatch.setattr(copier, 'MARKET_TYPES', ['perps'])
+    monkeypatch.setattr(copier, 'POSITION_DIFF_THRESHOLD_USD', 0)
+    fills = []
+
+    def get_user_state(address):
+        # 目标在快照请求途中成交: 成交已计入返回的快照
+        if address == copier.TARGET_ADDRESS:
+            time.sleep(0.01)
+            fills.append(fill_at(int(time.time() * 1000)))
+            time.sleep(0.01)
+        return AccountState()
+
+    bot = build_copier(get_user_state)
+    assert bot.tick()[1]
+    # 快速通道随后收到这笔成交的推送
+    bot.mirror_fill(fills[0])
+    assert bot.exchange.orders == []
+
+    # 快照之后的新成交照常跟随
+    time.sleep(0.002)
+    bot.mirror_fill(fill_at(int(time.time() * 1000)))
+    assert bot.exchange.orders == [('ETH', True, 1.0)]
@@ -0,0 +1,88 @@
+"""成交时间桶汇总 (update_history_rollups) 与成交去重键的测试
+
+    python -m pytest -q test_history_rollups.py
+"""
+import sqlite3
+
+import pytest
+
+import database as db
+
+T = '0xtarget'
+MINUTE = 60000
+T0 = 1760000000000 // 86400000 * 86400000  # 整天起点 (UTC)
+
+
+def trade(tid, px, sz, side='B', time_ms=T0 + 1000, tx_hash='0xsame'):
+    return {'coin': 'ETH', 'px': str(px), 'sz': str(sz), 'side': side, 'time': time_ms, 'hash': tx_hash,
+            'fee': '0.1', 'tid': tid, 'closedPnl': '0'}
+
+
+def bucket(resolution, time_ms=T0):
+    conn = sqlite3.connect(db.HISTORY_DB_FILE)
+    try:
+        width = db.ROLLUP_RESOLUTIONS[resolution]
+        return conn.execute('''SELECT fills, buy_sz, sell_sz, net_sz, volume, vwap, fees, position_sz
+                               FROM history_rollups WHERE target_address = ? AND coin = 'ETH'
+                               AND resolution = ? AND bucket = ?''',
+                            (T, resolution, time_ms // width * width)).fetchone()
+    finally:
+        conn.close()
+
+
+@pytest.fixture
+def history_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, 'HISTORY_DB_FILE', str(tmp_path / 'history.db'))
+    return tmp_path
+
+
+def test_partial_fills_sharing_hash_are_all_rolled_up(history_db):
+    db.init_history_db()
+    # 同一笔交易拆成两笔部分成交: hash 相同，tid 不同
+    assert db.log_trades(T, [trade(1, 2000.0, 1.0), trade(2, 2010.0, 3.0)]) == 2
+    # 重复写入按 fill_id 忽略
+    assert db.log_trades(T, [trade(1, 2000.0, 1.0)]) == 0
+    db.update_history_rollups()
+
+    for resolution in ('1m', '1h', '1d'):
+        fills, buy_sz, sell_sz, net_sz, volume, vwap, fees, _ = bucket(resolution)
+        assert fills == 2
+        assert buy_sz == pytest.approx(4.0) and sell_sz == 0 and net_sz == pytest.approx(4.0)
+        assert volume == pytest.approx(4.0)
+        assert vwap == pytest.approx((2000.0 + 3 * 2010.0) / 4)
+        assert fees == pytest.approx(0.2)
+
+
+def test_migration_rebuilds_trade_rollups_and_keeps_positions(history_db, monkeypatch):
+    # 迁移 4 之前的库: 成交按 hash 去重，汇总已累加过
+    migrations = db.HISTORY_MIGRATIONS
+    monkeypatch.setattr(db, 'HISTORY_MIGRATIONS', migrations[:3])
+    db.init_history_db()
+    conn = sqlite3.connect(db.HISTORY_DB_FILE)
+    conn.executemany('''INSERT INTO history_trades (hash, timestamp, target_address, coin, side, px, sz, fee, tid,
+                        record_time, closed_pnl) VALUES (?, ?, ?, 'ETH', ?, ?, ?, 0.1, ?, '', 0)''',
+                     [('0xa', T0 + 1000, T, 'B', 2000.0, 1.0, '1'),
+                      ('0xb', T0 + MINUTE, T, 'A', 2020.0, 0.5, '2')])
+    conn.execute('''INSERT INTO history_positions (timestamp, target_address, coin, size, entry_px, leverage,
+                    record_time) VALUES (?, ?, 'ETH', 0.5, 2000.0, 5, '')''', (T0 + 2000, T))
+    conn.commit()
+    conn.close()
+    db.update_history_rollups()
+    before = bucket('1d')
+    assert before[0] == 2 and before[7] == 0.5
+
+    # 升级: 成交表按 fill_id 重建，汇总按水位归零后重新累加，不重复计入
+    monkeypatch.setattr(db, 'HISTORY_MIGRATIONS', migrations)
+    db.init_history_db()
+    conn = sqlite3.connect(db.HISTORY_DB_FILE)
+    assert conn.execute("SELECT last_rowid FROM rollup_state WHERE source = 'history_trades'").fetchone() is None
+    conn.close()
+    db.update_history_rollups()
+    assert bucket('1d') == pytest.approx(before)
+    assert bucket('1m')[0] == 1 and bucket('1m', T0 + MINUTE)[0] == 1
+
+    # 升级后同一 hash 的另一笔部分成交可以写入并计入汇总
+    assert db.log_trades(T, [trade(3, 2000.0, 1.0, tx_hash='0xa')]) == 1
+    db.update_history_rollups()
+    fills, buy_sz, *_ = bucket('1d')
+    assert fills == 3 and buy_sz == pytest.approx(2.0)
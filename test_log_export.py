@@ -0,0 +1,66 @@
+"""日志 CSV 导出 (LogCsvExporter) 的测试: 稀疏索引 + 按需从磁盘读取
+
+    python -m pytest -q test_log_export.py
+"""
+import csv
+import io
+import json
+from datetime import datetime, timedelta
+
+from log_export import LogCsvExporter
+
+BASE = datetime(2025, 1, 1)
+
+
+def stamp(i):
+    return (BASE + timedelta(seconds=30 * i)).strftime('%Y-%m-%d %H:%M:%S') + ',000'
+
+
+def read_csv(exporter, start=None, end=None):
+    text = b''.join(exporter.iter_csv(start, end)).decode('utf-8-sig')
+    return list(csv.reader(io.StringIO(text)))[1:]
+
+
+def test_text_log_range_and_continuation_lines(tmp_path):
+    path = tmp_path / 'bot.log'
+    with open(path, 'w', encoding='utf-8') as f:
+        for i in range(5000):
+            f.write(f"{stamp(i)} - INFO - 消息 {i}\n")
+            if i == 2500:
+                f.write("Traceback (most recent call last):\n  boom\n")
+        f.write(f"{stamp(5000)} - INFO - 仍在写入")  # 不完整的最后一行
+
+    exporter = LogCsvExporter(str(path), read_size=4096, index_every=100)
+    rows = read_csv(exporter)
+    assert len(rows) == len(exporter) == 5000
+    # 内存中只有稀疏索引
+    assert len(exporter._index_times) == 50
+    assert rows[2500][2] == "消息 2500 | Traceback (most recent call last): | boom"
+
+    # 时间范围: 两端包含，结束时间按前缀匹配
+    rows = read_csv(exporter, stamp(1234)[:19], stamp(1300)[:16])
+    assert rows[0][0] == stamp(1234)
+    assert rows[-1][0] == stamp(1301)  # 同一分钟内的 30 秒也包含在内
+    assert read_csv(exporter, '2030-01-01') == []
+
+    # 追加的内容只增量索引
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write("\n")
+    assert exporter.refresh() == 1
+    assert read_csv(exporter, stamp(5000)[:19])[0][2] == '仍在写入'
+
+
+def test_jsonl_log_and_file_replaced(tmp_path):
+    path = tmp_path / 'bot.jsonl'
+    with open(path, 'w') as f:
+        for i in range(300):
+            f.write(json.dumps({'time': stamp(i), 'level': 'WARNING', 'msg': f'm{i}'}) + '\n')
+            f.write('not json\n')
+    exporter = LogCsvExporter(str(path), index_every=64)
+    assert [r[2] for r in read_csv(exporter, stamp(100), stamp(102))] == ['m100', 'm101', 'm102']
+
+    # 日志被清空后重新索引
+    open(path, 'w').close()
+    with open(path, 'a') as f:
+        f.write(json.dumps({'time': stamp(0), 'level': 'INFO', 'msg': 'new'}) + '\n')
+    assert read_csv(exporter) == [[stamp(0), 'INFO', 'new']]
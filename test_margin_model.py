@@ -0,0 +1,106 @@
+"""本地保证金模型 (MarginModel) 与挂单优先级的单元测试
+
+    python -m pytest -q test_margin_model.py
+"""
+import pytest
+
+import hyperliquid_copy_trader as copier
+from margin_model import MarginModel
+from state_model import AccountState, Order, Position
+
+
+def perp_state(account_value, margin_used=0.0, withdrawable=None, positions=()):
+    state = AccountState()
+    state.account_value = account_value
+    state.margin_used = margin_used
+    state.withdrawable = withdrawable
+    for p in positions:
+        state.positions[p.coin] = p
+    return state
+
+
+def test_unknown_margin_is_unlimited():
+    model = MarginModel(AccountState())
+    assert model.reserve('ETH', True, 2000.0, 100.0)
+    assert model.reserve('PURR/USDC', True, 1.0, 1e9, is_spot=True)
+
+
+def test_reserve_and_release_perp():
+    # 可用 = withdrawable x buffer = 1000，默认杠杆 5x
+    model = MarginModel(perp_state(2000.0, withdrawable=1000.0), default_leverage=5, buffer=1.0)
+    assert model.reserve('ETH', True, 2000.0, 2.0)       # 需要 800
+    assert model.perp_available == pytest.approx(200.0)
+    assert not model.reserve('ETH', True, 2000.0, 1.0)   # 需要 400，放不下且不扣减
+    assert model.perp_available == pytest.approx(200.0)
+
+    # 撤掉一个 1 ETH 的挂单释放 400 后放得下
+    model.release('ETH', True, 2000.0, 1.0)
+    assert model.reserve('ETH', True, 2000.0, 1.0)
+    assert model.perp_available == pytest.approx(200.0)
+
+
+def test_available_falls_back_to_account_value_minus_used_and_position_leverage():
+    model = MarginModel(perp_state(1000.0, margin_used=400.0, positions=[Position('BTC', 0.0, leverage=10)]),
+                        default_leverage=1, buffer=0.5)
+    assert model.perp_available == pytest.approx(300.0)
+    assert model.perp_margin('BTC', True, 30000.0, 0.1) == pytest.approx(300.0)
+    assert model.perp_margin('ETH', True, 2000.0, 0.1) == pytest.approx(200.0)
+
+
+def test_reducing_orders_do_not_need_margin_until_position_is_used_up():
+    model = MarginModel(perp_state(100.0, withdrawable=0.0, positions=[Position('ETH', 1.0, leverage=1)]))
+    # 多仓 1 ETH: 卖单的前 1 ETH 是减仓，不占保证金
+    assert model.reserve('ETH', False, 2000.0, 0.6)
+    assert model.reserve('ETH', False, 2000.0, 0.4)
+    # 可减仓数量已用完，之后的卖单需要保证金
+    assert not model.reserve('ETH', False, 2000.0, 0.1)
+    # 同方向 (加仓) 始终需要保证金
+    assert not model.reserve('ETH', True, 2000.0, 0.1)
+
+
+def test_spot_reserve_and_release():
+    state = AccountState()
+    state.spot_balances = {'USDC': (100.0, 20.0), 'PURR': (50.0, 0.0)}
+    model = MarginModel(state, buffer=1.0, pair_to_token={'@1': 'PURR'})
+    assert model.reserve('@1', True, 2.0, 40.0, is_spot=True)      # 80 USDC
+    assert not model.reserve('@1', True, 2.0, 1.0, is_spot=True)   # 剩余 0
+    assert model.reserve('@1', False, 2.0, 50.0, is_spot=True)     # 卖单占用 PURR
+    assert not model.reserve('@1', False, 2.0, 1.0, is_spot=True)
+    model.release('@1', True, 2.0, 10.0, is_spot=True)
+    assert model.spot_free['USDC'] == pytest.approx(20.0)
+    model.release('@1', False, 2.0, 5.0, is_spot=True)
+    assert model.spot_free['PURR'] == pytest.approx(5.0)
+
+
+def test_select_keeps_priority_order_and_skips_what_does_not_fit():
+    model = MarginModel(perp_state(1000.0, withdrawable=1000.0), default_leverage=1, buffer=1.0)
+    planned = [('big', 'ETH', True, 2000.0, 0.4, False),    # 800
+               ('too_big', 'ETH', True, 2000.0, 0.2, False),  # 400，放不下
+               ('small', 'SOL', True, 100.0, 1.0, False)]   # 100，仍放得下
+    selected, skipped = model.select(planned)
+    assert selected == ['big', 'small']
+    assert skipped == ['too_big']
+
+
+@pytest.fixture
+def bot():
+    bot = copier.HyperliquidCopier.__new__(copier.HyperliquidCopier)
+    return bot
+
+
+def test_prioritize_orders(bot, monkeypatch):
+    orders = [Order('ETH', 'B', 1900.0, 1.0, 1), Order('ETH', 'B', 2000.0, 0.1, 2), Order('ETH', 'A', 2100.0, 2.0, 3)]
+
+    monkeypatch.setattr(copier, 'ORDER_PRIORITY', 'price')
+    assert [o.oid for o in bot._prioritize_orders(orders)] == [3, 2, 1]
+
+    monkeypatch.setattr(copier, 'ORDER_PRIORITY', 'notional')
+    assert [o.oid for o in bot._prioritize_orders(orders)] == [3, 1, 2]
+
+    class Mids:
+        def all_mids(self):
+            return {'ETH': '1950'}
+
+    bot.info = Mids()
+    monkeypatch.setattr(copier, 'ORDER_PRIORITY', 'mid')
+    assert [o.oid for o in bot._prioritize_orders(orders)] == [1, 2, 3]
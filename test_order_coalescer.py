@@ -0,0 +1,67 @@
+"""目标挂单变化合并窗口 (OrderChangeCoalescer) 的单元测试
+
+    python -m pytest -q test_order_coalescer.py
+"""
+from order_coalescer import OrderChangeCoalescer
+
+A = frozenset({('ETH', 'B', 2000.0, 1.0)})
+B = frozenset({('ETH', 'B', 2001.0, 1.0)})
+C = frozenset({('ETH', 'B', 2002.0, 1.0)})
+
+
+def test_first_run_syncs_immediately():
+    oc = OrderChangeCoalescer(window=2.0, max_wait=10.0)
+    assert oc.should_sync(None, A, now=0.0)
+    assert oc.resyncs == 1
+
+
+def test_rapid_changes_coalesce_until_settled():
+    oc = OrderChangeCoalescer(window=2.0, max_wait=10.0)
+    oc.should_sync(None, A, now=0.0)
+
+    # 1 秒内连续改价: 每次都在窗口内，不同步
+    assert not oc.should_sync(A, B, now=1.0)
+    assert not oc.should_sync(A, C, now=1.5)
+    assert oc.is_pending
+    assert oc.poll_interval(5.0) == 2.0  # 挂起期间缩短轮询
+
+    # 最后一次变化后稳定满一个窗口: 只同步最终状态一次
+    assert not oc.should_sync(A, C, now=3.0)
+    assert oc.should_sync(A, C, now=3.5)
+    assert not oc.is_pending
+    assert oc.resyncs == 2
+    assert oc.observed_changes == 3
+    assert oc.saved == 1
+    assert oc.poll_interval(5.0) == 5.0
+
+
+def test_forced_flush_after_max_wait():
+    oc = OrderChangeCoalescer(window=2.0, max_wait=5.0)
+    oc.should_sync(None, A, now=0.0)
+
+    # 目标持续改价，从未稳定满 2 秒
+    keys = [B, C]
+    t = 1.0
+    released = False
+    while t < 5.0:
+        released = oc.should_sync(A, keys[int(t) % 2], now=t)
+        assert not released
+        t += 1.0
+    # 自首次变化 (t=1) 起等满 max_wait 后强制同步
+    assert oc.should_sync(A, keys[int(t) % 2], now=6.0)
+
+
+def test_return_to_synced_state_cancels_pending():
+    oc = OrderChangeCoalescer(window=2.0, max_wait=10.0)
+    oc.should_sync(None, A, now=0.0)
+    assert not oc.should_sync(A, B, now=1.0)
+    # 目标改回已同步的状态: 放弃等待，不需要同步
+    assert not oc.should_sync(A, A, now=1.5)
+    assert not oc.is_pending
+    assert oc.resyncs == 1
+
+
+def test_zero_window_disables_coalescing():
+    oc = OrderChangeCoalescer(window=0, max_wait=0)
+    oc.should_sync(None, A, now=0.0)
+    assert oc.should_sync(A, B, now=0.1)
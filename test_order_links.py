@@ -0,0 +1,149 @@
+"""挂单映射回归测试: 我的挂单成交后，目标的无关挂单变化不应导致补挂
+
+    python -m pytest -q test_order_links.py
+"""
+import logging
+
+import database as db
+import hyperliquid_copy_trader as copier
+from order_links import OrderLinkBook, target_order_key
+from state_model import AccountState, Order
+
+MY_ADDRESS = '0xme'
+TARGET_ADDRESS = '0xtarget'
+
+
+class RecordingExchange:
+    """记录下单的模拟交易接口 (挂单全部挂起，不成交)"""
+
+    def __init__(self):
+        self.placed = []  # (coin, side, sz, px, cloid)
+        self.modified = []  # (cloid, sz, px)
+        self._oid = 1000
+
+    def order(self, coin, is_buy, sz, limit_px, order_type, reduce_only=False, cloid=None):
+        self._oid += 1
+        self.placed.append((coin, 'B' if is_buy else 'A', sz, limit_px, cloid.to_raw()))
+        return {'status': 'ok', 'response': {'data': {'statuses': [{'resting': {'oid': self._oid}}]}}}
+
+    def bulk_cancel(self, cancel_requests):
+        return {'status': 'ok', 'response': {'data': {'statuses': ['success'] * len(cancel_requests)}}}
+
+    def bulk_modify_orders_new(self, modify_requests):
+        statuses = []
+        for req in modify_requests:
+            self._oid += 1
+            order = req['order']
+            self.modified.append((order['cloid'].to_raw(), order['sz'], order['limit_px']))
+            statuses.append({'resting': {'oid': self._oid}})
+        return {'status': 'ok', 'response': {'data': {'statuses': statuses}}}
+
+
+def build_copier(exchange):
+    bot = copier.HyperliquidCopier.__new__(copier.HyperliquidCopier)
+    bot.exchange = exchange
+    bot.spot_universe = set()
+    bot.spot_token_to_pair = {}
+    bot.is_spot_asset = lambda coin: False
+    bot.get_sz_decimals = lambda coin: 2
+    bot.journal_event = lambda event_type, data: None
+    bot.order_links = OrderLinkBook(MY_ADDRESS, TARGET_ADDRESS)
+    bot.last_target_keys = None
+    bot.order_coalescer = copier.OrderChangeCoalescer(0, 0)
+    bot.reconcile_pool = copier.ThreadPoolExecutor(max_workers=1)
+    return bot
+
+
+def my_open_orders(bot, exchange, filled_cloids=()):
+    """我的当前挂单: 已下的单中去掉已成交的"""
+    oids = {link['cloid']: link['my_oid'] for _, link in bot.order_links.items()}
+    return [Order(coin, side, px, sz, oids.get(cloid), cloid)
+            for coin, side, sz, px, cloid in exchange.placed if cloid not in filled_cloids]
+
+
+def setup_env(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, 'STATE_DB_FILE', str(tmp_path / 'state.db'))
+    monkeypatch.setattr(copier, 'COPY_RATIO', 1.0)
+    monkeypatch.setattr(copier, 'SYNC_PERP_ORDERS', True)
+    monkeypatch.setattr(copier, 'RECONCILE_WORKERS', 1)
+    logging.disable(logging.WARNING)
+    db.init_state_db()
+
+
+def test_filled_order_not_replaced_after_unrelated_change(tmp_path, monkeypatch):
+    setup_env(tmp_path, monkeypatch)
+
+    exchange = RecordingExchange()
+    bot = build_copier(exchange)
+    order_a = Order('ETH', 'B', 2000.0, 1.0, 1)
+    order_b = Order('BTC', 'A', 90000.0, 0.1, 2)
+
+    # 1. 首次同步: 两个目标挂单都被跟上
+    bot.sync_open_orders(AccountState(orders=[order_a, order_b]), AccountState())
+    assert len(exchange.placed) == 2
+    cloid_a = bot.order_links.get(target_order_key(order_a))['cloid']
+
+    # 2. 我跟 A 的挂单成交，目标 A 仍挂着；目标新增一个无关挂单 C
+    order_c = Order('SOL', 'B', 150.0, 2.0, 3)
+    mine = AccountState(orders=my_open_orders(bot, exchange, filled_cloids={cloid_a}))
+    bot.sync_open_orders(AccountState(orders=[order_a, order_b, order_c]), mine)
+
+    # 只补上 C，A 不再重挂
+    assert sorted(p[0] for p in exchange.placed) == ['BTC', 'ETH', 'SOL']
+    assert bot.order_links.is_consumed(target_order_key(order_a))
+
+    # 3. 重启后标记仍在，再次变化也不会补挂 A
+    bot.order_links = OrderLinkBook(MY_ADDRESS, TARGET_ADDRESS)
+    mine = AccountState(orders=my_open_orders(bot, exchange, filled_cloids={cloid_a}))
+    bot.sync_open_orders(AccountState(orders=[order_a, order_c]), mine)
+    assert sorted(p[0] for p in exchange.placed) == ['BTC', 'ETH', 'SOL']
+
+    # 4. 目标撤掉 A 之后标记清除
+    mine = AccountState(orders=my_open_orders(bot, exchange, filled_cloids={cloid_a}))
+    bot.sync_open_orders(AccountState(orders=[order_c]), mine)
+    assert not bot.order_links.is_consumed(target_order_key(order_a))
+    bot.reconcile_pool.shutdown()
+
+
+def test_modify_subtracts_my_partial_fills(tmp_path, monkeypatch):
+    setup_env(tmp_path, monkeypatch)
+    exchange = RecordingExchange()
+    bot = build_copier(exchange)
+    target_cloid = '0x' + '1' * 32  # 目标自带 cloid，改价后映射标识不变
+
+    bot.sync_open_orders(AccountState(orders=[Order('ETH', 'B', 2000.0, 1.0, 1, target_cloid)]), AccountState())
+    link = bot.order_links.get(f"c:{target_cloid}")
+
+    # 我的挂单成交 0.4 后目标改价: 只改剩余的 0.6
+    mine = Order('ETH', 'B', 2000.0, 0.6, link['my_oid'], link['cloid'], orig_sz=1.0)
+    bot.sync_open_orders(AccountState(orders=[Order('ETH', 'B', 2010.0, 1.0, 2, target_cloid)]),
+                         AccountState(orders=[mine]))
+    assert exchange.modified[-1] == (link['cloid'], 0.6, 2010.0)
+
+    # 改单后的新订单再成交 0.1，目标再次改价: 累计成交 0.5，只剩 0.5
+    link = bot.order_links.get(f"c:{target_cloid}")
+    mine = Order('ETH', 'B', 2010.0, 0.5, link['my_oid'], link['cloid'], orig_sz=0.6)
+    bot.sync_open_orders(AccountState(orders=[Order('ETH', 'B', 2020.0, 1.0, 3, target_cloid)]),
+                         AccountState(orders=[mine]))
+    assert exchange.modified[-1] == (link['cloid'], 0.5, 2020.0)
+    bot.reconcile_pool.shutdown()
+
+
+def test_relink_does_not_swap_same_side_orders(tmp_path, monkeypatch):
+    setup_env(tmp_path, monkeypatch)
+    exchange = RecordingExchange()
+    bot = build_copier(exchange)
+    order_a = Order('ETH', 'B', 2000.0, 1.0, 1)
+    order_b = Order('ETH', 'B', 1990.0, 2.0, 2)
+    bot.sync_open_orders(AccountState(orders=[order_a, order_b]), AccountState())
+    cloid_a = bot.order_links.get(target_order_key(order_a))['cloid']
+    cloid_b = bot.order_links.get(target_order_key(order_b))['cloid']
+
+    # 目标改单 (oid 变化): A 改价不改量，B 改量不改价。A 的新价格离 B 更近，但不能因此接到 B 上
+    new_a = Order('ETH', 'B', 1989.0, 1.0, 11)
+    new_b = Order('ETH', 'B', 1990.0, 3.0, 12)
+    bot.sync_open_orders(AccountState(orders=[new_a, new_b]), AccountState(orders=my_open_orders(bot, exchange)))
+    assert bot.order_links.get(target_order_key(new_a))['cloid'] == cloid_a
+    assert bot.order_links.get(target_order_key(new_b))['cloid'] == cloid_b
+    assert sorted((sz, px) for _, sz, px in exchange.modified) == [(1.0, 1989.0), (3.0, 1990.0)]
+    bot.reconcile_pool.shutdown()
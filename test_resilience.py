@@ -0,0 +1,168 @@
+"""容错层 (ResilientInfo / CircuitBreaker / Backoff) 的故障注入测试
+
+在本地启动 fault_server，注入 5xx、延迟和超时，验证熔断打开/半开恢复、对冲请求和退避上限。
+
+    python -m pytest -q test_resilience.py
+"""
+import time
+import asyncio
+
+import pytest
+from hyperliquid.info import Info
+from hyperliquid.utils.error import ServerError
+
+import resilience
+from async_client import AsyncHTTPEngine, AsyncInfo
+from fault_server import FaultInjectingServer
+from resilience import Backoff, CircuitBreaker, CircuitOpenError, ResilientInfo, retry_with_backoff
+
+MIDS = {'ETH': '3000.0', 'BTC': '90000.0'}
+META = {'universe': [{'name': 'ETH', 'szDecimals': 4}, {'name': 'BTC', 'szDecimals': 5}]}
+SPOT_META = {'universe': [], 'tokens': []}
+
+
+class StallNthServer(FaultInjectingServer):
+    """只让第 stall_on 个请求卡顿 (模拟偶发的慢请求)，其余请求正常返回"""
+
+    def __init__(self, stall_on, **kwargs):
+        super().__init__(**kwargs)
+        self.stall_on = stall_on
+
+    def _decide(self):
+        delay, fail = super()._decide()
+        return (self.stall_seconds if self.requests == self.stall_on else delay), fail
+
+
+@pytest.fixture
+def server():
+    srv = FaultInjectingServer(responses={'allMids': MIDS}, stall_seconds=2.0, seed=7).start()
+    yield srv
+    srv.stop()
+
+
+def make_info(url, **kwargs):
+    return ResilientInfo(Info(url, skip_ws=True, meta=META, spot_meta=SPOT_META), **kwargs)
+
+
+def test_breaker_opens_on_5xx_and_closes_after_probe(server):
+    server.error_rate = 1.0
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.3)
+    info = make_info(server.url, timeout=2.0, min_hedge_delay=1.0, breaker=breaker)
+
+    for _ in range(2):
+        with pytest.raises(ServerError):
+            info.all_mids()
+    assert breaker.state == CircuitBreaker.OPEN
+
+    # 熔断期间快速失败，请求不再发到服务端
+    sent = server.requests
+    with pytest.raises(CircuitOpenError):
+        info.all_mids()
+    assert server.requests == sent
+    assert info.stats['fast_fails'] == 1
+
+    # 半开探测失败: 重新打开
+    time.sleep(0.35)
+    with pytest.raises(ServerError):
+        info.all_mids()
+    assert breaker.state == CircuitBreaker.OPEN
+
+    # 服务恢复后探测成功: 关闭
+    server.error_rate = 0.0
+    time.sleep(0.35)
+    assert info.all_mids() == MIDS
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.failures == 0
+
+
+def test_half_open_allows_single_probe():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.0)
+    breaker.record_failure()
+    assert breaker.allow()
+    assert not breaker.allow()  # 探测请求未返回前其余请求快速失败
+    breaker.record_success()
+    assert breaker.allow() and breaker.allow()
+
+
+def test_hedge_fires_on_slow_request():
+    with StallNthServer(21, responses={'allMids': MIDS}, latency=0.01, stall_seconds=2.0) as srv:
+        info = make_info(srv.url, timeout=5.0, min_hedge_delay=0.1)
+        # 先积累 20 个耗时样本，对冲延迟取 p95 (不足 min_hedge_delay 时取下限)
+        for _ in range(20):
+            info.all_mids()
+        assert info.stats['hedged'] == 0
+
+        start = time.monotonic()
+        assert info.all_mids() == MIDS
+        elapsed = time.monotonic() - start
+
+    # 主请求卡住 2s，超过对冲延迟后发出的第二个请求先返回
+    assert elapsed < 1.0
+    assert info.stats['hedged'] == 1
+    assert info.stats['hedge_wins'] == 1
+    assert srv.requests == 22
+
+
+def test_timeout_counts_as_failure(server):
+    server.stall_rate = 1.0
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60.0)
+    info = make_info(server.url, timeout=0.4, min_hedge_delay=0.1, breaker=breaker)
+
+    start = time.monotonic()
+    with pytest.raises(TimeoutError):
+        info.all_mids()
+    # 总超时兜底: 主请求和对冲请求都卡住时按 timeout 返回，不等服务端
+    assert time.monotonic() - start < 1.0
+    assert info.stats['hedged'] == 1
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        info.all_mids()
+
+
+def test_backoff_is_bounded():
+    backoff = Backoff(base=0.5, cap=2.0)
+    delays = [backoff.next() for _ in range(50)]
+    for n, delay in enumerate(delays):
+        assert 0 <= delay <= min(2.0, 0.5 * 2 ** n)
+    backoff.reset()
+    assert backoff.next() <= 0.5
+
+
+def test_retry_with_backoff_against_failing_server(server, monkeypatch):
+    server.error_rate = 1.0
+    sleeps = []
+    monkeypatch.setattr(resilience.time, 'sleep', sleeps.append)
+    info = make_info(server.url, timeout=2.0, min_hedge_delay=1.0, breaker=CircuitBreaker(failure_threshold=100))
+
+    errors = []
+    with pytest.raises(ServerError):
+        retry_with_backoff(info.all_mids, retries=4, base=0.5, cap=1.0, on_error=lambda i, e: errors.append(i))
+    assert server.requests == 4
+    assert errors == [0, 1, 2]
+    assert len(sleeps) == 3 and all(0 <= s <= 1.0 for s in sleeps)
+
+    # 服务恢复后重试成功
+    server.error_rate = 0.0
+    assert retry_with_backoff(info.all_mids, retries=4) == MIDS
+
+
+def test_async_info_shares_breaker_with_sync_path(server):
+    server.error_rate = 1.0
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60.0)
+    sync_info = make_info(server.url, timeout=2.0, min_hedge_delay=1.0, breaker=breaker)
+
+    async def fail_twice():
+        engine = AsyncHTTPEngine(server.url, timeout=2.0)
+        try:
+            async_info = AsyncInfo(engine, breaker=breaker)
+            for _ in range(2):
+                with pytest.raises(ServerError):
+                    await async_info.all_mids()
+        finally:
+            await engine.close()
+
+    # 异步路径连续失败打开熔断后，同步路径也快速失败
+    asyncio.run(fail_twice())
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        sync_info.all_mids()
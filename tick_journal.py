@@ -0,0 +1,112 @@
+import os
+import json
+import time
+
+
+def _apply(state, event):
+    """将一条日志事件应用到状态上 (回放与实时写入共用)"""
+    etype = event['type']
+    data = event.get('data')
+    if etype == 'baseline':
+        state['baseline'] = data
+    elif etype == 'order_keys':
+        state['order_keys'] = data
+    elif etype == 'positions':
+        positions = state.setdefault('positions', {})
+        for coin, pos in data.items():
+            if pos is None:
+                positions.pop(coin, None)
+            else:
+                positions[coin] = pos
+    elif etype == 'decision':
+        state['last_decision'] = data
+    state['last_ts'] = event.get('ts')
+    state['seq'] = event.get('seq', state.get('seq', 0))
+
+
+class TickJournal:
+    """跟单状态的追加式日志 (event sourcing)
+
+    每个影响状态的决策 (基准初始化、挂单同步、持仓快照、调仓决策) 追加一行 JSON 到
+    <path>，每 snapshot_every 条事件压缩为一个快照 <path>.snapshot 并清空日志。
+    启动时读取快照并回放日志即可恢复 '仅同步下单' 模式的基准、挂单指纹和持仓快照。
+    """
+
+    def __init__(self, path, snapshot_every=500):
+        self.path = path
+        self.snapshot_path = path + '.snapshot'
+        self.snapshot_every = snapshot_every
+        self.state = {}
+        self.events_since_snapshot = 0
+        self._fh = None
+
+    def load(self):
+        """读取快照并回放日志，返回恢复出的状态 (无记录时为空字典)"""
+        state = {}
+        if os.path.exists(self.snapshot_path):
+            try:
+                with open(self.snapshot_path, 'r') as f:
+                    state = json.load(f)
+            except (OSError, ValueError):
+                state = {}
+
+        count = 0
+        if os.path.exists(self.path):
+            good_bytes = 0
+            truncated = False
+            with open(self.path, 'rb') as f:
+                for line in f:
+                    try:
+                        event = json.loads(line)
+                    except ValueError:
+                        truncated = True  # 崩溃时最后一行可能写了一半
+                        break
+                    _apply(state, event)
+                    good_bytes += len(line)
+                    count += 1
+            if truncated:
+                # 截掉写了一半的尾行，保证后续追加的事件可以被正常回放
+                with open(self.path, 'r+b') as f:
+                    f.truncate(good_bytes)
+
+        self.state = state
+        self.events_since_snapshot = count
+        return state
+
+    def append(self, event_type, data):
+        """追加一条事件并更新内存状态"""
+        event = {
+            'seq': self.state.get('seq', 0) + 1,
+            'ts': int(time.time() * 1000),
+            'type': event_type,
+            'data': data
+        }
+        _apply(self.state, event)
+
+        if self._fh is None:
+            self._fh = open(self.path, 'a')
+        self._fh.write(json.dumps(event, separators=(',', ':')) + '\n')
+        self._fh.flush()
+
+        self.events_since_snapshot += 1
+        if self.events_since_snapshot >= self.snapshot_every:
+            self.compact()
+
+    def compact(self):
+        """写入快照 (原子替换) 后清空日志"""
+        tmp = self.snapshot_path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.state, f, separators=(',', ':'))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.snapshot_path)
+
+        if self._fh is not None:
+            self._fh.close()
+        self._fh = open(self.path, 'w')
+        self.events_since_snapshot = 0
+
+    def close(self):
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None